@@ -0,0 +1,55 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SECTION_MARKER = "<<<SECTION {index}>>>"
+SECTION_RE = re.compile(r'^[ \t]*<<<SECTION (\d+)>>>[ \t]*$', re.M)
+
+
+def can_pack(text: str) -> bool:
+    """文本本身含有分隔标记时不能参与打包"""
+    return '<<<SECTION' not in text
+
+
+def pack_sections(texts: Sequence[str]) -> str:
+    """用编号分隔标记把多个片段拼接为一次请求的正文"""
+    return "\n\n".join(
+        SECTION_MARKER.format(index=i + 1) + "\n" + text.strip('\n')
+        for i, text in enumerate(texts)
+    )
+
+
+def unpack_sections(output: str, count: int) -> Optional[List[str]]:
+    """
+    按分隔标记拆回各片段的译文
+
+    标记缺失、重复、乱序或数量不符时返回 None，由调用方回退到逐个请求。
+    """
+    markers = list(SECTION_RE.finditer(output))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+
+    sections = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(output)
+        section = output[marker.end():end].strip('\n')
+        if not section.strip():
+            return None
+        sections.append(section)
+    return sections
+
+
+def bin_pack(sizes: Dict[int, int], budget: int) -> List[List[int]]:
+    """
+    首次适应递减装箱：把 {编号: 大小} 装入容量为 budget 的箱子
+
+    超过容量的单项独占一个箱子，返回每个箱子中的编号。
+    """
+    bins: List[Tuple[int, List[int]]] = []
+    for item, size in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+        for index, (used, members) in enumerate(bins):
+            if used + size <= budget:
+                bins[index] = (used + size, members + [item])
+                break
+        else:
+            bins.append((size, [item]))
+    return [members for _, members in bins]
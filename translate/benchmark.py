@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+端到端吞吐量基准测试
+
+对同一批源文件按不同的并发数分别完整运行一次 batch_translate_async，默认请求发往进程内启动的
+mock_server（不产生 API 费用），报告文件吞吐量、请求延迟分位数（取得并发名额到读完响应，不含排队）、重试次数和总耗时。
+每次运行使用全新的翻译记忆和输出目录，结果之间互不影响。
+
+    python translate/benchmark.py --concurrency 5 10 20 --latency 0.8 --rate-429 0.02 --output bench.json
+    python translate/benchmark.py --baseline bench.json   # 吞吐量或 p95 延迟劣化超过容差时返回非零退出码
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from full_translate import AsyncMarkdownTranslator
+from mock_server import add_server_arguments, server_from_args
+
+logger = logging.getLogger(__name__)
+
+
+async def run_once(source_dir: str, base_url: str, concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """以指定并发数完整翻译一遍源目录，返回本次运行的指标"""
+    with tempfile.TemporaryDirectory(prefix='translate-bench-') as work_dir:
+        translator = AsyncMarkdownTranslator(
+            args.api_key, concurrency,
+            memory_path=str(Path(work_dir) / 'memory.sqlite3'),
+            stream=not args.no_stream,
+            base_url=base_url
+        )
+        started = time.monotonic()
+        try:
+            stats = await translator.batch_translate_async(
+                source_dir, str(Path(work_dir) / 'out'),
+                max_retries=args.max_retries,
+                manifest_path=None
+            )
+        finally:
+            translator.close()
+        makespan = time.monotonic() - started
+
+    report = translator.metrics.report()
+    http = report['latency']['http']
+    return {
+        'concurrency': concurrency,
+        'files': stats['success'] + stats['failed'],
+        'succeeded': stats['success'],
+        'failed': stats['failed'],
+        'makespan': makespan,
+        'files_per_second': stats['success'] / makespan if makespan > 0 else 0.0,
+        'requests': report['totals']['requests'],
+        'request_errors': report['totals']['failed_requests'],
+        'retries': stats['retries'],
+        'throttled': translator.limiter.throttled,
+        'p50': http['p50'],
+        'p95': http['p95'],
+        'p99': http['p99'],
+        'queue_wait_p95': report['latency']['queue_wait']['p95'],
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    runner = None
+    base_url = args.base_url
+    if not base_url:
+        runner, base_url = await server_from_args(args).start()
+    try:
+        results = []
+        for concurrency in args.concurrency:
+            for _ in range(args.repeat):
+                results.append(await run_once(args.source_dir, base_url, concurrency, args))
+        return results
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    def ms(value: Optional[float]) -> str:
+        return '-' if value is None else f"{value * 1000:.0f}"
+
+    header = f"{'并发':>4} {'文件':>5} {'失败':>4} {'文件/秒':>8} {'总耗时(s)':>9} {'请求':>5} " \
+             f"{'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'重试':>4} {'限流':>4}"
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r['concurrency']:>4} {r['files']:>5} {r['failed']:>4} {r['files_per_second']:>8.2f} "
+            f"{r['makespan']:>9.2f} {r['requests']:>5} {ms(r['p50']):>8} {ms(r['p95']):>8} {ms(r['p99']):>8} "
+            f"{r['retries']:>4} {r['throttled']:>4}"
+        )
+    return "\n".join(lines)
+
+
+def compare_with_baseline(results: List[Dict[str, Any]],
+                          baseline: List[Dict[str, Any]],
+                          tolerance: float) -> List[str]:
+    """按并发数与基线比较，返回吞吐量下降或 p95 延迟上升超过容差的描述"""
+    def by_concurrency(rows: List[Dict[str, Any]]) -> Dict[int, Tuple[float, Optional[float]]]:
+        grouped: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            grouped.setdefault(row['concurrency'], []).append(row)
+        return {
+            concurrency: (
+                statistics.median(row['files_per_second'] for row in group),
+                statistics.median(row['p95'] for row in group) if all(row['p95'] is not None for row in group) else None
+            )
+            for concurrency, group in grouped.items()
+        }
+
+    regressions = []
+    current, previous = by_concurrency(results), by_concurrency(baseline)
+    for concurrency, (throughput, p95) in sorted(current.items()):
+        if concurrency not in previous:
+            continue
+        base_throughput, base_p95 = previous[concurrency]
+        if throughput < base_throughput * (1 - tolerance):
+            regressions.append(f"并发 {concurrency}：吞吐量 {throughput:.2f} 文件/秒，基线 {base_throughput:.2f}")
+        if p95 is not None and base_p95 is not None and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"并发 {concurrency}：p95 延迟 {p95 * 1000:.0f}ms，基线 {base_p95 * 1000:.0f}ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='翻译流程端到端吞吐量基准测试')
+    parser.add_argument("--source-dir", default="trees", help="源目录路径 (默认：trees)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 10, 20],
+                        help="依次测试的最大并发数 (默认：5 10 20)")
+    parser.add_argument("--repeat", type=int, default=1, help="每个并发数重复运行的次数 (默认：1)")
+    parser.add_argument("--max-retries", type=int, default=5, help="单个文件的最大重试次数 (默认：5)")
+    parser.add_argument("--no-stream", action="store_true", help="关闭流式响应")
+    parser.add_argument("--base-url", default=None,
+                        help="使用已运行的补全服务而不是进程内的 mock 服务（注意会产生真实调用）")
+    parser.add_argument("--api-key", default="benchmark", help="发送给补全服务的 API 密钥 (默认：benchmark)")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件，可作为之后的基线")
+    parser.add_argument("--baseline", default=None, help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="允许的吞吐量下降或 p95 延迟上升比例 (默认：0.15)")
+    parser.add_argument("--verbose", action="store_true", help="输出翻译过程日志")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    # 翻译流程的逐文件日志和注入故障引起的报错会淹没结果表格
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    logger.setLevel(logging.INFO)
+
+    results = asyncio.run(run_benchmark(args))
+    print(format_table(results))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, ensure_ascii=False)
+        logger.info(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.error(f"性能回退 - {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info("与基线相比没有超出容差的回退")
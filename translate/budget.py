@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每百万 token 的价格（元），(输入, 输出)；未列出的模型需要通过命令行指定
+PRICES: Dict[str, Tuple[float, float]] = {
+    "Pro/deepseek-ai/DeepSeek-R1": (4.0, 16.0),
+    "deepseek-ai/DeepSeek-R1": (4.0, 16.0),
+    "Pro/deepseek-ai/DeepSeek-V3": (2.0, 8.0),
+    "deepseek-ai/DeepSeek-V3": (2.0, 8.0),
+}
+
+# DeepSeek 公布的经验比例：1 个中文字符约 0.6 个 token，1 个英文字符约 0.3 个 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 译文 token 数与待翻译正文 token 数之比（中文译为英文后 token 数略多）
+OUTPUT_RATIO = 1.3
+
+_CJK_RE = re.compile('[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+class TokenEstimator:
+    """本地 token 数估算，提供 tokenizer.json 且安装了 tokenizers 时使用真实分词器"""
+
+    def __init__(self, tokenizer_path: Optional[str] = None, output_ratio: float = OUTPUT_RATIO):
+        self.output_ratio = output_ratio  # 推理模型的思考过程也计入输出，可按实际账单调大
+        self.tokenizer = None
+        if tokenizer_path:
+            # 可选依赖，只在指定分词器时加载；未安装时按字符类别估算
+            try:
+                from tokenizers import Tokenizer
+            except ImportError:
+                logger.warning("未安装 tokenizers，按字符类别估算 token 数")
+            else:
+                self.tokenizer = Tokenizer.from_file(tokenizer_path)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        cjk = len(_CJK_RE.findall(text))
+        return int(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR) + 1
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        """消息列表的输入 token 数，每条消息另加少量格式开销"""
+        return sum(self.count(message["content"]) + 4 for message in messages)
+
+    def estimate_output(self, text: str, max_tokens: Optional[int] = None) -> int:
+        """翻译 text 预计输出的 token 数，不超过 max_tokens"""
+        estimate = int(self.count(text) * self.output_ratio)
+        return min(estimate, max_tokens) if max_tokens else estimate
+
+
+def prices_for(model: str,
+               input_price: Optional[float] = None,
+               output_price: Optional[float] = None) -> Optional[Tuple[float, float]]:
+    """模型的 (输入, 输出) 单价，命令行指定的价格优先；未知模型且未指定时返回 None"""
+    known = PRICES.get(model)
+    if known is None and (input_price is None or output_price is None):
+        return None
+    return (
+        input_price if input_price is not None else known[0],
+        output_price if output_price is not None else known[1]
+    )
+
+
+def cost_of(prompt_tokens: int, completion_tokens: int, prices: Tuple[float, float]) -> float:
+    input_price, output_price = prices
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+class TokenBudget:
+    """
+    整次运行共享的 token 与费用上限
+
+    每个请求发出前按估算值预留额度。已用量加上本次估算超出上限时预算即告用尽，之后不再放行
+    任何请求；只是加上在途请求的预留额度才超出时，等待在途请求结算后再判断。已发出的请求照常
+    完成，按 API 返回的 usage 记账（没有 usage 时按估算值）。
+    """
+
+    def __init__(self,
+                 prices: Tuple[float, float],
+                 max_tokens: Optional[int] = None,
+                 max_cost: Optional[float] = None):
+        self.prices = prices
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+        self.exhausted = False
+        self._cond = asyncio.Condition()
+
+    @property
+    def spent_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def spent_cost(self) -> float:
+        return cost_of(self.prompt_tokens, self.completion_tokens, self.prices)
+
+    def _over(self, tokens: int, cost: float) -> bool:
+        return (self.max_tokens is not None and tokens > self.max_tokens) or \
+            (self.max_cost is not None and cost > self.max_cost)
+
+    async def admit(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        """为一次请求预留额度，预算已用尽时返回 False"""
+        tokens = prompt_tokens + completion_tokens
+        cost = cost_of(prompt_tokens, completion_tokens, self.prices)
+        async with self._cond:
+            while not self.exhausted:
+                if self._over(self.spent_tokens + tokens, self.spent_cost + cost):
+                    self.exhausted = True
+                    self._cond.notify_all()
+                    logger.warning(
+                        f"预算已用尽（已用 {self.spent_tokens} token，约 {self.spent_cost:.4f} 元），停止发出新请求"
+                    )
+                    break
+                if not self._over(self.spent_tokens + self.reserved_tokens + tokens,
+                                  self.spent_cost + self.reserved_cost + cost):
+                    self.reserved_tokens += tokens
+                    self.reserved_cost += cost
+                    return True
+                await self._cond.wait()
+            return False
+
+    def charge(self, prompt_tokens: int, completion_tokens: int):
+        """记入一次成功请求的实际用量"""
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    async def release(self, prompt_tokens: int, completion_tokens: int):
+        """请求结束（无论成功与否）后释放 admit 预留的额度"""
+        async with self._cond:
+            self.reserved_tokens -= prompt_tokens + completion_tokens
+            self.reserved_cost -= cost_of(prompt_tokens, completion_tokens, self.prices)
+            self._cond.notify_all()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时间超过上限，不再等待服务恢复"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    按近期错误率熔断的断路器
+
+    最近 window 秒内至少有 min_requests 个结果且失败比例达到 failure_threshold 时打开：
+    新请求暂停放行 open_seconds 秒，之后进入半开状态，只放行一个探测请求。探测成功即关闭，
+    失败则重新打开并把暂停时间加倍（不超过 max_open_seconds）。从打开起累计超过 give_up_after
+    秒仍未恢复时，等待中的和之后的请求直接抛出 CircuitOpenError。failure_threshold 为 0 时不熔断。
+    """
+
+    def __init__(self,
+                 failure_threshold: float = 0.5,
+                 min_requests: int = 10,
+                 window: float = 30.0,
+                 open_seconds: float = 10.0,
+                 max_open_seconds: float = 120.0,
+                 give_up_after: Optional[float] = 600.0):
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.give_up_after = give_up_after  # None 表示一直等待恢复
+        self.state = 'closed'
+        self.trips = 0
+        self.gave_up = False
+        self._results: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0  # 本次故障第一次打开的时间
+        self._retry_at = 0.0
+        self._pause = open_seconds
+        self._probing = False
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """
+        等待熔断器放行一次请求
+
+        探测请求结束时唤醒其他等待者，由它们根据探测结果继续发送或等待；探测请求没有记录
+        结果就结束时（例如被取消）让出探测名额。
+        """
+        probe = await self._admit()
+        try:
+            yield
+        finally:
+            if probe:
+                async with self._cond:
+                    self._probing = False
+                    self._cond.notify_all()
+
+    async def _admit(self) -> bool:
+        """返回本次放行的是否为半开状态下的探测请求"""
+        while True:
+            async with self._cond:
+                if self.state == 'closed':
+                    return False
+                now = time.monotonic()
+                deadline = self._opened_at + self.give_up_after if self.give_up_after is not None else None
+                if self.gave_up or (deadline is not None and now >= deadline):
+                    if not self.gave_up:
+                        self.gave_up = True
+                        self._cond.notify_all()
+                        logger.error(f"服务已持续不可用 {now - self._opened_at:.0f} 秒，放弃等待")
+                    raise CircuitOpenError("服务持续不可用")
+                if self.state == 'open' and now >= self._retry_at:
+                    self.state = 'half_open'
+                    logger.info("熔断器半开，发送探测请求")
+                if self.state == 'half_open':
+                    if not self._probing:
+                        self._probing = True
+                        return True
+                    await self._cond.wait()
+                    continue
+                # 打开期间在锁外等待到重试时间或放弃时间
+                wake_at = min(self._retry_at, deadline) if deadline is not None else self._retry_at
+            await asyncio.sleep(wake_at - now)
+
+    def record_success(self):
+        """服务正常响应（包括 429 限流，说明服务可达）"""
+        self._record(True)
+        # 打开前已发出的请求返回成功不代表服务恢复，只认半开状态下的结果
+        if self.state == 'half_open':
+            logger.info("探测请求成功，服务恢复，熔断器关闭")
+            self.state = 'closed'
+            self._pause = self.open_seconds
+            self._results.clear()
+
+    def record_failure(self):
+        """5xx、超时、连接失败等说明服务异常的结果"""
+        self._record(False)
+        now = time.monotonic()
+        if self.state == 'half_open':
+            self._pause = min(self.max_open_seconds, self._pause * 2)
+            self._open(now)
+            logger.warning(f"探测请求失败，熔断器重新打开 {self._pause:.0f} 秒")
+        elif self.state == 'closed':
+            failures = sum(1 for _, ok in self._results if not ok)
+            if self.failure_threshold > 0 and len(self._results) >= self.min_requests and \
+                    failures / len(self._results) >= self.failure_threshold:
+                self.trips += 1
+                self._opened_at = now
+                self._open(now)
+                logger.warning(
+                    f"最近 {len(self._results)} 个请求中 {failures} 个失败，熔断器打开，暂停放行 {self._pause:.0f} 秒"
+                )
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._results.append((now, ok))
+        while self._results and self._results[0][0] < now - self.window:
+            self._results.popleft()
+
+    def _open(self, now: float):
+        self.state = 'open'
+        self._retry_at = now + self._pause
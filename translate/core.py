@@ -0,0 +1,118 @@
+"""
+翻译脚本共用的轻量核心
+
+只依赖标准库和本目录中不引入第三方库的模块。命令行解析、无改动检测、用量预估等不发请求的路径
+只需要这里的内容；aiohttp、GitPython、PyGithub 等较重的依赖推迟到第一次真正使用时才加载。
+"""
+import importlib.util
+import logging
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Optional, Tuple
+
+from glossary import Glossary, load_glossary
+from languages import DEFAULT_LANGUAGE, get_language, language_path, target_dir_for
+from prompt import prompt_hash
+from translation_memory import DEFAULT_DB_PATH, TranslationMemory
+
+logger = logging.getLogger(__name__)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    返回延迟加载的模块，第一次访问其属性时才真正执行导入
+
+    用于在多个函数中使用、但只在发送请求等少数路径上才需要的重量级依赖；配合
+    from __future__ import annotations，类型注解中引用模块属性不会触发加载。
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def open_memory(model: str,
+                language: str = DEFAULT_LANGUAGE,
+                memory_path: Optional[str] = None) -> Tuple[Glossary, TranslationMemory]:
+    """
+    加载目标语言的术语表并打开对应的翻译记忆
+
+    每个目标语言使用单独的翻译记忆数据库，英文沿用原有路径。
+    """
+    glossary = load_glossary(language)
+    memory = TranslationMemory(
+        model, prompt_hash(get_language(language)), glossary,
+        memory_path or language_path(DEFAULT_DB_PATH, language)
+    )
+    return glossary, memory
+
+
+def source_relative_path(input_file: Path, source_dir: str = "trees") -> Path:
+    """日志中显示的文件路径：优先相对源目录，其次相对当前目录，都不行时用绝对路径"""
+    try:
+        return input_file.resolve().relative_to(Path(source_dir).resolve())
+    except ValueError:
+        try:
+            return input_file.relative_to(Path.cwd())
+        except ValueError:
+            return input_file.absolute()
+
+
+def resolve_target_dir(target_dir: Optional[str], language: str, multiple: bool = False) -> str:
+    """
+    目标语言的输出目录
+
+    未指定时为 tree_<语言代码>；指定的路径可以包含 {lang} 占位符，翻译到多个语言时必须包含。
+    """
+    if not target_dir:
+        return target_dir_for(language)
+    if '{lang}' in target_dir:
+        return target_dir.replace('{lang}', language)
+    if multiple:
+        raise ValueError(f"翻译到多个语言时目标目录需要包含 {{lang}} 占位符：{target_dir}")
+    return target_dir
+
+
+def generate_directory_tree(path: Path, max_depth: int = 3) -> str:
+    """生成目录结构文本表示"""
+    try:
+        lines = []
+        prefix = ""
+
+        for entry in path.iterdir():
+            if entry.is_dir():
+                lines.append(f"{prefix}├── {entry.name}/")
+                walk_directory(entry, lines, prefix + "│   ", max_depth-1)
+            else:
+                lines.append(f"{prefix}├── {entry.name}")
+
+        return "\n".join(lines)
+    except Exception as e:
+        logger.warning(f"生成目录树失败：{str(e)}")
+        return "无法生成目录树"
+
+
+def walk_directory(path: Path, lines: list, prefix: str, depth: int):
+    """递归遍历目录"""
+    if depth <= 0:
+        return
+
+    entries = list(path.iterdir())
+    for i, entry in enumerate(entries):
+        is_last = i == len(entries) - 1
+        new_prefix = prefix + ("    " if is_last else "│   ")
+
+        if entry.is_dir():
+            lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}/")
+            if depth > 1:
+                walk_directory(entry, lines, new_prefix, depth-1)
+        else:
+            lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}")
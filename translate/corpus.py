@@ -0,0 +1,48 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from segmenter import DEFAULT_CHUNK_SIZE, segment_markdown
+
+
+class SourceCorpus:
+    """
+    源文件内容、哈希与切分结果的缓存
+
+    同时翻译到多个目标语言时所有翻译器共享一个实例，每个源文件只读取、哈希和切分一次。
+    按文件大小和修改时间判断缓存是否仍然有效。
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._files: Dict[str, Tuple[Tuple[int, int], str, str]] = {}  # {路径: ((大小, 修改时间), 内容, 哈希)}
+        self._segments: Dict[str, List[str]] = {}  # {内容: 切分结果}
+
+    def _load(self, path: Path) -> Tuple[str, str]:
+        key = str(path)
+        stat = path.stat()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._files.get(key)
+        if cached is None or cached[0] != signature:
+            if cached is not None:
+                self._segments.pop(cached[1], None)
+            data = path.read_bytes()
+            cached = (signature, data.decode('utf-8'), hashlib.sha256(data).hexdigest())
+            self._files[key] = cached
+        return cached[1], cached[2]
+
+    def read(self, path: Path) -> str:
+        """文件内容（保留原有换行符）"""
+        return self._load(Path(path))[0]
+
+    def hash(self, path: Path) -> str:
+        """文件内容的 sha256，与 translation_index.content_hash 相同"""
+        return self._load(Path(path))[1]
+
+    def segments(self, content: str) -> List[str]:
+        """按 Markdown 结构切分内容，相同内容只切分一次"""
+        segments = self._segments.get(content)
+        if segments is None:
+            segments = segment_markdown(content, self.chunk_size)
+            self._segments[content] = segments
+        return segments
@@ -1,15 +1,38 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import sys
 import argparse
+import subprocess
 import logging
 import time
-import asyncio
-import aiohttp
 import json
-import hashlib
+import asyncio
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from typing import Any, Dict, List, Optional, Set, Tuple
+from core import generate_directory_tree, lazy_import, open_memory, resolve_target_dir, source_relative_path
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from hedging import HedgePolicy
+from budget import OUTPUT_RATIO, TokenBudget, TokenEstimator, cost_of, prices_for
+from batching import bin_pack, can_pack, pack_sections, unpack_sections
+from masking import PlaceholderError, protect, protect_like, restore, has_prose
+from rate_limiter import AdaptiveLimiter, parse_retry_after
+from prompt import BASE_URL, MODEL, build_batch_messages, build_continue_messages, build_edit_messages, build_messages
+from streaming import ProgressiveWriter, read_stream_completion
+from segmenter import DEFAULT_CHUNK_SIZE, split_padding, restore_padding
+from corpus import SourceCorpus
+from languages import DEFAULT_LANGUAGE, LANGUAGES, get_language, language_path
+from incremental import plan_incremental
+from manifest import DEFAULT_MANIFEST_PATH, RunManifest
+from metrics import RunMetrics
+from translation_index import TranslationIndex
+from translation_memory import DEFAULT_FUZZY_THRESHOLD, normalize_segment
+from validation import validate_translation
+from work_queue import WorkQueue
+
+# 只有真正发送请求时才加载 aiohttp，--help、--estimate 等路径不必为它付出启动时间
+aiohttp = lazy_import("aiohttp")
 
 # 配置日志
 logging.basicConfig(
@@ -22,151 +45,745 @@ class AsyncTranslationError(Exception):
     """异步翻译失败的自定义异常"""
     pass
 
+class ThrottledError(AsyncTranslationError):
+    """请求被限流、服务端过载或响应停滞"""
+    pass
+
+class BudgetExceededError(AsyncTranslationError):
+    """本次运行的 token 或费用预算已用尽，不再发出新请求"""
+    pass
+
+class ServiceUnavailableError(AsyncTranslationError):
+    """熔断器长时间未能恢复，快速失败"""
+    pass
+
+def create_session() -> aiohttp.ClientSession:
+    """翻译使用的 HTTP 会话，连接数由限流器控制"""
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=0)  # 无限制连接
+    timeout = aiohttp.ClientTimeout(total=600)  # 10 分钟超时
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
 class AsyncMarkdownTranslator:
-    def __init__(self, api_key: str, max_concurrent: int = 20):
+    def __init__(self,
+                 api_key: str,
+                 max_concurrent: int = 20,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 memory_path: Optional[str] = None,
+                 model: str = MODEL,
+                 batch_size: int = DEFAULT_CHUNK_SIZE,
+                 small_file_size: int = 2048,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 stream: bool = True,
+                 stall_timeout: float = 60,
+                 fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD,
+                 base_url: str = BASE_URL,
+                 metrics: Optional[RunMetrics] = None,
+                 budget: Optional[TokenBudget] = None,
+                 estimator: Optional[TokenEstimator] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedging: Optional[HedgePolicy] = None,
+                 validation_retries: int = 2,
+                 max_continuations: int = 3,
+                 language: str = DEFAULT_LANGUAGE,
+                 limiter: Optional[AdaptiveLimiter] = None,
+                 corpus: Optional[SourceCorpus] = None):
         self.api_key = api_key
-        self.base_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.base_url = base_url
         self.max_concurrent = max_concurrent
-        self.semaphore = asyncio.Semaphore(max_concurrent)
-        self.glossary = self.load_glossary()
-        self.cache_dir = Path(".translation_cache")
-        self.cache_dir.mkdir(exist_ok=True)
-
-    @retry(
-        stop=stop_after_attempt(10), 
-        wait=wait_exponential(multiplier=2, min=5, max=120),
-        reraise=True,
-        retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError, TimeoutError))
-    )
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size  # 打包请求的字符上限，0 表示不打包
+        self.small_file_size = small_file_size  # 参与打包的文件字节数上限
+        self.stream = stream
+        self.stall_timeout = stall_timeout  # 流式响应两次数据之间的最长间隔
+        self.fuzzy_threshold = fuzzy_threshold  # 模糊匹配旧译文的相似度下限，0 表示关闭
+        self.validation_retries = validation_retries  # 片段译文校验失败后单独重新请求的次数
+        self.max_continuations = max_continuations  # 输出被 max_tokens 截断后续写的次数上限
+        # 多个目标语言的翻译器可共享同一个限流器和源文件缓存
+        self.limiter = limiter or AdaptiveLimiter(
+            max_concurrent,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute
+        )
+        self.corpus = corpus or SourceCorpus(chunk_size)
+        self.metrics = metrics or RunMetrics()
+        self.budget = budget  # None 表示不限制用量
+        self.estimator = estimator or TokenEstimator()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedging = hedging  # None 表示不发送对冲请求
+        self.model = model
+        self.language = get_language(language)
+        self.glossary, self.memory = open_memory(self.model, language, memory_path)
+        self._inflight: Dict[str, asyncio.Future] = {}  # 正在翻译的规范化原文，相同内容共享同一请求
+
+    async def _request_async(self,
+                             session: aiohttp.ClientSession,
+                             messages: List[Dict[str, str]],
+                             max_tokens: int = 4000,
+                             kind: str = 'translate',
+                             label: str = '') -> Tuple[str, Optional[str]]:
+        """
+        发送一次补全请求，返回 (模型输出, finish_reason)；kind 和 label 只用于指标
+
+        启用对冲时，请求超过本次运行学到的首字节耗时百分位仍未响应，就在对冲预算内再发一个
+        相同的请求，取先成功的结果并取消另一个。
+        """
+        delay = self.hedging.delay() if self.hedging else None
+        if delay is None:
+            return await self._attempt_async(session, messages, max_tokens, kind, label)
+        
+        self.hedging.requests += 1
+        acquired, responded = asyncio.Event(), asyncio.Event()
+        primary = asyncio.ensure_future(
+            self._attempt_async(session, messages, max_tokens, kind, label, acquired, responded)
+        )
+        tasks = [primary]
+        try:
+            # 从取得并发名额开始计时，排队等待不触发对冲
+            for event, timeout in ((acquired, None), (responded, delay)):
+                waiter = asyncio.ensure_future(event.wait())
+                done, _ = await asyncio.wait({primary, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if primary in done:
+                    return await primary
+            if responded.is_set() or not self.hedging.take():
+                return await primary
+            
+            self.metrics.count('hedges')
+            logger.info(f"{label} 超过 {delay:.1f} 秒未响应，发送对冲请求")
+            hedge = asyncio.ensure_future(self._attempt_async(session, messages, max_tokens, kind, f"{label}（对冲）"))
+            tasks.append(hedge)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.count('hedge_wins')
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    # 被取消的一方可能仍以异常结束，读取异常以免出现未处理警告
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _attempt_async(self,
+                             session: aiohttp.ClientSession,
+                             messages: List[Dict[str, str]],
+                             max_tokens: int,
+                             kind: str,
+                             label: str,
+                             acquired: Optional[asyncio.Event] = None,
+                             responded: Optional[asyncio.Event] = None) -> Tuple[str, Optional[str]]:
+        """经熔断器放行后发送一次请求；熔断器长时间打开时快速失败"""
+        try:
+            async with self.breaker.guard():
+                return await self._send_async(session, messages, max_tokens, kind, label, acquired, responded)
+        except CircuitOpenError as e:
+            raise ServiceUnavailableError(str(e))
+
+    async def _send_async(self,
+                          session: aiohttp.ClientSession,
+                          messages: List[Dict[str, str]],
+                          max_tokens: int,
+                          kind: str,
+                          label: str,
+                          acquired: Optional[asyncio.Event] = None,
+                          responded: Optional[asyncio.Event] = None) -> Tuple[str, Optional[str]]:
+        """在自适应限流器控制下发送一次补全请求，取得并发名额时设置 acquired，收到响应头时设置 responded"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": max_tokens,
+            "top_p": 0.9,
+            "stream": self.stream
+        }
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        # 流式响应由停滞检测代替总超时；sock_read 让迟迟不返回响应头的请求同样按停滞处理
+        timeout = (
+            aiohttp.ClientTimeout(total=None, connect=30, sock_read=self.stall_timeout) if self.stream
+            else aiohttp.ClientTimeout(total=180, connect=30)
+        )
+        prompt_estimate = self.estimator.count_messages(messages)
+        completion_estimate = self.estimator.estimate_output(messages[-1]["content"], max_tokens)
+        admitted = False
+
+        with self.metrics.track_request(kind, label, len(body)) as sample:
+            # 令牌桶按输入估算加输出上限计数
+            async with self.limiter.slot(prompt_estimate + max_tokens):
+                sample.acquired = time.monotonic()
+                if acquired:
+                    acquired.set()
+                try:
+                    # 在取得并发名额时才预留预算，预留额度只对应真正在途的请求
+                    if self.budget:
+                        if not await self.budget.admit(prompt_estimate, completion_estimate):
+                            self.metrics.count('budget_refused')
+                            raise BudgetExceededError("本次运行的预算已用尽")
+                        admitted = True
+                    async with session.post(
+                        self.base_url,
+                        data=body,
+                        headers={
+                            "Authorization": f"Bearer {self.api_key}",
+                            "Content-Type": "application/json"
+                        },
+                        timeout=timeout
+                    ) as response:
+                        sample.first_byte = time.monotonic()
+                        sample.status = response.status
+                        if responded:
+                            responded.set()
+                        if response.status == 429 or response.status >= 500:
+                            # 429 说明服务可达，只由限流器处理
+                            if response.status >= 500:
+                                self.breaker.record_failure()
+                            else:
+                                self.breaker.record_success()
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            self.limiter.record_throttle(retry_after, pause=response.status == 429)
+                            self.metrics.count('throttled')
+                            logger.warning(
+                                f"请求被限流（HTTP {response.status}），并发窗口降为 {int(self.limiter.limit)}"
+                                + (f"，{retry_after:.1f} 秒后重试" if retry_after is not None else "")
+                            )
+                            raise ThrottledError(f"HTTP {response.status}")
+                        response.raise_for_status()
+                        # 不支持流式的服务会忽略 stream 参数直接返回 JSON
+                        if self.stream and response.content_type == 'text/event-stream':
+                            content, finish_reason, usage = await read_stream_completion(response, self.stall_timeout)
+                        else:
+                            result = await response.json()
+                            content = result['choices'][0]['message']['content']
+                            finish_reason = result['choices'][0].get('finish_reason')
+                            usage = result.get('usage')
+                        sample.finished = time.monotonic()
+                        sample.bytes_in = response.content.total_bytes
+                        sample.finish_reason = finish_reason
+                        sample.set_usage(usage)
+                        if self.budget:
+                            self.budget.charge(
+                                sample.prompt_tokens if sample.prompt_tokens is not None else prompt_estimate,
+                                sample.completion_tokens if sample.completion_tokens is not None
+                                else self.estimator.count(content)
+                            )
+                        self.limiter.record_success()
+                        self.breaker.record_success()
+                        if self.hedging:
+                            self.hedging.observe(sample.first_byte - sample.acquired)
+                        return content, finish_reason
+                        
+                except AsyncTranslationError:
+                    raise
+                except asyncio.TimeoutError as e:
+                    # 包括 aiohttp.ServerTimeoutError（同时也是 ClientError）：等待响应头或数据超时
+                    self.breaker.record_failure()
+                    self.limiter.record_throttle(pause=False)
+                    self.metrics.count('timeouts')
+                    logger.error(f"请求超时：{str(e)}")
+                    raise ThrottledError(f"请求超时： {str(e)}")
+                except aiohttp.ClientError as e:
+                    self.breaker.record_failure()
+                    logger.error(f"API 请求失败：{str(e)}")
+                    raise AsyncTranslationError(f"翻译服务不可用： {str(e)}")
+                except Exception as e:
+                    logger.error(f"意外错误：{str(e)}", exc_info=True)
+                    raise AsyncTranslationError(f"处理翻译失败： {str(e)}")
+                finally:
+                    sample.released = time.monotonic()
+                    if admitted:
+                        await self.budget.release(prompt_estimate, completion_estimate)
+
+    async def _complete_async(self,
+                              session: aiohttp.ClientSession,
+                              messages: List[Dict[str, str]],
+                              max_tokens: int = 4000,
+                              kind: str = 'translate',
+                              label: str = '') -> Tuple[str, Optional[str]]:
+        """
+        发送补全请求，输出被 max_tokens 截断时附上已输出的部分请求模型续写
+
+        返回拼接后的输出和最后一次的 finish_reason；续写次数用完仍被截断时 finish_reason 为 length。
+        """
+        content, finish_reason = await self._request_async(session, messages, max_tokens, kind, label)
+        for _ in range(self.max_continuations):
+            if finish_reason != 'length':
+                break
+            self.metrics.count('continuations')
+            logger.info(f"{label} 输出达到 max_tokens 上限（已输出 {len(content)} 字符），请求续写")
+            more, finish_reason = await self._request_async(
+                session, build_continue_messages(messages, content), max_tokens, kind, f"{label}（续写）"
+            )
+            content += more
+        return content, finish_reason
+
+    def _check(self, source: str, output: str, spans: List[str], finish_reason: Optional[str]) -> Tuple[str, List[str]]:
+        """还原占位符并校验译文结构，返回 (还原后的译文, 问题列表)"""
+        if finish_reason == 'length':
+            return output, ["输出被截断"]
+        try:
+            restored = restore(output, spans)
+        except PlaceholderError as e:
+            return output, [str(e)]
+        return restored, validate_translation(source, restored)
+
     async def translate_text_async(self, session: aiohttp.ClientSession, text: str, file_path: str) -> str:
-        """异步翻译文本"""
-        # 检查缓存
-        cache_key = hashlib.md5(text.encode('utf-8')).hexdigest()
-        cache_file = self.cache_dir / f"{cache_key}.cache"
+        """
+        异步翻译文本（不查询翻译记忆，由文档级流程统一处理）
+
+        占位符或结构校验失败时只重新请求这一段，仍失败则抛出异常，不会写入翻译记忆。
+        """
+        # 用占位符保护代码、公式、链接等内容，只把需要翻译的正文发送给模型
+        masked_text, spans = protect(text)
+        if not has_prose(masked_text):
+            return text
+        
+        messages = build_messages(masked_text, self.glossary.render(masked_text), file_path, self.language)
+        for attempt in range(self.validation_retries + 1):
+            output, finish_reason = await self._complete_async(session, messages, label=file_path)
+            translated, problems = self._check(text, output, spans, finish_reason)
+            if not problems:
+                return translated
+            self.metrics.count('validation_failures')
+            if attempt < self.validation_retries:
+                logger.warning(f"{file_path} 译文校验失败，重新请求该片段：{'；'.join(problems)}")
+        logger.error(f"{file_path} 译文校验失败：{'；'.join(problems)}")
+        raise AsyncTranslationError(f"译文校验失败：{'；'.join(problems)}")
+
+    async def translate_edit_async(self,
+                                   session: aiohttp.ClientSession,
+                                   text: str,
+                                   old_source: str,
+                                   old_translation: str,
+                                   file_path: str) -> Optional[str]:
+        """
+        请求模型按原文改动修改近似片段的已有译文
+
+        续写后仍被截断或校验失败时返回 None，由调用方改为完整翻译。
+        """
+        masked_text, spans = protect(text)
+        if not has_prose(masked_text):
+            return text
         
-        if cache_file.exists():
+        # 旧原文和旧译文中与新原文相同的代码、链接等替换为同一组占位符
+        messages = build_edit_messages(
+            protect_like(old_source, masked_text, spans),
+            masked_text,
+            protect_like(old_translation, masked_text, spans),
+            self.glossary.render(masked_text),
+            file_path,
+            self.language
+        )
+        # 输出与旧译文长度相近，按旧译文估算输出上限
+        edited, finish_reason = await self._complete_async(
+            session, messages, max_tokens=min(4000, len(old_translation) // 2 + 256), kind='edit', label=file_path
+        )
+        edited, problems = self._check(text, edited, spans, finish_reason)
+        if problems:
+            self.metrics.count('validation_failures')
+            logger.warning(f"{file_path} 修改旧译文失败，改为完整翻译：{'；'.join(problems)}")
+            return None
+        return edited
+
+    async def translate_batch_async(self, session: aiohttp.ClientSession, texts: List[str], label: str) -> List[str]:
+        """
+        把多个互相独立的文本打包为一次请求翻译，按原顺序返回译文
+
+        校验失败的片段单独重新请求；分隔标记解析失败时抛出 AsyncTranslationError，
+        调用方应回退到逐个请求。
+        """
+        results: List[Optional[str]] = []
+        masked: List[Tuple[int, str, List[str]]] = []
+        for index, text in enumerate(texts):
+            masked_text, spans = protect(text)
+            if has_prose(masked_text):
+                masked.append((index, masked_text, spans))
+                results.append(None)
+            else:
+                results.append(text)
+        if not masked:
+            return results
+        
+        packed = pack_sections([masked_text for _, masked_text, _ in masked])
+        output, _ = await self._complete_async(
+            session, build_batch_messages(packed, len(masked), self.glossary.render(packed), label, self.language),
+            kind='batch', label=label
+        )
+        sections = unpack_sections(output, len(masked))
+        if sections is None:
+            raise AsyncTranslationError(f"{label} 分隔标记解析失败")
+        
+        broken = []
+        for (index, _, spans), section in zip(masked, sections):
+            results[index], problems = self._check(texts[index], section, spans, None)
+            if problems:
+                self.metrics.count('validation_failures')
+                logger.warning(f"{label} 第 {index + 1} 段译文校验失败，单独重新请求：{'；'.join(problems)}")
+                broken.append(index)
+        if broken:
+            retried = await asyncio.gather(*[self.translate_text_async(session, texts[i], label) for i in broken])
+            for index, translated in zip(broken, retried):
+                results[index] = translated
+        return results
+
+    async def _translate_chunk_async(self, session: aiohttp.ClientSession, chunk: str, label: str) -> str:
+        """翻译单个片段，保留片段首尾空白"""
+        lead, body, trail = split_padding(chunk)
+        if not body.strip():
+            return chunk
+        
+        # 相同内容正在翻译时等待已有请求，不重复请求
+        key = normalize_segment(body)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.metrics.count('inflight_shared')
+        else:
+            future = asyncio.ensure_future(self.translate_text_async(session, body, label))
+            self._inflight[key] = future
+            
+            def forget(done: asyncio.Future):
+                self._inflight.pop(key, None)
+                if not done.cancelled():
+                    done.exception()  # 所有等待方都已取消时避免未读取异常的警告
+            
+            future.add_done_callback(forget)
+        # shield：一个等待方被取消不影响共享同一请求的其他等待方
+        translated = await asyncio.shield(future)
+        return restore_padding(lead, translated, trail)
+
+    async def _gather_async(self, coroutines: List) -> List[str]:
+        """
+        并发执行翻译协程，按原顺序返回结果
+
+        某个片段失败时不取消其余片段：它们的请求已经发出并计费，等全部结束后各自写入翻译记忆，
+        再抛出第一个异常，整个文件交由上层重试时只需请求失败的片段。
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        except BaseException:
+            # 调用方被取消（如运行停止）时才取消其余片段
+            for task in tasks:
+                task.cancel()
+            raise
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def translate_document_async(self,
+                                       session: aiohttp.ClientSession,
+                                       content: str,
+                                       file_path: str,
+                                       writer: Optional[ProgressiveWriter] = None) -> str:
+        """
+        按 Markdown 结构切分文档并翻译
+
+        先用一次批量查询从翻译记忆取回已翻译的片段，未命中的相邻片段合并为请求并发翻译。
+        每个请求完成后立即按段落写回翻译记忆；提供 writer 时已连续完成的片段按顺序写出。
+        """
+        segments = self.corpus.segments(content)
+        pieces, groups = self.memory.plan_document(segments, self.chunk_size)
+        
+        pending = sum(len(group) for group in groups)
+        self.metrics.count('memory_hits', len(segments) - pending)
+        self.metrics.count('memory_misses', pending)
+        if pending < len(segments):
+            logger.info(f"{file_path} 翻译记忆命中 {len(segments) - pending}/{len(segments)} 个片段")
+        fuzzy: Dict[int, Tuple[str, str]] = {}
+        if self.fuzzy_threshold:
+            groups, fuzzy = self.memory.plan_fuzzy(segments, groups, self.chunk_size, self.fuzzy_threshold)
+            if fuzzy:
+                self.metrics.count('fuzzy_matches', len(fuzzy))
+                logger.info(f"{file_path} {len(fuzzy)} 个片段与已翻译片段相近，改为修改旧译文")
+        if writer:
+            writer.expect(len(segments))
+            for index, piece in enumerate(pieces):
+                if piece is not None:
+                    writer.put(index, piece)
+        if not groups and not fuzzy:
+            return ''.join(pieces)
+        if len(groups) > 1:
+            logger.info(f"{file_path} 切分为 {len(groups)} 个请求并发翻译")
+        
+        async def translate_group(n: int, group: List[int]):
+            group_segments = [segments[i] for i in group]
+            translated = await self._translate_chunk_async(
+                session, ''.join(group_segments),
+                file_path if len(groups) == 1 else f"{file_path}（片段 {n + 1}/{len(groups)}）"
+            )
+            self.memory.record_chunk(group_segments, translated)
+            pieces[group[0]] = translated
+            for i in group[1:]:
+                pieces[i] = ''
+            if writer:
+                for i in group:
+                    writer.put(i, pieces[i])
+            if len(groups) > 1:
+                logger.info(f"{file_path} 片段 {n + 1}/{len(groups)} 完成")
+        
+        async def edit_segment(i: int):
+            old_source, old_translation = fuzzy[i]
+            lead, body, trail = split_padding(segments[i])
+            edited = await self.translate_edit_async(session, body, old_source, old_translation, file_path)
+            if edited is None:
+                self.metrics.count('fuzzy_fallbacks')
+                translated = await self._translate_chunk_async(session, segments[i], file_path)
+            else:
+                translated = restore_padding(lead, edited, trail)
+            self.memory.record_chunk([segments[i]], translated)
+            pieces[i] = translated
+            if writer:
+                writer.put(i, translated)
+        
+        await self._gather_async(
+            [translate_group(n, group) for n, group in enumerate(groups)]
+            + [edit_segment(i) for i in fuzzy]
+        )
+        return ''.join(pieces)
+
+    async def translate_incremental_async(self,
+                                          session: aiohttp.ClientSession,
+                                          old_source: str,
+                                          content: str,
+                                          old_translation: str,
+                                          file_path: str) -> Optional[str]:
+        """只翻译相对旧原文有改动的段落，其余段落复用已有译文；无法对齐时返回 None"""
+        plan = plan_incremental(old_source, content, old_translation)
+        if plan is None:
+            return None
+        
+        pieces = [text for _, text in plan]
+        pending = [i for i, (needs_translation, _) in enumerate(plan) if needs_translation]
+        
+        logger.info(f"{file_path} 增量翻译：{len(pending)} 处改动，复用 {len(pieces) - len(pending)} 个段落")
+        results = await self._gather_async([
+            self.translate_document_async(session, pieces[index], f"{file_path}（改动 {n + 1}/{len(pending)}）")
+            for n, index in enumerate(pending)
+        ])
+        for index, translated in zip(pending, results):
+            pieces[index] = translated
+        return ''.join(pieces)
+
+    async def _translate_packed_async(self,
+                                      session: aiohttp.ClientSession,
+                                      items: List[List[str]],
+                                      label: str) -> int:
+        """翻译一个打包请求中的各组片段并写入翻译记忆，失败时保留给逐文档流程，返回写入的组数"""
+        chunks = [''.join(segments) for segments in items]
+        paddings = [split_padding(chunk) for chunk in chunks]
+        try:
+            translations = await self.translate_batch_async(session, [body for _, body, _ in paddings], label)
+        except AsyncTranslationError as e:
+            self.metrics.count('batch_fallbacks')
+            logger.warning(f"打包翻译失败，回退为逐文档请求：{str(e)}")
+            return 0
+        
+        for segments, (lead, _, trail), translated in zip(items, paddings, translations):
+            self.memory.record_chunk(segments, restore_padding(lead, translated, trail))
+        return len(items)
+
+    async def prefill_shared_segments_async(self, session: aiohttp.ClientSession, files: List[Path]) -> int:
+        """
+        找出在整个语料中出现两次及以上、且未命中翻译记忆的片段，每种只翻译一次并写入翻译记忆
+
+        之后的逐文件翻译直接命中这些结果。返回预先翻译的片段数。
+        """
+        occurrences: Dict[str, List[str]] = {}  # {规范化原文: 各处出现的片段}
+        for path in files:
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except Exception as e:
-                logger.warning(f"Cache read failed: {str(e)}")
+                content = self.corpus.read(path)
+            except OSError:
+                continue
+            segments = self.corpus.segments(content)
+            pieces, _ = self.memory.plan_document(segments, self.chunk_size)
+            for segment, piece in zip(segments, pieces):
+                if piece is None:
+                    body = split_padding(segment)[1]
+                    occurrences.setdefault(normalize_segment(body), []).append(segment)
         
-        payload = {
-            "model": "Pro/deepseek-ai/DeepSeek-R1",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "你是一位专业的计算机科学和技术文档翻译专家，专门负责将中文技术文档翻译成英文。\n\n"
-                        "翻译任务：将以下中文 Markdown 文档翻译成英文，保持技术准确性和可读性。\n\n"
-                        "核心要求：\n"
-                        "1. 目标语言：英语（美式英语）\n"
-                        "2. 完全保留所有 Markdown 格式、语法和结构\n"
-                        "3. 绝不修改任何代码块（```...```）或行内代码（`...`）\n"
-                        "4. 保留所有 URL、链接和 YAML front matter 完全不变\n"
-                        "5. 保持技术术语的一致性和准确性\n"
-                        "6. 使用专业、清晰、自然的英文表达\n"
-                        "7. 保持原文的逻辑结构和段落组织\n"
-                        "8. 对于数学公式、算法描述等保持精确性\n"
-                        "9. 请检查翻译内容的头尾是否符合原文件的格式\n\n"
-                        f"技术术语表（必须遵循）：\n{self.format_glossary()}\n\n"
-                        f"当前翻译文件：{file_path}\n\n"
-                        "请直接输出翻译后的英文内容，不要添加任何解释或注释。"
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": f"请将以下中文技术文档翻译成英文：\n\n{text}"
-                }
-            ],
-            "temperature": 0.2,
-            "max_tokens": 4000,
-            "top_p": 0.9
+        # 没有正文的片段（分隔线、纯代码等）本身不会发出请求，预先写入记忆只会把所在文档切成更多请求
+        occurrences = {
+            key: found for key, found in occurrences.items()
+            if len(found) > 1 and has_prose(protect(key)[0])
         }
+        
+        shared = [found[0] for found in occurrences.values()]
+        if not shared:
+            return 0
+        self.metrics.count('shared_segments', len(shared))
+        logger.info(
+            f"跨文档去重：{len(shared)} 个重复片段（共 {sum(len(found) for found in occurrences.values())} 处）各只翻译一次"
+        )
+        
+        # 可以打包的片段装箱打包，其余单独请求
+        singles = list(range(len(shared)))
+        packed: List[List[int]] = []
+        if self.batch_size > 0:
+            bins = bin_pack(
+                {i: len(segment) for i, segment in enumerate(shared) if can_pack(segment)}, self.batch_size
+            )
+            packed = [members for members in bins if len(members) > 1]
+            in_bins = {i for members in packed for i in members}
+            singles = [i for i in singles if i not in in_bins]
+        
+        async def translate_single(i: int):
+            translated = await self._translate_chunk_async(session, shared[i], f"重复片段 {i + 1}/{len(shared)}")
+            self.memory.record_chunk([shared[i]], translated)
+        
+        results = await asyncio.gather(
+            *[
+                self._translate_packed_async(session, [[shared[i]] for i in members], f"重复片段打包 {n + 1}/{len(packed)}")
+                for n, members in enumerate(packed)
+            ],
+            *[translate_single(i) for i in singles],
+            return_exceptions=True
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            logger.warning(f"{failed} 个重复片段请求失败，将在逐文件翻译时重试")
+        return len(shared)
 
-        async with self.semaphore:  # 限制并发数
+    async def prefill_small_files_async(self, session: aiohttp.ClientSession, files: List[Path]) -> int:
+        """
+        把小文件中未命中翻译记忆的片段装箱打包为少量请求，结果写入翻译记忆
+
+        之后的逐文件翻译会直接命中这些结果；打包失败的片段仍按原流程逐文档请求。
+        返回打包请求数。
+        """
+        items: Dict[str, List[str]] = {}  # 按原文去重
+        for path in files:
             try:
-                async with session.post(
-                    self.base_url,
-                    json=payload,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    timeout=aiohttp.ClientTimeout(total=180, connect=30)
-                ) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-                    translated_text = result['choices'][0]['message']['content']
-                    
-                    # 保存缓存
-                    try:
-                        with open(cache_file, 'w', encoding='utf-8') as f:
-                            f.write(translated_text)
-                    except Exception as e:
-                        logger.warning(f"Cache write failed: {str(e)}")
-                    
-                    return translated_text
-                    
-            except aiohttp.ClientError as e:
-                logger.error(f"API 请求失败：{str(e)}")
-                raise AsyncTranslationError(f"翻译服务不可用： {str(e)}")
-            except asyncio.TimeoutError as e:
-                logger.error(f"请求超时：{str(e)}")
-                raise AsyncTranslationError(f"请求超时： {str(e)}")
-            except Exception as e:
-                logger.error(f"意外错误：{str(e)}", exc_info=True)
-                raise AsyncTranslationError(f"处理翻译失败： {str(e)}")
-
-    def load_glossary(self) -> Dict[str, str]:
-        """加载技术术语表"""
-        glossary_paths = [
-            Path("translate/glossary.json"),
-            Path("./glossary.json")
-        ]
+                if path.stat().st_size > self.small_file_size:
+                    continue
+                content = self.corpus.read(path)
+            except OSError:
+                continue
+            segments = self.corpus.segments(content)
+            _, groups = self.memory.plan_document(segments, self.chunk_size)
+            if self.fuzzy_threshold:
+                # 有近似旧译文的片段留给逐文件翻译时修改旧译文
+                groups, _ = self.memory.plan_fuzzy(segments, groups, self.chunk_size, self.fuzzy_threshold)
+            for group in groups:
+                group_segments = [segments[i] for i in group]
+                chunk = ''.join(group_segments)
+                if can_pack(chunk):
+                    items.setdefault(chunk, group_segments)
         
-        for glossary_path in glossary_paths:
-            if glossary_path.exists():
-                try:
-                    with open(glossary_path, 'r', encoding='utf-8') as f:
-                        logger.info(f"Loaded glossary from {glossary_path}")
-                        return json.load(f)
-                except Exception as e:
-                    logger.warning(f"术语表加载失败 ({glossary_path}): {str(e)}")
+        if len(items) < 2:
+            return 0
+        
+        item_list = list(items.values())
+        bins = [
+            members for members in bin_pack(
+                {i: len(''.join(segments)) for i, segments in enumerate(item_list)}, self.batch_size
+            )
+            if len(members) > 1
+        ]
+        if not bins:
+            return 0
         
-        logger.warning("No glossary found, using empty glossary")
-        return {}
+        logger.info(f"将 {sum(len(b) for b in bins)} 个小文件片段打包为 {len(bins)} 个请求")
+        packed = await asyncio.gather(*[
+            self._translate_packed_async(session, [item_list[i] for i in members], f"打包请求 {n + 1}/{len(bins)}")
+            for n, members in enumerate(bins)
+        ])
+        logger.info(f"打包翻译完成：{sum(packed)} 个片段写入翻译记忆")
+        return len(bins)
 
-    def format_glossary(self) -> str:
-        """为 API 提示格式化术语表"""
-        if not self.glossary:
-            return "（无特定术语表，请使用标准计算机科学术语）"
+    def estimate(self,
+                 input_dir: str,
+                 output_dir: str,
+                 specific_files: Optional[List[str]] = None,
+                 skip_unchanged: bool = False,
+                 prices: Optional[Tuple[float, float]] = None) -> Dict[str, Any]:
+        """
+        不调用 API，估算翻译这些文件需要的输入和输出 token 数
+
+        与实际运行使用同样的切分和翻译记忆查询（不更新命中统计），命中的片段不计入；
+        全语料中相同的请求原文只计一次，近似片段按修改旧译文的短提示词计算。
+        不考虑小文件打包（只会减少重复的系统提示词），因此结果略偏保守。
+        """
+        input_path = Path(input_dir)
+        if specific_files:
+            rel_paths = [Path(f).as_posix() for f in specific_files]
+        else:
+            rel_paths = sorted(p.relative_to(input_path).as_posix() for p in input_path.rglob('*.md'))
+        if skip_unchanged:
+            rel_paths = TranslationIndex(input_dir, output_dir, source_hash=self.corpus.hash).stale_files(rel_paths)
         
-        formatted_terms = []
-        for chinese, english in self.glossary.items():
-            formatted_terms.append(f"  • {chinese} → {english}")
+        estimate = {
+            'files': len(rel_paths), 'segments': 0, 'cached_segments': 0, 'fuzzy_segments': 0,
+            'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0
+        }
+        seen: Set[str] = set()
+        
+        def add(messages: List[Dict[str, str]], completion_tokens: int):
+            estimate['requests'] += 1
+            estimate['prompt_tokens'] += self.estimator.count_messages(messages)
+            estimate['completion_tokens'] += completion_tokens
+        
+        for rel_path in rel_paths:
+            try:
+                content = self.corpus.read(input_path / rel_path)
+            except OSError as e:
+                logger.warning(f"无法读取 {rel_path}：{str(e)}")
+                continue
+            segments = self.corpus.segments(content)
+            _, groups = self.memory.plan_document(segments, self.chunk_size, touch=False)
+            estimate['segments'] += len(segments)
+            estimate['cached_segments'] += len(segments) - sum(len(group) for group in groups)
+            fuzzy: Dict[int, Tuple[str, str]] = {}
+            if self.fuzzy_threshold:
+                groups, fuzzy = self.memory.plan_fuzzy(segments, groups, self.chunk_size, self.fuzzy_threshold)
+            estimate['fuzzy_segments'] += len(fuzzy)
+            
+            for group in groups:
+                body = split_padding(''.join(segments[i] for i in group))[1]
+                key = normalize_segment(body)
+                if key in seen:
+                    continue
+                seen.add(key)
+                masked_text, _ = protect(body)
+                if has_prose(masked_text):
+                    add(build_messages(masked_text, self.glossary.render(masked_text), rel_path, self.language),
+                        self.estimator.estimate_output(masked_text, 4000))
+            for i, (old_source, old_translation) in fuzzy.items():
+                masked_text, spans = protect(split_padding(segments[i])[1])
+                if has_prose(masked_text):
+                    add(build_edit_messages(protect_like(old_source, masked_text, spans), masked_text,
+                                            protect_like(old_translation, masked_text, spans),
+                                            self.glossary.render(masked_text), rel_path, self.language),
+                        self.estimator.count(old_translation))
         
-        return "术语对照表：\n" + "\n".join(formatted_terms)
+        if prices:
+            estimate['cost'] = cost_of(estimate['prompt_tokens'], estimate['completion_tokens'], prices)
+        return estimate
 
-    async def translate_file_async(self, session: aiohttp.ClientSession, input_path: str, output_path: str) -> Tuple[str, bool]:
-        """异步处理单个文件"""
+    def close(self):
+        """关闭翻译记忆"""
+        self.memory.close()
+
+    async def translate_file_async(self,
+                                   session: aiohttp.ClientSession,
+                                   input_path: str,
+                                   output_path: str,
+                                   old_source: Optional[str] = None,
+                                   source_dir: str = "trees") -> Tuple[str, bool]:
+        """异步处理单个文件，提供旧原文且已有译文时只重译改动段落"""
         rel_path = input_path  # 默认值
         
         try:
             input_file = Path(input_path)
-            # 获取相对路径
-            try:
-                source_path = Path.cwd() / "trees"
-                rel_path = input_file.relative_to(source_path)
-            except ValueError:
-                try:
-                    rel_path = input_file.relative_to(Path.cwd())
-                except ValueError:
-                    rel_path = input_file.absolute()
+            rel_path = source_relative_path(input_file, source_dir)
             
-            # 读取文件
-            with open(input_path, 'r', encoding='utf-8', newline='') as f:
-                content = f.read()
+            # 读取文件（多个目标语言共享同一份缓存）
+            content = self.corpus.read(input_file)
 
             if not content.strip():
                 logger.warning(f"跳过空文件：{rel_path}")
@@ -178,17 +795,34 @@ class AsyncMarkdownTranslator:
             
             logger.info(f"开始翻译：{rel_path}")
             
-            # 异步翻译
-            translated = await self.translate_text_async(session, content, str(rel_path))
+            translated = None
+            if old_source is not None and output_file.exists():
+                with open(output_file, 'r', encoding='utf-8', newline='') as f:
+                    old_translation = f.read()
+                translated = await self.translate_incremental_async(
+                    session, old_source, content, old_translation, str(rel_path)
+                )
+                if translated is None:
+                    logger.info(f"{rel_path} 段落无法与已有译文对齐，回退到整篇翻译")
             
-            # 原子写入
-            temp_path = output_file.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8', newline='') as f:
-                f.write(translated)
-            
-            temp_path.replace(output_file)
+            # 译文按顺序逐步写入临时文件，全部完成后原子替换
+            writer = ProgressiveWriter(output_file)
+            try:
+                if translated is None:
+                    # 异步翻译（大文件自动分片并发）
+                    await self.translate_document_async(session, content, str(rel_path), writer)
+                else:
+                    writer.expect(1)
+                    writer.put(0, translated)
+                writer.commit()
+            except BaseException:
+                writer.abort()
+                raise
             return (str(rel_path), True)
 
+        except BudgetExceededError:
+            logger.warning(f"预算已用尽，{rel_path} 未完成翻译")
+            return (str(rel_path), False)
         except AsyncTranslationError as e:
             logger.error(f"翻译失败 {rel_path}: {str(e)}", exc_info=True)
             return (str(rel_path), False)
@@ -196,14 +830,68 @@ class AsyncMarkdownTranslator:
             logger.error(f"处理 {rel_path} 失败：{str(e)}", exc_info=True)
             return (str(rel_path), False)
 
+    def order_jobs(self,
+                   tasks: List[Tuple[str, str]],
+                   input_path: Path,
+                   priority_files: Optional[Set[str]] = None) -> List[Tuple[str, str]]:
+        """
+        按预计耗时从长到短排列任务（最长任务优先），priority_files 中的文件排在最前
+
+        预计耗时按文件字节数乘以历史平均速率估算；该文件有历史耗时且更长时取历史值。
+        """
+        history = self.memory.job_history()
+        total_size = sum(size for size, _ in history.values())
+        rate = sum(seconds for _, seconds in history.values()) / total_size if total_size else 1.0
+        priority_files = priority_files or set()
+        
+        def sort_key(task: Tuple[str, str]) -> Tuple[bool, float]:
+            input_file = Path(task[0])
+            rel_path = input_file.relative_to(input_path).as_posix()
+            try:
+                size = input_file.stat().st_size
+            except OSError:
+                size = 0
+            cost = size * rate
+            if rel_path in history:
+                cost = max(cost, history[rel_path][1])
+            return (rel_path not in priority_files, -cost)
+        
+        return sorted(tasks, key=sort_key)
+
     async def batch_translate_async(self, 
                                   input_dir: str, 
                                   output_dir: str, 
                                   specific_files: Optional[List[str]] = None,
-                                  max_retries: int = 5) -> Dict[str, int]:
-        """异步批量翻译，支持失败重试"""
+                                  max_retries: int = 5,
+                                  previous_sources: Optional[Dict[str, str]] = None,
+                                  retry_budget: Optional[int] = None,
+                                  priority_files: Optional[Set[str]] = None,
+                                  manifest_path: Optional[str] = None,
+                                  resume: bool = False,
+                                  only_stale: bool = False,
+                                  skip_unchanged: bool = False,
+                                  session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
+        """
+        异步批量翻译，支持失败重试
+        
+        参数：
+            max_retries: 单个文件的最大重试次数
+            previous_sources: 可选的 {相对路径: 旧原文} 映射，命中的文件只重译改动段落
+            retry_budget: 本次运行所有文件共享的重试总次数，默认不额外限制
+            priority_files: 优先调度的文件（源目录相对路径），其余文件按预计耗时从长到短调度
+            manifest_path: 运行清单路径，每个文件完成后追加一条记录
+            resume: 跳过清单中已完成且大小、修改时间未变的文件（不读取文件内容）
+            only_stale: 跳过源文件哈希与清单记录一致且译文存在的文件
+            skip_unchanged: 跳过原文哈希与输出目录中翻译索引记录一致的文件
+            session: 共享的 HTTP 会话（多个目标语言共用连接池），默认新建
+        
+        返回：
+            包含成功/失败/重试计数的字典，以及 succeeded_files / failed_files
+            两个按源目录相对路径列出的逐文件结果
+        """
         input_path = Path(input_dir)
         output_path = Path(output_dir)
+        previous_sources = previous_sources or {}
         
         # 获取文件列表
         if specific_files:
@@ -214,6 +902,8 @@ class AsyncMarkdownTranslator:
         logger.info(f"找到 {len(md_files)} 个文件进行翻译")
         logger.info(f"最大并发数：{self.max_concurrent}")
         logger.info(f"最大重试次数：{max_retries}")
+        if retry_budget is not None:
+            logger.info(f"重试总预算：{retry_budget}")
         
         # 准备翻译任务
         translation_tasks = []
@@ -222,74 +912,152 @@ class AsyncMarkdownTranslator:
             output_file = output_path / rel_path
             translation_tasks.append((str(md_file), str(output_file)))
         
-        stats = {'success': 0, 'failed': 0, 'retries': 0}
-        failed_files = translation_tasks.copy()  # 初始所有文件都标记为需要处理
-        successful_files = []
+        stats = {'success': 0, 'failed': 0, 'retries': 0, 'skipped': 0, 'stopped': 0}
         
-        start_time = time.time()
+        # 输出目录中的原文→译文哈希索引，成功翻译的文件随时登记
+        index = TranslationIndex(input_dir, output_dir, source_hash=self.corpus.hash)
+        if skip_unchanged:
+            stale = set(index.stale_files(
+                Path(input_file).relative_to(input_path).as_posix() for input_file, _ in translation_tasks
+            ))
+            stats['skipped'] += len(translation_tasks) - len(stale)
+            translation_tasks = [
+                task for task in translation_tasks
+                if Path(task[0]).relative_to(input_path).as_posix() in stale
+            ]
+            logger.info(f"翻译索引显示 {len(stale)} 个文件需要翻译")
         
-        # 创建 HTTP 会话
-        connector = aiohttp.TCPConnector(limit=0, limit_per_host=0)  # 无限制连接
-        timeout = aiohttp.ClientTimeout(total=600)  # 10 分钟超时
+        manifest = RunManifest(manifest_path) if manifest_path else None
+        if manifest and (resume or only_stale):
+            remaining = []
+            for input_file, output_file in translation_tasks:
+                rel_path = Path(input_file).relative_to(input_path).as_posix()
+                if (resume and manifest.is_done(rel_path, Path(input_file), Path(output_file))) or \
+                        (only_stale and manifest.is_fresh(rel_path, Path(input_file), Path(output_file))):
+                    stats['skipped'] += 1
+                else:
+                    remaining.append((input_file, output_file))
+            translation_tasks = remaining
+            logger.info(f"根据运行清单跳过 {stats['skipped']} 个已完成的文件，剩余 {len(translation_tasks)} 个")
         
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            retry_count = 0
+        self.metrics.count('skipped_files', stats['skipped'])
+        self.metrics.info.update({
+            'model': self.model,
+            'base_url': self.base_url,
+            'max_concurrent': self.max_concurrent,
+            'stream': self.stream,
+            # 多个目标语言共享指标时累计各语言的文件数
+            'files': self.metrics.info.get('files', 0) + len(translation_tasks)
+        })
+        start_time = time.time()
+        
+        async with (nullcontext(session) if session else create_session()) as session:
+            # 增量翻译的文件只重译改动段落，不参与跨文档去重和整篇打包
+            full_files = [
+                Path(input_file) for input_file, _ in translation_tasks
+                if Path(input_file).relative_to(input_path).as_posix() not in previous_sources
+            ]
+            if len(full_files) > 1:
+                await self.prefill_shared_segments_async(session, full_files)
+            if self.batch_size > 0:
+                await self.prefill_small_files_async(session, full_files)
             
-            while failed_files and retry_count < max_retries:
-                if retry_count > 0:
-                    logger.info(f"第 {retry_count} 次重试，剩余 {len(failed_files)} 个失败文件")
-                    # 重试间隔
-                    await asyncio.sleep(5)
-                
-                current_batch = failed_files.copy()
-                failed_files.clear()
-                
-                # 创建当前批次的翻译任务
-                tasks = [
-                    self.translate_file_async(session, input_file, output_file)
-                    for input_file, output_file in current_batch
-                ]
-                
-                # 并发执行当前批次任务
-                logger.info(f"开始翻译 {len(tasks)} 个文件...")
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # 处理结果
-                for i, result in enumerate(results):
-                    input_file, output_file = current_batch[i]
-                    rel_path = Path(input_file).relative_to(input_path)
-                    
-                    if isinstance(result, Exception):
-                        logger.error(f"任务异常 {rel_path}：{str(result)}", exc_info=True)
-                        failed_files.append((input_file, output_file))
-                        stats['retries'] += 1
-                    else:
-                        rel_path_str, success = result
-                        if success:
-                            stats['success'] += 1
-                            successful_files.append((input_file, output_file))
-                            logger.info(f"✅ 翻译成功：{rel_path}")
-                        else:
-                            failed_files.append((input_file, output_file))
-                            stats['retries'] += 1
-                            logger.error(f"❌ 翻译失败：{rel_path}")
-                
-                retry_count += 1
-                
-                # 如果还有失败文件，输出进度
-                if failed_files:
-                    logger.warning(f"第 {retry_count} 轮完成，还有 {len(failed_files)} 个文件失败")
+            attempts: Dict[str, int] = {}
+            spent: Dict[str, float] = {}  # 各文件所有尝试的累计耗时
+            
+            async def handle(task: Tuple[str, str]) -> bool:
+                input_file, output_file = task
+                rel_path = Path(input_file).relative_to(input_path)
+                attempts[rel_path.as_posix()] = attempts.get(rel_path.as_posix(), 0) + 1
+                started = time.monotonic()
+                with self.metrics.span('translate_file', path=rel_path.as_posix(),
+                                       attempt=attempts[rel_path.as_posix()]):
+                    _, success = await self.translate_file_async(
+                        session, input_file, output_file, previous_sources.get(rel_path.as_posix()), input_dir
+                    )
+                elapsed = time.monotonic() - started
+                spent[rel_path.as_posix()] = spent.get(rel_path.as_posix(), 0.0) + elapsed
+                if success:
+                    self.metrics.record_file(
+                        rel_path.as_posix(), 'done', spent[rel_path.as_posix()], attempts[rel_path.as_posix()],
+                        self.language.code
+                    )
+                    self.memory.record_job(rel_path.as_posix(), Path(input_file).stat().st_size, elapsed)
+                    if manifest:
+                        manifest.record(rel_path.as_posix(), Path(input_file), Path(output_file), 'done', elapsed)
+                    index.update(rel_path.as_posix())
+                    logger.info(f"✅ 翻译成功：{rel_path}")
                 else:
-                    logger.info(f"所有文件翻译成功！")
-                    break
+                    logger.error(f"❌ 翻译失败：{rel_path}")
+                return success
+            
+            # 失败的文件单独退避后重新入队，已完成的片段已写入翻译记忆，重试只请求剩余片段
+            queue = WorkQueue(
+                handle,
+                workers=self.max_concurrent,
+                max_attempts=max_retries + 1,
+                retry_budget=retry_budget,
+                describe=lambda task: str(Path(task[0]).relative_to(input_path)),
+                stop_when=lambda: (self.budget is not None and self.budget.exhausted) or self.breaker.gave_up
+            )
+            logger.info(f"开始翻译 {len(translation_tasks)} 个文件...")
+            try:
+                successful_files, failed_files = await queue.run(
+                    self.order_jobs(translation_tasks, input_path, priority_files)
+                )
+                for input_file, _ in failed_files:
+                    rel_path = Path(input_file).relative_to(input_path).as_posix()
+                    self.metrics.record_file(
+                        rel_path, 'failed', spent.get(rel_path, 0.0), attempts.get(rel_path, 0), self.language.code
+                    )
+                if manifest:
+                    for input_file, output_file in failed_files:
+                        manifest.record(
+                            Path(input_file).relative_to(input_path).as_posix(),
+                            Path(input_file), None, 'failed', 0.0
+                        )
+                    manifest.compact()
+            finally:
+                index.save()
+                if manifest:
+                    manifest.close()
+            stats['success'] = len(successful_files)
+            stats['retries'] = queue.retries
+            stats['stopped'] = len(queue.stopped)
+            self.metrics.count('file_retries', queue.retries)
+            if not failed_files:
+                logger.info(f"所有文件翻译成功！")
         
         # 最终统计
         stats['failed'] = len(failed_files)
+        stats['succeeded_files'] = [
+            str(Path(input_file).relative_to(input_path)) for input_file, _ in successful_files
+        ]
+        stats['failed_files'] = [
+            str(Path(input_file).relative_to(input_path)) for input_file, _ in failed_files
+        ]
         elapsed_time = time.time() - start_time
         
         # 输出最终统计
         logger.info(f"翻译完成：✅ {stats['success']} 个成功，❌ {stats['failed']} 个失败")
         logger.info(f"总重试次数：{stats['retries']}")
+        logger.info(f"限流次数：{self.limiter.throttled}，最终并发窗口：{int(self.limiter.limit)}")
+        self.metrics.info['final_concurrency'] = int(self.limiter.limit)
+        totals = self.metrics.report()['totals']
+        logger.info(
+            f"请求数：{totals['requests']}，token：{totals['prompt_tokens']} 输入 / {totals['completion_tokens']} 输出"
+        )
+        if self.budget:
+            self.metrics.info['budget_spent_tokens'] = self.budget.spent_tokens
+            self.metrics.info['budget_spent_cost'] = round(self.budget.spent_cost, 4)
+            logger.info(f"预算用量：{self.budget.spent_tokens} token，约 {self.budget.spent_cost:.4f} 元")
+            if self.budget.exhausted and stats['stopped']:
+                logger.warning(f"预算用尽，{stats['stopped']} 个文件未翻译，可用 --resume 在追加预算后继续")
+        self.metrics.info['breaker_trips'] = self.breaker.trips
+        if self.breaker.gave_up:
+            logger.error(f"服务持续不可用，{stats['stopped']} 个文件未翻译，可在服务恢复后用 --resume 继续")
+        if self.hedging:
+            logger.info(f"对冲请求：{self.hedging.hedged} 个，其中 {self.metrics.counters['hedge_wins']} 个先于原请求返回")
         logger.info(f"总耗时：{elapsed_time:.2f} 秒")
         if elapsed_time > 0:
             logger.info(f"平均速度：{stats['success']/elapsed_time:.2f} 文件/秒")
@@ -303,92 +1071,286 @@ class AsyncMarkdownTranslator:
         
         return stats
 
-async def full_translate(source_dir: str, target_dir: str, api_key: str, max_concurrent: int = 20, max_retries: int = 5):
-    """异步全量翻译"""
+async def full_translate(source_dir: str, target_dir: Optional[str], api_key: str, max_concurrent: int = 20, max_retries: int = 5,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE, batch_size: int = DEFAULT_CHUNK_SIZE,
+                         requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                         stream: bool = True, stall_timeout: float = 60, retry_budget: Optional[int] = None,
+                         priority_files: Optional[Set[str]] = None, manifest_path: Optional[str] = DEFAULT_MANIFEST_PATH,
+                         resume: bool = False, only_stale: bool = False, skip_unchanged: bool = False,
+                         fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD, base_url: str = BASE_URL,
+                         metrics_json: Optional[str] = None, metrics_prometheus: Optional[str] = None,
+                         tracing: bool = False, max_tokens_total: Optional[int] = None, max_cost: Optional[float] = None,
+                         prices: Optional[Tuple[float, float]] = None, estimator: Optional[TokenEstimator] = None,
+                         hedging: Optional[HedgePolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                         validation_retries: int = 2, languages: Optional[List[str]] = None):
+    """
+    异步全量翻译，可选把运行指标写为 JSON 报告和 Prometheus 文本格式
+
+    languages 包含多个目标语言时，源文件的读取、切分和变更检测只做一次，各语言的翻译任务
+    共用一个限流器和连接池，target_dir 中的 {lang} 替换为语言代码。
+    """
+    languages = languages or [DEFAULT_LANGUAGE]
+    targets = {code: resolve_target_dir(target_dir, code, len(languages) > 1) for code in languages}
+    
     # 确保目录存在
     source_path = Path(source_dir)
-    target_path = Path(target_dir)
-    
     if not source_path.exists():
         logger.error(f"源目录不存在：{source_dir}")
         return
     
     # 创建目标目录
-    target_path.mkdir(parents=True, exist_ok=True)
+    for target in targets.values():
+        Path(target).mkdir(parents=True, exist_ok=True)
+    
+    # 各目标语言共享限流器、熔断器、预算、指标和源文件缓存，翻译记忆、术语表和输出目录各自独立
+    metrics = RunMetrics(tracing=tracing)
+    metrics.info['languages'] = languages
+    limiter = AdaptiveLimiter(max_concurrent, requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    corpus = SourceCorpus(chunk_size)
+    budget = TokenBudget(prices or (0.0, 0.0), max_tokens_total, max_cost) if max_tokens_total or max_cost else None
+    breaker = breaker or CircuitBreaker()
+    translators = {
+        code: AsyncMarkdownTranslator(
+            api_key, max_concurrent, chunk_size,
+            batch_size=batch_size,
+            stream=stream,
+            stall_timeout=stall_timeout,
+            fuzzy_threshold=fuzzy_threshold,
+            base_url=base_url,
+            metrics=metrics,
+            budget=budget,
+            estimator=estimator,
+            breaker=breaker,
+            hedging=hedging,
+            validation_retries=validation_retries,
+            language=code,
+            limiter=limiter,
+            corpus=corpus
+        )
+        for code in languages
+    }
     
-    # 初始化异步翻译器
-    translator = AsyncMarkdownTranslator(api_key, max_concurrent)
+    # 执行异步批量翻译，所有语言的请求共用一个连接池
+    try:
+        async with create_session() as session:
+            results = await asyncio.gather(*[
+                translator.batch_translate_async(
+                    input_dir=source_dir,
+                    output_dir=targets[code],
+                    max_retries=max_retries,
+                    retry_budget=retry_budget,
+                    priority_files=priority_files,
+                    manifest_path=language_path(manifest_path, code) if manifest_path else None,
+                    resume=resume,
+                    only_stale=only_stale,
+                    skip_unchanged=skip_unchanged,
+                    session=session
+                )
+                for code, translator in translators.items()
+            ])
+    finally:
+        for translator in translators.values():
+            translator.close()
+        if metrics_json:
+            metrics.write_json(metrics_json)
+            logger.info(f"运行指标已写入 {metrics_json}")
+        if metrics_prometheus:
+            metrics.write_prometheus(metrics_prometheus)
     
-    # 执行异步批量翻译
-    stats = await translator.batch_translate_async(
-        input_dir=source_dir,
-        output_dir=target_dir,
-        max_retries=max_retries
-    )
+    if len(languages) > 1:
+        for code, stats in zip(translators, results):
+            logger.info(f"{translators[code].language.name}（{targets[code]}）：✅ {stats['success']} 个成功，"
+                        f"❌ {stats['failed']} 个失败，跳过 {stats['skipped']} 个")
     
     # 生成目录结构报告
-    tree_report = generate_directory_tree(target_path)
-    logger.info(f"输出目录结构：\n{tree_report}")
+    for target in targets.values():
+        tree_report = generate_directory_tree(Path(target))
+        logger.info(f"{target} 目录结构：\n{tree_report}")
 
-def generate_directory_tree(path: Path, max_depth: int = 3) -> str:
-    """生成目录结构文本表示"""
-    try:
-        lines = []
-        prefix = ""
-        
-        for entry in path.iterdir():
-            if entry.is_dir():
-                lines.append(f"{prefix}├── {entry.name}/")
-                walk_directory(entry, lines, prefix + "│   ", max_depth-1)
-            else:
-                lines.append(f"{prefix}├── {entry.name}")
-        
-        return "\n".join(lines)
-    except Exception as e:
-        logger.warning(f"生成目录树失败：{str(e)}")
-        return "无法生成目录树"
+def estimate_translate(source_dir: str, target_dir: Optional[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD, skip_unchanged: bool = False,
+                       prices: Optional[Tuple[float, float]] = None,
+                       estimator: Optional[TokenEstimator] = None,
+                       languages: Optional[List[str]] = None) -> Dict[str, Any]:
+    """预估一次全量翻译的 token 用量和费用，不调用 API；多个目标语言时各语言分别估算后合计"""
+    languages = languages or [DEFAULT_LANGUAGE]
+    corpus = SourceCorpus(chunk_size)
+    estimates: Dict[str, Dict[str, Any]] = {}
+    for code in languages:
+        translator = AsyncMarkdownTranslator(
+            "", chunk_size=chunk_size, fuzzy_threshold=fuzzy_threshold, estimator=estimator,
+            language=code, corpus=corpus
+        )
+        try:
+            estimates[code] = translator.estimate(
+                source_dir, resolve_target_dir(target_dir, code, len(languages) > 1),
+                skip_unchanged=skip_unchanged, prices=prices
+            )
+        finally:
+            translator.close()
+    
+    estimate = dict(estimates[languages[0]])
+    if len(languages) > 1:
+        for key in estimate:
+            estimate[key] = sum(result[key] for result in estimates.values())
+        estimate['languages'] = estimates
+        for code, result in estimates.items():
+            logger.info(f"{code}：预计 {result['requests']} 个请求，"
+                        f"{result['prompt_tokens']} 输入 / {result['completion_tokens']} 输出 token")
+    
+    logger.info(f"文件数：{estimate['files']}，片段数：{estimate['segments']}，"
+                f"翻译记忆命中：{estimate['cached_segments']}，近似片段：{estimate['fuzzy_segments']}")
+    logger.info(f"预计请求数：{estimate['requests']}")
+    logger.info(f"预计 token：{estimate['prompt_tokens']} 输入 / {estimate['completion_tokens']} 输出")
+    if 'cost' in estimate:
+        logger.info(f"预计费用：约 {estimate['cost']:.4f} 元（不含重试）")
+    return estimate
 
-def walk_directory(path: Path, lines: list, prefix: str, depth: int):
-    """递归遍历目录"""
-    if depth <= 0:
-        return
-        
-    entries = list(path.iterdir())
-    for i, entry in enumerate(entries):
-        is_last = i == len(entries) - 1
-        new_prefix = prefix + ("    " if is_last else "│   ")
-        
-        if entry.is_dir():
-            lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}/")
-            if depth > 1:
-                walk_directory(entry, lines, new_prefix, depth-1)
-        else:
-            lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}")
+def changed_in_head(source_dir: str) -> Set[str]:
+    """最近一次提交中改动的源文件（源目录相对路径），不在 git 仓库中时返回空集合"""
+    source_path = Path(source_dir).resolve()
+    try:
+        root = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"],
+            cwd=source_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        names = subprocess.run(
+            ["git", "diff", "--name-only", "HEAD~1", "HEAD", "--", "."],
+            cwd=source_path, capture_output=True, text=True, check=True
+        ).stdout.splitlines()
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"无法获取最近一次提交的改动文件：{str(e)}")
+        return set()
+    changed = set()
+    for name in names:
+        try:
+            changed.add((Path(root) / name).relative_to(source_path).as_posix())
+        except ValueError:
+            continue
+    return changed
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='全量翻译 Markdown 文件（高并发异步版本）')
     parser.add_argument("--source-dir", default="trees", help="源目录路径 (默认：trees)")
-    parser.add_argument("--target-dir", default="tree_en", help="目标目录路径 (默认：tree_en)")
-    parser.add_argument("--api-key", required=True, help="翻译 API 密钥")
+    parser.add_argument("--target-dir", default=None,
+                        help="目标目录路径，可包含 {lang} 占位符 (默认：tree_<语言代码>，即 tree_en)")
+    parser.add_argument("--languages", nargs="+", default=[DEFAULT_LANGUAGE], choices=list(LANGUAGES),
+                        help="目标语言，可指定多个，源文件只解析一次 (默认：en)")
+    parser.add_argument("--api-key", help="翻译 API 密钥（--estimate 时不需要）")
+    parser.add_argument("--base-url", default=BASE_URL, help=f"OpenAI 兼容的补全接口地址 (默认：{BASE_URL})")
     parser.add_argument("--max-concurrent", type=int, default=20, help="最大并发请求数 (默认：20)")
-    parser.add_argument("--max-retries", type=int, default=5, help="最大重试次数 (默认：5)")
+    parser.add_argument("--max-retries", type=int, default=5, help="单个文件的最大重试次数 (默认：5)")
+    parser.add_argument("--retry-budget", type=int, default=None, help="所有文件共享的重试总次数 (默认：不限)")
+    parser.add_argument("--priority", nargs="*", default=[], help="优先翻译的文件（相对源目录的路径）")
+    parser.add_argument("--priority-changed", action="store_true", help="优先翻译最近一次提交中改动的文件")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH,
+                        help=f"运行清单路径 (默认：{DEFAULT_MANIFEST_PATH})")
+    parser.add_argument("--resume", action="store_true", help="跳过运行清单中已完成且未改动的文件，继续上次中断的翻译")
+    parser.add_argument("--only-stale", action="store_true", help="只翻译源文件哈希与运行清单记录不一致的文件")
+    parser.add_argument("--fuzzy-threshold", type=float, default=DEFAULT_FUZZY_THRESHOLD,
+                        help=f"与已翻译片段的相似度达到该值时改为修改旧译文，0 表示关闭 (默认：{DEFAULT_FUZZY_THRESHOLD})")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="跳过原文哈希与目标目录翻译索引一致的文件")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"大文件切分的片段字符上限 (默认：{DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"小文件打包请求的字符上限，0 表示不打包 (默认：{DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="每分钟请求数上限 (默认：不限)")
+    parser.add_argument("--tokens-per-minute", type=float, default=None, help="每分钟 token 数上限 (默认：不限)")
+    parser.add_argument("--no-stream", action="store_true", help="关闭流式响应，等待完整结果返回")
+    parser.add_argument("--stall-timeout", type=float, default=60,
+                        help="流式响应超过该秒数没有新数据即视为停滞并重试 (默认：60)")
+    parser.add_argument("--metrics-json", default=None, help="把运行指标（逐请求耗时、token、字节数等）写入 JSON 文件")
+    parser.add_argument("--metrics-prometheus", default=None, help="把运行指标以 Prometheus 文本格式写入文件")
+    parser.add_argument("--estimate", action="store_true",
+                        help="不调用 API，只估算需要的 token 数和费用（已命中翻译记忆的片段不计入）")
+    parser.add_argument("--max-tokens-total", type=int, default=None,
+                        help="本次运行的 token 总数上限，达到后不再发出新请求 (默认：不限)")
+    parser.add_argument("--max-cost", type=float, default=None, help="本次运行的费用上限（元）(默认：不限)")
+    parser.add_argument("--input-price", type=float, default=None, help="每百万输入 token 的价格（元），覆盖内置价格")
+    parser.add_argument("--output-price", type=float, default=None, help="每百万输出 token 的价格（元），覆盖内置价格")
+    parser.add_argument("--tokenizer", default=None,
+                        help="模型的 tokenizer.json，安装了 tokenizers 时用于精确计数 (默认：按字符估算)")
+    parser.add_argument("--output-ratio", type=float, default=OUTPUT_RATIO,
+                        help=f"预计输出 token 与待翻译正文 token 之比，推理模型可调大 (默认：{OUTPUT_RATIO})")
+    parser.add_argument("--otel", action="store_true",
+                        help="为每个文件和请求输出 OpenTelemetry span（需要安装 opentelemetry-api 并配置导出器）")
+    parser.add_argument("--hedge", action="store_true", help="请求长时间未响应时发送对冲请求，取先返回的结果")
+    parser.add_argument("--hedge-percentile", type=float, default=95,
+                        help="超过本次运行首字节耗时的该百分位仍未响应时对冲 (默认：95)")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="对冲请求数占请求总数的上限 (默认：0.05)")
+    parser.add_argument("--breaker-threshold", type=float, default=0.5,
+                        help="近 30 秒内失败比例达到该值时暂停发送请求，设为 0 关闭 (默认：0.5)")
+    parser.add_argument("--breaker-give-up", type=float, default=600,
+                        help="服务持续不可用超过该秒数后放弃剩余文件 (默认：600)")
+    parser.add_argument("--validation-retries", type=int, default=2,
+                        help="片段译文结构校验失败后单独重新请求的次数 (默认：2)")
     
     args = parser.parse_args()
     
+    prices = prices_for(MODEL, args.input_price, args.output_price)
+    if args.max_cost is not None and prices is None:
+        parser.error(f"模型 {MODEL} 没有内置价格，使用 --max-cost 时需要指定 --input-price 和 --output-price")
+    if not args.estimate and not args.api_key:
+        parser.error("需要 --api-key")
+    try:
+        target_dirs = [resolve_target_dir(args.target_dir, code, len(args.languages) > 1) for code in args.languages]
+    except ValueError as e:
+        parser.error(str(e))
+    estimator = TokenEstimator(args.tokenizer, args.output_ratio)
+    
+    if args.estimate:
+        estimate_translate(
+            args.source_dir, args.target_dir, args.chunk_size, args.fuzzy_threshold,
+            args.skip_unchanged, prices, estimator, args.languages
+        )
+        sys.exit(0)
+    
     try:
         logger.info("开始全量翻译（高并发异步版本）...")
         logger.info(f"源目录：{args.source_dir}")
-        logger.info(f"目标目录：{args.target_dir}")
+        logger.info(f"目标目录：{', '.join(target_dirs)}")
         logger.info(f"最大并发数：{args.max_concurrent}")
         logger.info(f"最大重试次数：{args.max_retries}")
         
+        priority_files = set(args.priority)
+        if args.priority_changed:
+            priority_files |= changed_in_head(args.source_dir)
+        if priority_files:
+            logger.info(f"优先翻译 {len(priority_files)} 个文件")
+        
         # 运行翻译
         asyncio.run(full_translate(
             source_dir=args.source_dir,
             target_dir=args.target_dir,
             api_key=args.api_key,
             max_concurrent=args.max_concurrent,
-            max_retries=args.max_retries
+            max_retries=args.max_retries,
+            chunk_size=args.chunk_size,
+            batch_size=args.batch_size,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+            stream=not args.no_stream,
+            stall_timeout=args.stall_timeout,
+            retry_budget=args.retry_budget,
+            priority_files=priority_files,
+            manifest_path=args.manifest,
+            resume=args.resume,
+            only_stale=args.only_stale,
+            skip_unchanged=args.skip_unchanged,
+            fuzzy_threshold=args.fuzzy_threshold,
+            base_url=args.base_url,
+            metrics_json=args.metrics_json,
+            metrics_prometheus=args.metrics_prometheus,
+            tracing=args.otel,
+            max_tokens_total=args.max_tokens_total,
+            max_cost=args.max_cost,
+            prices=prices,
+            estimator=estimator,
+            hedging=HedgePolicy(args.hedge_percentile, args.hedge_budget) if args.hedge else None,
+            breaker=CircuitBreaker(args.breaker_threshold, give_up_after=args.breaker_give_up),
+            validation_retries=args.validation_retries,
+            languages=args.languages
         ))
         
         logger.info("全量翻译完成")
@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import subprocess
 import sys
 import json
 from pathlib import Path
-from typing import List, Dict
-from translator import MarkdownTranslator
-from github import Github
-from git import Repo
+from typing import Any, List, Dict, Optional, Tuple
 import logging
 
 sys.path.append(str(Path(__file__).parent.resolve()))
 
+from prompt import BASE_URL
+from translation_index import TranslationIndex
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -19,20 +20,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 记录上次完成翻译的源提交，随译文一起提交
+STATE_FILENAME = ".translation_state.json"
+
 class TranslationBot:
+    """
+    检测源文件变更、翻译并创建 PR
+
+    GitPython、PyGithub 和翻译器（aiohttp、翻译记忆）都在用到时才导入或创建，
+    没有改动的运行和 --dry-run 不必为它们付出启动时间。
+    """
     def __init__(self):
         self.args = self.parse_args()
         self.api_key = os.getenv("API_KEY")
         if not self.api_key:
             logger.error("Missing API_KEY environment variable")
             sys.exit(1)
-        self.translator = MarkdownTranslator(self.api_key)
         self.run_id = os.getenv("GITHUB_RUN_ID", "manual-run")
-        
-        # 初始化 Git 仓库
+        self.base_commit = None  # 变更检测所比较的旧提交，供增量翻译读取旧原文
+        self.renames: Dict[str, str] = {}  # {新路径: 旧路径}，源目录相对路径
+        self.deletions: List[str] = []
+        self.moved: List[Tuple[str, str]] = []
+        self.deleted: List[str] = []
+        self.source_commit: Optional[str] = None  # 翻译所依据的源提交，在机器人提交译文之前记下
+        self.branch_name = f"translation-{self.run_id}"
+
+    def open_repo(self):
+        """初始化 Git 仓库"""
+        from git import Repo
         try:
             self.repo = Repo(".")
             logger.info(f"Initialized Git repo at {self.repo.working_dir}")
+            if self.repo.head.is_valid():
+                self.source_commit = self.repo.head.commit.hexsha
         except Exception as e:
             logger.error(f"Failed to initialize Git repo: {str(e)}")
             if self.args.dry_run:
@@ -46,27 +66,46 @@ class TranslationBot:
         parser.add_argument("--target-dir", default="tree_en", help="Target directory for English translations")
         parser.add_argument("--pr-reviewers", default="", help="Comma-separated GitHub reviewers")
         parser.add_argument("--dry-run", action="store_true", help="Run without pushing changes")
+        parser.add_argument("--max-concurrent", type=int, default=20, help="Maximum concurrent translation requests")
+        parser.add_argument("--max-retries", type=int, default=5, help="Maximum retries per failed file")
+        parser.add_argument("--metrics-json", default=None,
+                            help="Write a JSON run report (per-request timings, tokens, bytes) to this path")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Only retranslate changed paragraphs, reusing existing translations")
         return parser.parse_args()
 
     def run(self):
         try:
             logger.info(f"Starting translation run {self.run_id}")
+            if self.is_up_to_date():
+                logger.info("Translations are up to date with HEAD, nothing to do")
+                return
+            self.open_repo()
             
             # 阶段 1：检测和验证变更
             changed_files = self.get_changed_files()
-            if not changed_files:
+            for input_file in self.apply_moves_and_deletions():
+                if input_file not in changed_files:
+                    changed_files.append(input_file)
+            if not changed_files and not (self.moved or self.deleted):
                 logger.info("No changed Markdown files detected")
                 return
             
-            # 阶段 2：执行翻译
-            stats = self.execute_translation(changed_files)
+            # 阶段 2：执行翻译（重命名和删除只移动或删除已有译文，不调用 API）
+            if changed_files:
+                stats = self.execute_translation(changed_files)
+            else:
+                stats = {'success': 0, 'failed': 0, 'retries': 0, 'succeeded_files': [], 'failed_files': []}
             
-            # 阶段 3：提交和创建 PR
+            # 阶段 3：提交和创建 PR；状态文件只在 PR 创建成功后推进，试运行不改动它，
+            # 否则下次运行会认为这些改动已经翻译并提交过
             if self.args.dry_run:
                 logger.info("⚠️ Dry run mode activated. No changes will be committed.")
                 logger.info(f"Would create PR for {len(changed_files)} files")
             else:
                 self.create_versioned_pr(changed_files, stats)
+                if stats['failed'] == 0:
+                    self.save_state()
             
             logger.info(f"Translation completed successfully")
             
@@ -74,49 +113,127 @@ class TranslationBot:
             logger.error(f"Translation pipeline failed: {str(e)}", exc_info=True)
             sys.exit(1)
 
+    def is_up_to_date(self) -> bool:
+        """
+        上次翻译的提交就是 HEAD 且翻译索引中没有过期文件时无需任何操作
+
+        只读取状态文件和翻译索引并调用一次 git rev-parse，不加载 GitPython。
+        """
+        state_path = Path(self.args.target_dir) / STATE_FILENAME
+        if not state_path.exists():
+            return False
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                last_commit = json.load(f)['last_commit']
+            head = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, KeyError, ValueError, subprocess.CalledProcessError):
+            return False
+        if head != last_commit:
+            return False
+        return not TranslationIndex(self.args.source_dir, self.args.target_dir).stale_files()
+
+    def source_relative(self, repo_path: Optional[str]) -> Optional[str]:
+        """把仓库相对路径转换为源目录相对路径，不在源目录下或不是 Markdown 文件时返回 None"""
+        if not repo_path or not repo_path.endswith('.md'):
+            return None
+        abs_path = (Path(self.repo.working_dir) / repo_path).absolute()
+        try:
+            return abs_path.relative_to(Path(self.args.source_dir).absolute()).as_posix()
+        except ValueError:
+            return None
+
+    def resolve_base_commit(self):
+        """确定变更检测的起点：状态文件记录的上次翻译提交，其次是推送事件的 before，最后是 HEAD~1"""
+        head = self.repo.head.commit
+        candidates = []
+        state_path = Path(self.args.target_dir) / STATE_FILENAME
+        if state_path.exists():
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    candidates.append(("last translated", json.load(f)['last_commit']))
+            except Exception as e:
+                logger.warning(f"Failed to read {state_path}: {str(e)}")
+        event_path = os.getenv("GITHUB_EVENT_PATH")
+        if event_path and Path(event_path).exists():
+            with open(event_path, 'r') as f:
+                before = json.load(f).get('before')
+            if before and before.strip('0'):
+                candidates.append(("push event", before))
+        
+        for label, sha in candidates:
+            try:
+                bases = self.repo.merge_base(self.repo.commit(sha), head)
+            except Exception as e:
+                logger.warning(f"Cannot use {label} commit {sha[:8]}: {str(e)}")
+                continue
+            if bases:
+                logger.info(f"Detecting changes since {label} commit {sha[:8]} (merge base {bases[0].hexsha[:8]})")
+                return bases[0]
+        return head.parents[0] if head.parents else None
+
     def get_changed_files(self) -> List[str]:
         """识别已修改/添加的 markdown 文件"""
         changed = []
         source_path = Path(self.args.source_dir).absolute()
         
         try:
-            # 方法 1: 使用 GitPython 的 diff
+            # 方法 1: 使用 GitPython 对比上次翻译的提交与 HEAD（覆盖一次推送的多个提交）
             try:
-                # 获取当前 HEAD 与上一次提交的差异
-                if self.repo.head.is_valid() and len(self.repo.head.commit.parents) > 0:
-                    diff = self.repo.head.commit.parents[0].diff(self.repo.head.commit)
-                    for diff_item in diff:
-                        if diff_item.change_type in ('A', 'M') and diff_item.a_path.endswith('.md'):
-                            abs_path = (Path(self.repo.working_dir) / diff_item.a_path).absolute()
-                            try:
-                                rel_path = abs_path.relative_to(source_path)
-                                if not str(rel_path).startswith('..'):
-                                    changed.append(str(abs_path))
-                            except ValueError:
-                                continue
+                if self.repo.head.is_valid():
+                    self.base_commit = self.resolve_base_commit()
+                if self.base_commit is not None:
+                    for diff_item in self.base_commit.diff(self.repo.head.commit, M=True):
+                        old_rel = self.source_relative(diff_item.a_path)
+                        new_rel = self.source_relative(diff_item.b_path)
+                        if diff_item.change_type in ('A', 'M') and new_rel:
+                            changed.append(str(source_path / new_rel))
+                        elif diff_item.change_type == 'R':
+                            if old_rel and new_rel:
+                                # 重命名：移动已有译文，内容也有改动时再翻译新路径
+                                self.renames[new_rel] = old_rel
+                                if diff_item.a_blob.hexsha != diff_item.b_blob.hexsha:
+                                    changed.append(str(source_path / new_rel))
+                            elif new_rel:
+                                changed.append(str(source_path / new_rel))
+                            elif old_rel:
+                                self.deletions.append(old_rel)
+                        elif diff_item.change_type == 'D' and old_rel:
+                            self.deletions.append(old_rel)
             except Exception as e:
                 logger.warning(f"GitPython diff failed: {str(e)}")
             
             # 方法 2: 如果方法 1 失败，使用环境变量
-            if not changed:
+            if not changed and not self.renames and not self.deletions:
                 logger.info("Trying alternative method using GitHub event payload")
                 event_path = os.getenv("GITHUB_EVENT_PATH")
                 if event_path and Path(event_path).exists():
                     with open(event_path, 'r') as f:
                         event_data = json.load(f)
                     
-                    # 获取提交中修改的文件
+                    # 获取提交中增删改的文件，以工作区中是否存在为准
+                    touched = []
                     for commit in event_data.get('commits', []):
-                        for file_path in commit.get('modified', []) + commit.get('added', []):
-                            if file_path.endswith('.md') and file_path.startswith(self.args.source_dir):
-                                abs_path = (Path(self.repo.working_dir) / file_path).absolute()
-                                changed.append(str(abs_path))
+                        touched += commit.get('added', []) + commit.get('modified', []) + commit.get('removed', [])
+                    for rel_path in dict.fromkeys(filter(None, map(self.source_relative, touched))):
+                        if (source_path / rel_path).exists():
+                            changed.append(str(source_path / rel_path))
+                        else:
+                            self.deletions.append(rel_path)
             
-            # 方法 3: 作为最后手段，处理所有文件
-            if not changed:
-                logger.warning("No changes detected, processing all files")
-                for file_path in Path(self.args.source_dir).rglob('*.md'):
-                    changed.append(str(file_path.absolute()))
+            # 方法 3: 用翻译索引找出原文哈希与已有译文不一致的文件
+            index = TranslationIndex(self.args.source_dir, self.args.target_dir)
+            if not changed and not self.renames and not self.deletions:
+                logger.warning("No changes detected, checking all files against the translation index")
+                for rel_path in index.stale_files():
+                    changed.append(str(source_path / rel_path))
+            else:
+                # 已按当前原文翻译过的文件无需重复翻译
+                candidates = changed
+                changed = [f for f in candidates if index.is_stale(Path(f).relative_to(source_path).as_posix())]
+                if len(changed) < len(candidates):
+                    logger.info(f"Translation index: {len(candidates) - len(changed)} changed files are already up to date")
             
         except Exception as e:
             logger.error(f"Failed to detect changed files: {str(e)}")
@@ -133,7 +250,74 @@ class TranslationBot:
             logger.warning("No valid markdown changes detected")
         return changed
 
-    def execute_translation(self, files: List[str]) -> Dict[str, int]:
+    def apply_moves_and_deletions(self) -> List[str]:
+        """
+        把重命名的源文件对应的译文移动到新路径，删除已删除源文件的译文
+
+        返回无法移动且新路径还没有译文、需要重新翻译的源文件（绝对路径）。
+        """
+        if not self.renames and not self.deletions:
+            return []
+        target_path = Path(self.args.target_dir)
+        source_path = Path(self.args.source_dir).absolute()
+        index = TranslationIndex(self.args.source_dir, self.args.target_dir)
+        untranslated = []
+        
+        for new_rel, old_rel in self.renames.items():
+            old_output = target_path / old_rel
+            new_output = target_path / new_rel
+            if old_output.exists() and not new_output.exists():
+                new_output.parent.mkdir(parents=True, exist_ok=True)
+                old_output.replace(new_output)
+                if old_rel in index.entries:
+                    index.entries[new_rel] = index.entries.pop(old_rel)
+                self.moved.append((old_rel, new_rel))
+                continue
+            reason = "translation already exists at new path" if new_output.exists() else "no translation at old path"
+            logger.warning(f"Skipped moving translation {old_rel} → {new_rel}: {reason}")
+            if not new_output.exists():
+                untranslated.append(str(source_path / new_rel))
+        
+        for rel_path in self.deletions:
+            output_file = target_path / rel_path
+            index.remove(rel_path)
+            if output_file.exists():
+                output_file.unlink()
+                self.deleted.append(rel_path)
+            # 清理变空的目录
+            parent = output_file.parent
+            while parent != target_path and parent.exists() and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+        
+        index.save()
+        if self.moved:
+            logger.info(f"Moved {len(self.moved)} translations for renamed sources")
+        if self.deleted:
+            logger.info(f"Deleted {len(self.deleted)} translations of removed sources")
+        if untranslated:
+            logger.info(f"{len(untranslated)} renamed sources have no translation to move and will be translated")
+        return untranslated
+
+    def save_state(self):
+        """
+        记录本次已翻译到的源提交，下次从这里开始检测变更
+
+        在 PR 创建成功后调用，状态文件作为单独的提交推送到同一分支，随译文一起合并。
+        """
+        if self.source_commit is None:
+            return
+        state_path = Path(self.args.target_dir) / STATE_FILENAME
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_commit': self.source_commit, 'run_id': self.run_id}, f, indent=1)
+            f.write("\n")
+        self.repo.git.add(str(state_path))
+        self.repo.index.commit(f"chore(translation): record translated commit {self.source_commit[:8]}")
+        self.repo.remote(name='origin').push(refspec=f"HEAD:{self.branch_name}", force=True)
+        logger.info(f"Recorded translated commit {self.source_commit[:8]} on {self.branch_name}")
+
+    def execute_translation(self, files: List[str]) -> Dict[str, Any]:
         """使用结构保留执行批量翻译"""
         # 确保输出目录存在
         output_dir = Path(self.args.target_dir)
@@ -146,12 +330,30 @@ class TranslationBot:
         logger.info(f"Starting translation of {len(files)} files to {output_dir}...")
         logger.info(f"Files to translate: {rel_files[:3]}... (total: {len(rel_files)})")
         
-        # 调用翻译器
-        stats = self.translator.batch_translate(
-            input_dir=self.args.source_dir,
-            output_dir=self.args.target_dir,
-            specific_files=rel_files
+        previous_sources = None
+        if self.args.incremental:
+            previous_sources = self.load_previous_sources(rel_files)
+            logger.info(f"Incremental mode: {len(previous_sources)} files have a previous version")
+        
+        # 调用异步翻译器，所有文件并发翻译
+        import asyncio
+        from full_translate import AsyncMarkdownTranslator
+        self.translator = AsyncMarkdownTranslator(
+            self.api_key, self.args.max_concurrent, base_url=os.getenv("API_BASE_URL") or BASE_URL
         )
+        try:
+            stats = asyncio.run(self.translator.batch_translate_async(
+                input_dir=self.args.source_dir,
+                output_dir=self.args.target_dir,
+                specific_files=rel_files,
+                max_retries=self.args.max_retries,
+                previous_sources=previous_sources
+            ))
+        finally:
+            self.translator.close()
+            if self.args.metrics_json:
+                self.translator.metrics.write_json(self.args.metrics_json)
+                logger.info(f"Run metrics written to {self.args.metrics_json}")
         
         if stats['success'] == 0:
             raise Exception("All translations failed")
@@ -159,14 +361,36 @@ class TranslationBot:
         logger.info(f"Translation results: ✅ {stats['success']} succeeded, ❌ {stats['failed']} failed")
         return stats
 
-    def create_versioned_pr(self, changed_files: List[str], stats: Dict[str, int]):
+    def load_previous_sources(self, rel_files: List[str]) -> Dict[str, str]:
+        """从变更检测的旧提交中读取文件的旧原文，新增文件不在结果中"""
+        previous = {}
+        if self.base_commit is None:
+            logger.warning("No base commit available, incremental mode falls back to full translation")
+            return previous
+        
+        source_abs = Path(self.args.source_dir).absolute()
+        repo_root = Path(self.repo.working_dir).absolute()
+        for rel_file in rel_files:
+            # 重命名的文件从旧路径读取旧原文
+            old_rel = self.renames.get(Path(rel_file).as_posix(), rel_file)
+            repo_path = (source_abs / old_rel).relative_to(repo_root).as_posix()
+            try:
+                blob = self.base_commit.tree / repo_path
+                previous[Path(rel_file).as_posix()] = blob.data_stream.read().decode('utf-8')
+            except KeyError:
+                continue
+            except Exception as e:
+                logger.warning(f"Failed to read previous version of {repo_path}: {str(e)}")
+        return previous
+
+    def create_versioned_pr(self, changed_files: List[str], stats: Dict[str, Any]):
         """提交变更并创建带版本的 PR"""
         # 配置 Git 身份
         self.repo.git.config("user.name", "Translation Bot")
         self.repo.git.config("user.email", "translation-bot@users.noreply.github.com")
         
         # 创建带版本的 branch
-        branch_name = f"translation-{self.run_id}"
+        branch_name = self.branch_name
         logger.info(f"Creating branch {branch_name}")
         
         # 添加所有更改
@@ -192,6 +416,7 @@ Files processed:
         if not github_token:
             raise Exception("Missing GITHUB_TOKEN")
             
+        from github import Github  # 只有创建 PR 时才需要 PyGithub
         g = Github(github_token)
         repo_name = os.getenv("GITHUB_REPOSITORY")
         if not repo_name:
@@ -221,7 +446,7 @@ Files processed:
         
         logger.info(f"Created PR #{pr.number}: {pr.html_url}")
 
-    def generate_pr_body(self, files: List[str], stats: Dict[str, int]) -> str:
+    def generate_pr_body(self, files: List[str], stats: Dict[str, Any]) -> str:
         """生成完整的 PR 描述"""
         # 使用绝对路径的源目录来计算相对路径
         source_abs = Path(self.args.source_dir).absolute()
@@ -229,6 +454,19 @@ Files processed:
         if len(files) > 5:
             sample_files += f"\n- ...(+{len(files)-5} more files)"
         
+        failed_section = ""
+        if stats.get('failed_files'):
+            failed_list = "\n".join(f"- `{f}`" for f in stats['failed_files'])
+            failed_section = f"\n### Failed Files\n{failed_list}\n"
+        
+        moved_section = ""
+        if self.moved:
+            moved_list = "\n".join(f"- `{old}` → `{new}`" for old, new in self.moved)
+            moved_section = f"\n### Moved Translations\n{moved_list}\n"
+        if self.deleted:
+            deleted_list = "\n".join(f"- `{f}`" for f in self.deleted)
+            moved_section += f"\n### Deleted Translations\n{deleted_list}\n"
+        
         return f"""
 ## Translation Report (Run {self.run_id})
 
@@ -238,7 +476,7 @@ Files processed:
 
 ### Changed Files
 {sample_files}
-
+{failed_section}{moved_section}
 ### Verification Checklist
 1. [ ] Markdown formatting preserved
 2. [ ] Code blocks unchanged
@@ -249,40 +487,6 @@ Files processed:
 > Automatically generated by translation pipeline
 """
 
-    def get_directory_tree(self, path: Path, max_depth: int = 3) -> str:
-        """获取目录结构文本表示"""
-        try:
-            lines = []
-            prefix = ""
-            
-            for entry in path.iterdir():
-                if entry.is_dir():
-                    lines.append(f"{prefix}├── {entry.name}/")
-                    self.walk_directory(entry, lines, prefix + "│   ", max_depth-1)
-                else:
-                    lines.append(f"{prefix}├── {entry.name}")
-            
-            return "\n".join(lines)
-        except Exception as e:
-            logger.warning(f"Failed to generate tree: {str(e)}")
-            return "Could not generate directory tree"
-    
-    def walk_directory(self, path: Path, lines: list, prefix: str, depth: int):
-        if depth <= 0:
-            return
-            
-        entries = list(path.iterdir())
-        for i, entry in enumerate(entries):
-            is_last = i == len(entries) - 1
-            new_prefix = prefix + ("    " if is_last else "│   ")
-            
-            if entry.is_dir():
-                lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}/")
-                if depth > 1:
-                    self.walk_directory(entry, lines, new_prefix, depth-1)
-            else:
-                lines.append(f"{prefix}{'└──' if is_last else '├──'} {entry.name}")
-
 if __name__ == "__main__":
     try:
         TranslationBot().run()
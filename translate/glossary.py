@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+GLOSSARY_PATHS = [
+    Path("translate/glossary.json"),
+    Path("./glossary.json")
+]
+
+
+def glossary_paths(language: str = 'en') -> List[Path]:
+    """目标语言的术语表候选路径，英文之外的语言使用 glossary.<语言代码>.json"""
+    if language == 'en':
+        return GLOSSARY_PATHS
+    return [path.with_name(f"{path.stem}.{language}{path.suffix}") for path in GLOSSARY_PATHS]
+
+
+class Glossary:
+    """
+    编译为 Aho-Corasick 自动机的术语表
+
+    一次扫描即可找出文本中出现的全部术语，请求只携带相关术语；
+    渲染结果和术语哈希按术语组合缓存。
+    """
+
+    def __init__(self, entries: Dict[str, str]):
+        self.entries = dict(entries)
+        self._order = {term: i for i, term in enumerate(self.entries)}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        self._rendered: Dict[Tuple[str, ...], str] = {}
+        self._fingerprints: Dict[Tuple[str, ...], str] = {}
+        self._build()
+
+    def _build(self):
+        """构建字典树及失配指针"""
+        for term in self.entries:
+            if not term:
+                continue
+            node = 0
+            for ch in term:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][ch] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                node = child
+            self._output[node] += (term,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] += self._output[self._fail[child]]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def matching_terms(self, text: str) -> Tuple[str, ...]:
+        """文本中出现的术语，按术语表顺序排列"""
+        if not self.entries:
+            return ()
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                found.update(output[node])
+        return tuple(sorted(found, key=self._order.__getitem__))
+
+    def terms_in(self, text: str) -> Dict[str, str]:
+        """文本中出现的术语条目"""
+        return {term: self.entries[term] for term in self.matching_terms(text)}
+
+    def render(self, text: str) -> str:
+        """只包含文本中出现的术语的提示词片段"""
+        terms = self.matching_terms(text)
+        rendered = self._rendered.get(terms)
+        if rendered is None:
+            rendered = format_glossary({term: self.entries[term] for term in terms})
+            self._rendered[terms] = rendered
+        return rendered
+
+    def fingerprint(self, text: str) -> str:
+        """文本中出现的术语条目的哈希"""
+        terms = self.matching_terms(text)
+        fingerprint = self._fingerprints.get(terms)
+        if fingerprint is None:
+            fingerprint = glossary_fingerprint({term: self.entries[term] for term in terms})
+            self._fingerprints[terms] = fingerprint
+        return fingerprint
+
+
+def load_glossary(language: str = 'en') -> Glossary:
+    """加载目标语言的技术术语表并编译为多模式匹配索引"""
+    for glossary_path in glossary_paths(language):
+        if glossary_path.exists():
+            try:
+                with open(glossary_path, 'r', encoding='utf-8') as f:
+                    glossary = Glossary(json.load(f))
+                logger.info(f"Loaded glossary from {glossary_path} ({len(glossary)} terms)")
+                return glossary
+            except Exception as e:
+                logger.warning(f"术语表加载失败 ({glossary_path}): {str(e)}")
+
+    logger.warning("No glossary found, using empty glossary")
+    return Glossary({})
+
+
+def format_glossary(glossary: Dict[str, str]) -> str:
+    """为 API 提示格式化术语表"""
+    if not glossary:
+        return "（无特定术语表，请使用标准计算机科学术语）"
+
+    formatted_terms = []
+    for chinese, english in glossary.items():
+        formatted_terms.append(f"  • {chinese} → {english}")
+
+    return "术语对照表：\n" + "\n".join(formatted_terms)
+
+
+def glossary_fingerprint(entries: Dict[str, str]) -> str:
+    """术语条目的内容哈希，与条目顺序无关"""
+    canonical = json.dumps(sorted(entries.items()), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
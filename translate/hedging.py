@@ -0,0 +1,45 @@
+import statistics
+from collections import deque
+from typing import Deque, Optional
+
+
+class HedgePolicy:
+    """
+    对冲请求的触发时机与预算
+
+    记录本次运行中成功请求的首字节耗时，请求超过其第 percentile 百分位仍未收到响应时
+    发送一个相同的对冲请求。对冲请求总数不超过已发请求数的 budget 比例，
+    样本不足 min_samples 时不对冲。
+    """
+
+    def __init__(self,
+                 percentile: float = 95,
+                 budget: float = 0.05,
+                 min_samples: int = 20,
+                 min_delay: float = 1.0,
+                 window: int = 500):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay  # 对冲前至少等待的秒数，避免快速请求被成倍放大
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+
+    def observe(self, seconds: float):
+        """记录一次成功请求的首字节耗时"""
+        self.samples.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """当前的对冲等待时间，样本不足时返回 None"""
+        if len(self.samples) < self.min_samples:
+            return None
+        cuts = statistics.quantiles(self.samples, n=100, method='inclusive')
+        return max(self.min_delay, cuts[min(98, max(0, int(self.percentile) - 1))])
+
+    def take(self) -> bool:
+        """占用一次对冲预算，预算用完时返回 False"""
+        if self.hedged + 1 > self.budget * self.requests:
+            return False
+        self.hedged += 1
+        return True
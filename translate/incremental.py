@@ -0,0 +1,55 @@
+import difflib
+from typing import List, Optional, Tuple
+
+from segmenter import align_blocks, split_blocks, split_padding, restore_padding
+
+
+def _normalize(block: str) -> str:
+    return block.strip()
+
+
+def plan_incremental(old_source: str,
+                     new_source: str,
+                     old_translation: str) -> Optional[List[Tuple[bool, str]]]:
+    """
+    对比新旧原文，复用未改动段落的已有译文
+
+    返回按顺序排列的 (needs_translation, text) 列表：needs_translation 为 False 时
+    text 是可直接使用的译文，为 True 时 text 是需要重新翻译的原文（相邻改动段落已合并）。
+    旧原文与旧译文的段落结构无法一一对应，或没有任何段落可复用时返回 None，
+    由调用方回退到整篇翻译。
+    """
+    old_blocks = split_blocks(old_source)
+    translated_blocks = align_blocks(old_blocks, old_translation)
+    if translated_blocks is None:
+        return None
+
+    new_blocks = split_blocks(new_source)
+    matcher = difflib.SequenceMatcher(
+        None,
+        [_normalize(b) for b in old_blocks],
+        [_normalize(b) for b in new_blocks],
+        autojunk=False
+    )
+
+    plan: List[Tuple[bool, str]] = []
+    reused = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for old_index, new_index in zip(range(i1, i2), range(j1, j2)):
+                # 沿用新原文的段落间距，正文取已有译文
+                lead, _, trail = split_padding(new_blocks[new_index])
+                _, body, _ = split_padding(translated_blocks[old_index])
+                plan.append((False, restore_padding(lead, body, trail)))
+                reused += 1
+        elif tag in ('replace', 'insert'):
+            changed = ''.join(new_blocks[j1:j2])
+            if plan and plan[-1][0]:
+                plan[-1] = (True, plan[-1][1] + changed)
+            else:
+                plan.append((True, changed))
+        # 'delete'：原文已删除的段落，其译文一并丢弃
+
+    if reused == 0 and new_blocks:
+        return None
+    return plan
@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Dict, NamedTuple
+
+
+class Language(NamedTuple):
+    """翻译的目标语言"""
+    code: str
+    name: str  # 提示词中的语言名，如“英文”
+    variety: str  # 提示词中对目标语言的具体要求，如“英语（美式英语）”
+
+
+LANGUAGES: Dict[str, Language] = {
+    language.code: language for language in (
+        Language('en', '英文', '英语（美式英语）'),
+        Language('ja', '日文', '日语'),
+        Language('ko', '韩文', '韩语'),
+        Language('fr', '法文', '法语'),
+        Language('de', '德文', '德语'),
+        Language('es', '西班牙文', '西班牙语'),
+        Language('ru', '俄文', '俄语'),
+        Language('zh-Hant', '繁体中文', '繁体中文（台湾用语）'),
+    )
+}
+
+DEFAULT_LANGUAGE = 'en'
+
+
+def get_language(code: str) -> Language:
+    """按语言代码查找目标语言，未知代码抛出 ValueError"""
+    try:
+        return LANGUAGES[code]
+    except KeyError:
+        raise ValueError(f"不支持的目标语言：{code}（可选：{', '.join(LANGUAGES)}）")
+
+
+def target_dir_for(code: str) -> str:
+    """目标语言的默认输出目录，如 tree_en、tree_ja"""
+    return f"tree_{code}"
+
+
+def language_path(path: str, code: str) -> str:
+    """
+    按目标语言区分的缓存或清单文件路径
+
+    英文沿用原有路径，其他语言在扩展名前插入语言代码，如 .translation_memory.ja.sqlite3。
+    """
+    if code == DEFAULT_LANGUAGE:
+        return path
+    target = Path(path)
+    return str(target.with_name(f"{target.stem}.{code}{target.suffix}"))
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = ".translation_manifest.jsonl"
+
+
+def file_hash(path: Path) -> str:
+    """文件内容的 sha256"""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class RunManifest:
+    """
+    追加写入的 JSONL 运行清单
+
+    每个文件完成后追加一条记录（源文件哈希、大小与修改时间、译文哈希、状态、耗时），
+    同一路径以最后一条为准。进程被中断时最多丢失最后一条未写完的记录。
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = Path(path)
+        self.records: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 中断时写了一半的行
+                    self.records[record['path']] = record
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if self.file.tell() > 0:
+            # 上次中断可能留下没有换行的半行，另起一行继续追加
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write("\n")
+
+    def is_done(self, rel_path: str, input_file: Path, output_file: Path) -> bool:
+        """按大小和修改时间判断文件上次已完成且未改动，不读取文件内容"""
+        record = self.records.get(rel_path)
+        if not record or record.get('status') != 'done' or not output_file.exists():
+            return False
+        try:
+            stat = input_file.stat()
+        except OSError:
+            return False
+        return record.get('size') == stat.st_size and record.get('mtime_ns') == stat.st_mtime_ns
+
+    def is_fresh(self, rel_path: str, input_file: Path, output_file: Path) -> bool:
+        """按源文件哈希判断译文是否仍然对应当前原文"""
+        record = self.records.get(rel_path)
+        if not record or record.get('status') != 'done' or not output_file.exists():
+            return False
+        return record.get('source_hash') == file_hash(input_file)
+
+    def record(self,
+               rel_path: str,
+               input_file: Path,
+               output_file: Optional[Path],
+               status: str,
+               seconds: float):
+        """追加一条文件结果并立即落盘"""
+        stat = input_file.stat()
+        record = {
+            'path': rel_path,
+            'status': status,
+            'source_hash': file_hash(input_file),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'output_hash': file_hash(output_file) if output_file and output_file.exists() else None,
+            'seconds': round(seconds, 3),
+            'finished_at': time.time()
+        }
+        self.records[rel_path] = record
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def compact(self):
+        """只保留每个路径的最后一条记录，原子替换清单文件"""
+        self.file.close()
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
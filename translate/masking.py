@@ -0,0 +1,137 @@
+import re
+from typing import Callable, List, Tuple
+
+PLACEHOLDER_RE = re.compile(r'⟦\s*(\d+)\s*⟧')
+LETTER_RE = re.compile(r'[^\W\d_]')
+
+FRONT_MATTER_RE = re.compile(r'\A(---[ \t]*\n)(.*?\n)(---[ \t]*)(?=\n|\Z)', re.S)
+TRANSLATABLE_FRONT_MATTER_KEYS = ('title',)
+
+# 按顺序应用：先保护大块结构，再保护行内元素
+FENCED_CODE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})[^\n]*\n.*?(?:^ {0,3}\1[`~]*[ \t]*$|\Z)', re.M | re.S)
+DISPLAY_MATH_RE = re.compile(r'\$\$.+?\$\$', re.S)
+INLINE_CODE_RE = re.compile(r'(`+)(?!`).+?(?<!`)\1(?!`)')
+INLINE_MATH_RE = re.compile(r'(?<![\\$])\$(?![\s$])[^$\n]+?(?<![\s\\])\$(?!\d)')
+HTML_RE = re.compile(r'<!--.*?-->|</?[A-Za-z][^<>\n]*>', re.S)
+LINK_TARGET_RE = re.compile(r'(\]\()([^()\s]+(?:\s+"[^"\n]*")?)(\))')
+LINK_DEFINITION_RE = re.compile(r'^( {0,3}\[[^\]\n]+\]:[ \t]*)(\S+)', re.M)
+BARE_URL_RE = re.compile(r'https?://[^\s<>()\[\]"\'，。；、：）》⟦⟧]+')
+FOOTNOTE_REF_RE = re.compile(r'\[\^[^\]\s]+\]')
+
+
+class PlaceholderError(Exception):
+    """译文中的占位符缺失、重复或无法识别"""
+    pass
+
+
+def _placeholder(index: int) -> str:
+    return f'⟦{index}⟧'
+
+
+def protect(text: str) -> Tuple[str, List[str]]:
+    """
+    将代码块、行内代码、公式、HTML 标签、链接地址等无需翻译的内容替换为占位符
+
+    返回 (替换后的文本, 原始片段列表)，占位符 ⟦i⟧ 对应列表下标 i。
+    原文中已存在占位符字符时不做替换，避免还原时产生歧义。
+    """
+    if '⟦' in text or '⟧' in text:
+        return text, []
+
+    spans: List[str] = []
+
+    def stash(original: str) -> str:
+        spans.append(original)
+        return _placeholder(len(spans) - 1)
+
+    def stash_group(group: int) -> Callable[[re.Match], str]:
+        def replace(match: re.Match) -> str:
+            start, end = match.span(group)
+            whole_start = match.start()
+            matched = match.group(0)
+            return (matched[:start - whole_start]
+                    + stash(match.group(group))
+                    + matched[end - whole_start:])
+        return replace
+
+    front_matter = FRONT_MATTER_RE.match(text)
+    if front_matter:
+        lines = []
+        for line in front_matter.group(2).splitlines(keepends=True):
+            key = line.split(':', 1)[0].strip()
+            if key in TRANSLATABLE_FRONT_MATTER_KEYS:
+                lines.append(line)
+            else:
+                lines.append(stash(line.rstrip('\n')) + '\n')
+        text = (stash(front_matter.group(1).rstrip('\n')) + '\n'
+                + ''.join(lines)
+                + stash(front_matter.group(3))
+                + text[front_matter.end():])
+
+    text = FENCED_CODE_RE.sub(lambda m: stash(m.group(0)), text)
+    text = DISPLAY_MATH_RE.sub(lambda m: stash(m.group(0)), text)
+    text = INLINE_CODE_RE.sub(lambda m: stash(m.group(0)), text)
+    text = INLINE_MATH_RE.sub(lambda m: stash(m.group(0)), text)
+    text = HTML_RE.sub(lambda m: stash(m.group(0)), text)
+    text = LINK_TARGET_RE.sub(stash_group(2), text)
+    text = LINK_DEFINITION_RE.sub(stash_group(2), text)
+    text = BARE_URL_RE.sub(lambda m: stash(m.group(0)), text)
+    text = FOOTNOTE_REF_RE.sub(lambda m: stash(m.group(0)), text)
+    return text, spans
+
+
+def protect_like(text: str, masked: str, spans: List[str]) -> str:
+    """
+    用另一段文本 protect 得到的占位符替换 text 中逐字出现的相同内容
+
+    用于把旧原文、旧译文与新原文统一成相同的占位符。同一内容出现多次时按出现顺序
+    依次对应；text 中找不到的片段保持原样。
+    """
+    if not spans or '⟦' in text or '⟧' in text:
+        return text
+
+    def expand(span: str) -> str:
+        return PLACEHOLDER_RE.sub(lambda m: expand(spans[int(m.group(1))]), span)
+
+    # 只替换直接出现在 masked 中的占位符，嵌套在其他片段中的随外层一起替换
+    top_level = [int(m.group(1)) for m in PLACEHOLDER_RE.finditer(masked)]
+    originals = {index: expand(spans[index]) for index in top_level}
+    for index in sorted(top_level, key=lambda i: (-len(originals[i]), top_level.index(i))):
+        if originals[index]:
+            text = text.replace(originals[index], _placeholder(index), 1)
+    return text
+
+
+def has_prose(masked: str) -> bool:
+    """替换占位符后是否还有需要翻译的文字"""
+    return bool(LETTER_RE.search(PLACEHOLDER_RE.sub('', masked)))
+
+
+def restore(translated: str, spans: List[str]) -> str:
+    """
+    将译文中的占位符还原为原始片段
+
+    每个占位符必须恰好出现一次，否则抛出 PlaceholderError。
+    后替换的片段可能包含先前的占位符（如链接地址中的行内代码），还原时递归展开。
+    """
+    if not spans:
+        return translated
+
+    seen = [0] * len(spans)
+
+    def replace(match: re.Match) -> str:
+        index = int(match.group(1))
+        if index >= len(spans):
+            raise PlaceholderError(f"未知占位符：{match.group(0)}")
+        seen[index] += 1
+        return PLACEHOLDER_RE.sub(replace, spans[index])
+
+    restored = PLACEHOLDER_RE.sub(replace, translated)
+
+    missing = [_placeholder(i) for i, count in enumerate(seen) if count == 0]
+    duplicated = [_placeholder(i) for i, count in enumerate(seen) if count > 1]
+    if missing or duplicated:
+        raise PlaceholderError(
+            f"占位符校验失败：缺失 {missing[:5]}，重复 {duplicated[:5]}"
+        )
+    return restored
@@ -0,0 +1,249 @@
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# 报告中汇总分位数的请求阶段，单位为秒
+PHASES = ('queue_wait', 'ttfb', 'http', 'slot')
+
+
+def _tracer() -> Optional[Any]:
+    """OpenTelemetry tracer，可选依赖只在开启追踪时加载，未安装时不输出 span"""
+    try:
+        from opentelemetry import trace as otel_trace
+    except ImportError:
+        return None
+    return otel_trace.get_tracer(__name__)
+
+
+class RequestSample:
+    """
+    一次补全请求的测量值
+
+    时间点均为 time.monotonic()：started 进入限流器排队，acquired 取得并发名额，
+    first_byte 收到响应头，finished 读完响应体，released 释放并发名额。
+    """
+
+    __slots__ = ('kind', 'label', 'started', 'acquired', 'first_byte', 'finished', 'released', 'status',
+                 'finish_reason', 'bytes_out', 'bytes_in', 'prompt_tokens', 'completion_tokens', 'error')
+
+    def __init__(self, kind: str, label: str, bytes_out: int):
+        self.kind = kind
+        self.label = label
+        self.started = time.monotonic()
+        self.acquired: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.released: Optional[float] = None
+        self.status: Optional[int] = None
+        self.finish_reason: Optional[str] = None
+        self.bytes_out = bytes_out
+        self.bytes_in = 0
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]):
+        """记录 API 返回的 usage 字段，服务商未返回时保持为空"""
+        if usage:
+            self.prompt_tokens = usage.get('prompt_tokens')
+            self.completion_tokens = usage.get('completion_tokens')
+
+    def phases(self) -> Dict[str, Optional[float]]:
+        def span(start: Optional[float], end: Optional[float]) -> Optional[float]:
+            return end - start if start is not None and end is not None else None
+
+        return {
+            'queue_wait': span(self.started, self.acquired),
+            'ttfb': span(self.acquired, self.first_byte),
+            'http': span(self.acquired, self.finished),
+            'slot': span(self.acquired, self.released),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            'kind': self.kind,
+            'label': self.label,
+            'status': self.status,
+            'finish_reason': self.finish_reason,
+            'error': self.error,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+        }
+        record.update({
+            name: round(value, 4) if value is not None else None for name, value in self.phases().items()
+        })
+        return record
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """样本数、总和与 p50/p95/p99/最大值"""
+    if not values:
+        return {'count': 0, 'sum': 0.0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    if len(values) == 1:
+        p50 = p95 = p99 = values[0]
+    else:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {'count': len(values), 'sum': sum(values), 'p50': p50, 'p95': p95, 'p99': p99, 'max': max(values)}
+
+
+class RunMetrics:
+    """
+    一次翻译运行的结构化指标
+
+    逐请求记录排队、占用并发名额、首字节和完整响应的耗时，以及 usage 中的 token 数和收发字节数；
+    另有翻译记忆命中等计数器和逐文件结果。可导出为 JSON 运行报告或 Prometheus 文本格式，
+    启用 OpenTelemetry 时每个文件和请求各对应一个 span。
+    """
+
+    def __init__(self, tracing: bool = False):
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.requests: List[RequestSample] = []
+        self.files: List[Dict[str, Any]] = []
+        self.counters: Counter = Counter()
+        self.info: Dict[str, Any] = {}  # 运行参数等附加信息，原样写入报告
+        self.tracer = _tracer() if tracing else None
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """OpenTelemetry span，未启用时什么也不做"""
+        if self.tracer is None:
+            yield None
+            return
+        with self.tracer.start_as_current_span(name, attributes=attributes) as span:
+            yield span
+
+    @contextmanager
+    def track_request(self, kind: str, label: str, bytes_out: int) -> Iterator[RequestSample]:
+        """测量一次请求，退出时（包括异常）记录样本；调用方负责填写各时间点和响应信息"""
+        sample = RequestSample(kind, label, bytes_out)
+        with self.span('chat_completion', kind=kind, label=label) as span:
+            try:
+                yield sample
+            except BaseException as e:
+                sample.error = type(e).__name__
+                raise
+            finally:
+                if sample.acquired is not None and sample.released is None:
+                    sample.released = time.monotonic()
+                self.requests.append(sample)
+                if span is not None:
+                    for name, value in sample.to_dict().items():
+                        if value is not None and name not in ('kind', 'label'):
+                            span.set_attribute(name, value)
+
+    def record_file(self, path: str, status: str, seconds: float, attempts: int = 1, language: Optional[str] = None):
+        record = {'path': path, 'status': status, 'seconds': round(seconds, 3), 'attempts': attempts}
+        if language:
+            record['language'] = language
+        self.files.append(record)
+
+    def report(self) -> Dict[str, Any]:
+        """汇总为可序列化的运行报告"""
+        phases: Dict[str, List[float]] = {name: [] for name in PHASES}
+        for sample in self.requests:
+            for name, value in sample.phases().items():
+                if value is not None:
+                    phases[name].append(value)
+
+        by_outcome: Counter = Counter()
+        for sample in self.requests:
+            by_outcome[f"{sample.kind}:{sample.status if sample.status is not None else sample.error}"] += 1
+
+        totals = {
+            'requests': len(self.requests),
+            'failed_requests': sum(1 for sample in self.requests if sample.error),
+            'bytes_out': sum(sample.bytes_out for sample in self.requests),
+            'bytes_in': sum(sample.bytes_in for sample in self.requests),
+            'prompt_tokens': sum(sample.prompt_tokens or 0 for sample in self.requests),
+            'completion_tokens': sum(sample.completion_tokens or 0 for sample in self.requests),
+            'files_succeeded': sum(1 for record in self.files if record['status'] == 'done'),
+            'files_failed': sum(1 for record in self.files if record['status'] != 'done'),
+        }
+        return {
+            'started_at': self.started_at,
+            'wall_seconds': round(time.monotonic() - self._started, 3),
+            'info': self.info,
+            'totals': totals,
+            'counters': dict(self.counters),
+            'requests_by_outcome': dict(by_outcome),
+            'latency': {name: summarize(values) for name, values in phases.items()},
+            'requests': [sample.to_dict() for sample in self.requests],
+            'files': self.files,
+        }
+
+    def write_json(self, path: str):
+        """原子写出 JSON 运行报告"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_suffix(target.suffix + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        os.replace(temp_path, target)
+
+    def to_prometheus(self, prefix: str = 'translate') -> str:
+        """Prometheus 文本格式，可交给 node_exporter 的 textfile collector 或 Pushgateway"""
+        report = self.report()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value, *suffix in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                series = f"{prefix}_{name}{suffix[0] if suffix else ''}"
+                lines.append(f"{series}{{{label_text}}} {value}" if label_text else f"{series} {value}")
+
+        outcomes = []
+        for key, value in sorted(report['requests_by_outcome'].items()):
+            kind, _, outcome = key.partition(':')
+            outcomes.append(({'kind': kind, 'outcome': outcome}, value))
+        metric('requests_total', 'counter', 'Completion requests by kind and HTTP status or error', outcomes)
+
+        latency_samples = []
+        for phase, summary in report['latency'].items():
+            for key, quantile in (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')):
+                if summary[key] is not None:
+                    latency_samples.append(({'phase': phase, 'quantile': quantile}, summary[key]))
+            latency_samples.append(({'phase': phase}, summary['sum'], '_sum'))
+            latency_samples.append(({'phase': phase}, summary['count'], '_count'))
+        metric('request_seconds', 'summary', 'Per-request time by phase', latency_samples)
+
+        totals = report['totals']
+        metric('tokens_total', 'counter', 'Tokens reported in the API usage field', [
+            ({'type': 'prompt'}, totals['prompt_tokens']),
+            ({'type': 'completion'}, totals['completion_tokens']),
+        ])
+        metric('bytes_total', 'counter', 'Request and response body bytes', [
+            ({'direction': 'out'}, totals['bytes_out']),
+            ({'direction': 'in'}, totals['bytes_in']),
+        ])
+        metric('files_total', 'counter', 'Files by final status', [
+            ({'status': 'done'}, totals['files_succeeded']),
+            ({'status': 'failed'}, totals['files_failed']),
+        ])
+        metric('events_total', 'counter', 'Pipeline counters (memory hits, retries, throttles, ...)', [
+            ({'event': name}, value) for name, value in sorted(report['counters'].items())
+        ])
+        metric('run_seconds', 'gauge', 'Wall-clock duration of the run', [({}, report['wall_seconds'])])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_suffix(target.suffix + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, target)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+本地的 OpenAI 兼容补全服务，用于在不调用真实 API 的情况下测量翻译流程的性能
+
+把请求中的待翻译原文原样作为"译文"返回（占位符、打包标记都会保留，因此能走完整的校验流程），
+可配置首包延迟分布、输出速度，以及按比例注入 429、5xx 和截断的响应。
+
+    python translate/mock_server.py --port 8765 --latency 0.8 --tokens-per-second 80 --rate-429 0.05
+    python translate/full_translate.py --api-key test --base-url http://127.0.0.1:8765/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from aiohttp import web
+
+from masking import PLACEHOLDER_RE
+from prompt import BATCH_USER_PROMPT_TEMPLATE, CONTINUE_USER_PROMPT, EDIT_USER_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+
+def _template_pattern(template: str, field: str) -> Pattern:
+    """把提示词模板转换为正则，field 对应的字段作为捕获组，其余字段匹配任意内容"""
+    pattern = ''
+    for literal, name in re.findall(r'([^{]*)(?:\{(\w+)\})?', template):
+        pattern += re.escape(literal)
+        if name:
+            pattern += f'(?P<{name}>.*)' if name == field else '.*?'
+    return re.compile(pattern + '$', re.DOTALL)
+
+
+# 按顺序尝试，命中后取出应当"翻译"的部分；修改旧译文的请求返回新原文
+_ECHO_PATTERNS: List[Tuple[Pattern, str]] = [
+    (_template_pattern(EDIT_USER_PROMPT_TEMPLATE, 'new_source'), 'new_source'),
+    (_template_pattern(BATCH_USER_PROMPT_TEMPLATE, 'text'), 'text'),
+    (_template_pattern(USER_PROMPT_TEMPLATE, 'text'), 'text'),
+]
+
+
+def echo_text(content: str) -> str:
+    """从用户消息中取出待翻译的原文"""
+    for pattern, field in _ECHO_PATTERNS:
+        match = pattern.match(content)
+        if match:
+            return match.group(field)
+    return content
+
+
+def echo_messages(messages: List[Dict[str, Any]]) -> str:
+    """整个请求的"译文"；续写请求返回原请求的回显中尚未输出的部分"""
+    if len(messages) >= 3 and messages[-1].get('content') == CONTINUE_USER_PROMPT:
+        partial = messages[-2].get('content') or ''
+        return echo_text(messages[-3]['content'])[len(partial):]
+    return echo_text(messages[-1]['content'])
+
+
+class MockLLMServer:
+    """
+    可注入延迟与故障的补全服务
+
+    每个请求先等待服从对数正态分布的首包延迟（中位数为 latency 秒），再按 tokens_per_second
+    的速度输出（按一个字符一个 token 近似）。rate_429 / rate_5xx / truncate_rate 为注入
+    对应故障的概率，corrupt_rate 为删掉输出中一个占位符（使译文校验失败）的概率。
+    """
+
+    def __init__(self,
+                 latency: float = 0.5,
+                 latency_sigma: float = 0.5,
+                 tokens_per_second: float = 0,
+                 rate_429: float = 0.0,
+                 rate_5xx: float = 0.0,
+                 truncate_rate: float = 0.0,
+                 corrupt_rate: float = 0.0,
+                 retry_after: Optional[float] = 1.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second  # 0 表示不限输出速度
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.truncate_rate = truncate_rate
+        self.corrupt_rate = corrupt_rate
+        self.retry_after = retry_after  # 429 响应的 Retry-After 秒数，None 表示不带该响应头
+        self.random = random.Random(seed)
+        self.stats: Dict[str, int] = {
+            'requests': 0, 'ok': 0, 'throttled': 0, 'server_errors': 0,
+            'truncated': 0, 'corrupted': 0, 'prompt_chars': 0, 'completion_chars': 0
+        }
+
+    def _first_byte_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.latency * self.random.lognormvariate(0, self.latency_sigma)
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt_chars = sum(len(message.get('content') or '') for message in body.get('messages', []))
+        self.stats['requests'] += 1
+        self.stats['prompt_chars'] += prompt_chars
+
+        roll = self.random.random()
+        if roll < self.rate_429:
+            self.stats['throttled'] += 1
+            headers = {'Retry-After': f"{self.retry_after:g}"} if self.retry_after is not None else {}
+            return web.json_response({'error': {'message': 'rate limited'}}, status=429, headers=headers)
+        if roll < self.rate_429 + self.rate_5xx:
+            self.stats['server_errors'] += 1
+            await asyncio.sleep(self._first_byte_delay())
+            return web.json_response({'error': {'message': 'overloaded'}}, status=503)
+
+        output = echo_messages(body['messages'])
+        finish_reason = 'stop'
+        if PLACEHOLDER_RE.search(output) and self.random.random() < self.corrupt_rate:
+            output = PLACEHOLDER_RE.sub('', output, count=1)
+            self.stats['corrupted'] += 1
+        if output and self.random.random() < self.truncate_rate:
+            output, finish_reason = output[:self.random.randrange(len(output))], 'length'
+            self.stats['truncated'] += 1
+        self.stats['ok'] += 1
+        self.stats['completion_chars'] += len(output)
+        usage = {'prompt_tokens': prompt_chars, 'completion_tokens': len(output)}
+
+        await asyncio.sleep(self._first_byte_delay())
+        if not body.get('stream'):
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(len(output) / self.tokens_per_second)
+            return web.json_response({
+                'choices': [{'message': {'role': 'assistant', 'content': output}, 'finish_reason': finish_reason}],
+                'usage': usage
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        step = 16
+        started = time.monotonic()
+        try:
+            await response.prepare(request)
+            for start in range(0, len(output), step):
+                if self.tokens_per_second > 0:
+                    # 按累计输出量计算应到达的时间，避免逐段 sleep 累积误差
+                    delay = started + (start + step) / self.tokens_per_second - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self._send_event(response, {'choices': [{'delta': {'content': output[start:start + step]},
+                                                               'finish_reason': None}]})
+            await self._send_event(response, {'choices': [{'delta': {}, 'finish_reason': finish_reason}],
+                                              'usage': usage})
+            await response.write(b'data: [DONE]\n\n')
+        except ConnectionResetError:
+            pass  # 客户端取消了请求（例如同一文档的其他片段失败）
+        return response
+
+    @staticmethod
+    async def _send_event(response: web.StreamResponse, event: Dict[str, Any]):
+        await response.write(b'data: ' + json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n\n')
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self.handle_completion)
+        app.router.add_get('/stats', self.handle_stats)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[web.AppRunner, str]:
+        """在当前事件循环中启动服务，返回 (runner, 补全接口地址)；port 为 0 时自动选择空闲端口"""
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://{host}:{bound_port}/v1/chat/completions"
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """mock 服务的延迟与故障注入参数，供 benchmark.py 复用"""
+    parser.add_argument("--latency", type=float, default=0.5, help="首包延迟的中位数（秒）(默认：0.5)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="首包延迟对数正态分布的 sigma，越大长尾越明显 (默认：0.5)")
+    parser.add_argument("--tokens-per-second", type=float, default=0,
+                        help="每个请求的输出速度（按字符近似 token），0 表示不限 (默认：0)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的概率 (默认：0)")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="返回 503 的概率 (默认：0)")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="输出被截断（finish_reason 为 length）的概率 (默认：0)")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0,
+                        help="删掉输出中一个占位符、使译文校验失败的概率 (默认：0)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数 (默认：1)")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子，便于复现")
+
+
+def server_from_args(args: argparse.Namespace) -> MockLLMServer:
+    return MockLLMServer(
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        truncate_rate=args.truncate_rate,
+        corrupt_rate=args.corrupt_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容的 mock 补全服务')
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认：127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口 (默认：8765)")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args)
+    logger.info(f"mock 服务地址：http://{args.host}:{args.port}/v1/chat/completions，统计：/stats")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
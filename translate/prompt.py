@@ -0,0 +1,140 @@
+import hashlib
+from typing import Dict, List
+
+from languages import DEFAULT_LANGUAGE, LANGUAGES, Language
+
+MODEL = "Pro/deepseek-ai/DeepSeek-R1"
+
+# OpenAI 兼容的补全接口地址，可指向其他服务商或本地的 mock_server.py
+BASE_URL = "https://api.siliconflow.cn/v1/chat/completions"
+
+SYSTEM_PROMPT_TEMPLATE = (
+    "你是一位专业的计算机科学和技术文档翻译专家，专门负责将中文技术文档翻译成{language}。\n\n"
+    "翻译任务：将以下中文 Markdown 文档翻译成{language}，保持技术准确性和可读性。\n\n"
+    "核心要求：\n"
+    "1. 目标语言：{variety}\n"
+    "2. 完全保留所有 Markdown 格式、语法和结构\n"
+    "3. 绝不修改任何代码块（```...```）或行内代码（`...`）\n"
+    "4. 保留所有 URL、链接和 YAML front matter 完全不变\n"
+    "5. 保持技术术语的一致性和准确性\n"
+    "6. 使用专业、清晰、自然的{language}表达\n"
+    "7. 保持原文的逻辑结构和段落组织\n"
+    "8. 对于数学公式、算法描述等保持精确性\n"
+    "9. 请检查翻译内容的头尾是否符合原文件的格式\n"
+    "10. 形如 ⟦1⟧ 的占位符代表受保护的代码、公式或链接，必须原样保留在译文中的对应位置，不得翻译、删除、合并或新增\n\n"
+    "技术术语表（必须遵循）：\n{glossary}\n\n"
+    "当前翻译文件：{file_path}\n\n"
+    "请直接输出翻译后的{language}内容，不要添加任何解释或注释。"
+)
+
+USER_PROMPT_TEMPLATE = "请将以下中文技术文档翻译成{language}：\n\n{text}"
+
+BATCH_USER_PROMPT_TEMPLATE = (
+    "以下是 {count} 个相互独立的中文技术文档片段，每个片段以 <<<SECTION n>>> 标记行开头。"
+    "请逐个翻译成{language}，原样保留每个标记行及其顺序，不要合并、拆分或省略片段：\n\n{text}"
+)
+
+# 修改已有译文的简短提示词，用于原文只有少量改动的片段
+EDIT_SYSTEM_PROMPT_TEMPLATE = (
+    "你负责维护中文技术文档的{language}译文。原文有少量修改，请在已有译文上做最小改动使其与新原文一致，"
+    "未改动部分的措辞保持不变。保留 Markdown 格式和形如 ⟦1⟧ 的占位符。\n\n"
+    "技术术语表（必须遵循）：\n{glossary}\n\n"
+    "当前翻译文件：{file_path}\n\n"
+    "只输出修改后的完整译文，不要添加任何解释。"
+)
+
+EDIT_USER_PROMPT_TEMPLATE = "旧原文：\n{old_source}\n\n新原文：\n{new_source}\n\n已有译文：\n{old_translation}"
+
+# 输出被 max_tokens 截断时追加在已输出内容之后，请求模型接着输出；拼接后的译文与一次
+# 完整输出相同，因此不计入提示词哈希
+CONTINUE_USER_PROMPT = "输出在此处被截断。请从截断处继续输出剩余部分，不要重复已输出的内容，也不要添加任何说明。"
+
+
+def localize(template: str, language: Language) -> str:
+    """填入目标语言，其余字段留给 format"""
+    return template.replace("{language}", language.name).replace("{variety}", language.variety)
+
+
+def prompt_hash(language: Language) -> str:
+    """
+    填入目标语言后的提示词模板的内容哈希
+
+    模板任何改动都会使翻译记忆中的旧译文失效；不同目标语言的哈希不同，译文互不混用。
+    """
+    return hashlib.sha256(
+        "\0".join(
+            localize(template, language) for template in (
+                SYSTEM_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE, BATCH_USER_PROMPT_TEMPLATE,
+                EDIT_SYSTEM_PROMPT_TEMPLATE, EDIT_USER_PROMPT_TEMPLATE
+            )
+        ).encode('utf-8')
+    ).hexdigest()[:16]
+
+
+PROMPT_HASH = prompt_hash(LANGUAGES[DEFAULT_LANGUAGE])
+
+
+def build_messages(text: str,
+                   glossary_text: str,
+                   file_path: str,
+                   language: Language = LANGUAGES[DEFAULT_LANGUAGE]) -> List[Dict[str, str]]:
+    """组装一次翻译请求的消息列表"""
+    return [
+        {
+            "role": "system",
+            "content": localize(SYSTEM_PROMPT_TEMPLATE, language).format(glossary=glossary_text, file_path=file_path)
+        },
+        {
+            "role": "user",
+            "content": localize(USER_PROMPT_TEMPLATE, language).format(text=text)
+        }
+    ]
+
+
+def build_batch_messages(packed_text: str,
+                         count: int,
+                         glossary_text: str,
+                         label: str,
+                         language: Language = LANGUAGES[DEFAULT_LANGUAGE]) -> List[Dict[str, str]]:
+    """组装一次打包翻译请求的消息列表"""
+    return [
+        {
+            "role": "system",
+            "content": localize(SYSTEM_PROMPT_TEMPLATE, language).format(glossary=glossary_text, file_path=label)
+        },
+        {
+            "role": "user",
+            "content": localize(BATCH_USER_PROMPT_TEMPLATE, language).format(count=count, text=packed_text)
+        }
+    ]
+
+
+def build_continue_messages(messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+    """在原请求后附上已输出的部分，组装续写请求的消息列表"""
+    return messages + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUE_USER_PROMPT}
+    ]
+
+
+def build_edit_messages(old_source: str,
+                        new_source: str,
+                        old_translation: str,
+                        glossary_text: str,
+                        file_path: str,
+                        language: Language = LANGUAGES[DEFAULT_LANGUAGE]) -> List[Dict[str, str]]:
+    """组装一次修改已有译文请求的消息列表"""
+    return [
+        {
+            "role": "system",
+            "content": localize(EDIT_SYSTEM_PROMPT_TEMPLATE, language).format(
+                glossary=glossary_text, file_path=file_path
+            )
+        },
+        {
+            "role": "user",
+            "content": EDIT_USER_PROMPT_TEMPLATE.format(
+                old_source=old_source, new_source=new_source, old_translation=old_translation
+            )
+        }
+    ]
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """令牌桶：以固定速率补充，容量即允许的突发量"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def take(self, amount: float = 1.0):
+        """取出 amount 个令牌，不足时等待补充（先到先得）"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    所有请求共享的自适应限流器
+
+    并发窗口按 AIMD 调整：每个成功请求使窗口增加 additive_step / 窗口大小（约每轮增加
+    additive_step），遇到限流或服务端过载时乘以 backoff_factor。限流时所有请求统一暂停到
+    Retry-After 指定的时间，避免各自退避后同时重试。可选的令牌桶限制每分钟请求数和 token 数。
+    """
+
+    def __init__(self,
+                 max_concurrent: int,
+                 min_concurrent: int = 1,
+                 initial_concurrent: Optional[int] = None,
+                 additive_step: float = 1.0,
+                 backoff_factor: float = 0.5,
+                 cooldown: float = 2.0,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        self.max_limit = float(max_concurrent)
+        self.min_limit = float(min(min_concurrent, max_concurrent))
+        self.limit = float(initial_concurrent or max_concurrent)
+        self.additive_step = additive_step
+        self.backoff_factor = backoff_factor
+        self.cooldown = cooldown  # 没有 Retry-After 时的统一暂停秒数
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._last_backoff = 0.0
+        self._cond = asyncio.Condition()
+        self.request_bucket = (
+            TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        )
+
+    @asynccontextmanager
+    async def slot(self, tokens: float = 0) -> AsyncIterator[None]:
+        """占用一个并发名额发送请求，tokens 为本次请求预计消耗的 token 数"""
+        if self.request_bucket:
+            await self.request_bucket.take(1)
+        if self.token_bucket and tokens:
+            await self.token_bucket.take(tokens)
+        await self._acquire()
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    async def _acquire(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._cond:
+                if self.paused_until > time.monotonic():
+                    continue
+                if self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                await self._cond.wait()
+
+    def record_success(self):
+        """请求成功：加性增大并发窗口"""
+        self.limit = min(self.max_limit, self.limit + self.additive_step / max(self.limit, 1.0))
+
+    def record_throttle(self, retry_after: Optional[float] = None, pause: bool = True):
+        """
+        请求被限流或服务端过载：乘性缩小并发窗口
+
+        pause 为 True 时所有请求统一暂停到 Retry-After 指定的时间（没有时暂停 cooldown 秒）；
+        偶发的 5xx 或超时只缩小窗口，不暂停。
+        """
+        self.throttled += 1
+        now = time.monotonic()
+        if pause or retry_after is not None:
+            self.paused_until = max(self.paused_until, now + (self.cooldown if retry_after is None else retry_after))
+        # 同一次拥塞会让多个在途请求同时失败，一个暂停周期内只缩小一次
+        if now >= self._last_backoff:
+            self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+            self._last_backoff = max(self.paused_until, now + 1.0)
@@ -0,0 +1,184 @@
+import re
+from typing import List, Optional, Tuple
+
+# 单个翻译片段的默认最大字符数（中文约 1~1.5 token/字，留足 max_tokens 余量）
+DEFAULT_CHUNK_SIZE = 2000
+
+HEADING_RE = re.compile(r'^ {0,3}#{1,6}(?:[ \t]|$)')
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+LIST_ITEM_RE = re.compile(r'^ {0,3}(?:[-*+]|\d+[.)])[ \t]')
+PADDING_RE = re.compile(r'^(\n*)(.*?)(\s*)$', re.DOTALL)
+
+
+def _front_matter_end(lines: List[str]) -> int:
+    """返回 YAML front matter 结束后的行号，没有 front matter 时返回 0"""
+    if not lines or lines[0].strip() != '---':
+        return 0
+    for i in range(1, len(lines)):
+        if lines[i].strip() == '---':
+            return i + 1
+    return 0
+
+
+def _closes_fence(stripped: str, fence: str) -> bool:
+    """判断该行是否关闭当前代码围栏"""
+    return stripped.startswith(fence) and set(stripped) == {fence[0]}
+
+
+def split_blocks(text: str) -> List[str]:
+    """
+    将 Markdown 切分为不可再分的块，所有块按顺序拼接后与原文完全一致
+
+    切分点只落在 front matter 之后、标题前后以及空行分隔的段落之间，
+    绝不会落在代码围栏（```/~~~）或 $$...$$ 公式内部；段落内部不切分，
+    因此行内的 $...$ 公式也不会被截断。
+    """
+    lines = text.splitlines(keepends=True)
+    blocks: List[str] = []
+    current: List[str] = []
+
+    start = _front_matter_end(lines)
+    if start:
+        blocks.append(''.join(lines[:start]))
+
+    fence: Optional[str] = None
+    in_math = False
+    closed = False  # 当前块已遇到空行或为标题，下一个非空行开启新块
+
+    for line in lines[start:]:
+        stripped = line.strip()
+
+        if fence:
+            current.append(line)
+            if _closes_fence(stripped, fence):
+                fence = None
+            continue
+
+        if in_math:
+            current.append(line)
+            if stripped.count('$$') % 2 == 1:
+                in_math = False
+            continue
+
+        if not stripped:
+            # 空行归属于前一个块的尾部
+            if not current and blocks:
+                blocks[-1] += line
+            else:
+                current.append(line)
+                closed = bool(current) and any(l.strip() for l in current)
+            continue
+
+        is_heading = bool(HEADING_RE.match(line))
+        if current and (closed or is_heading):
+            blocks.append(''.join(current))
+            current = []
+        closed = is_heading
+        current.append(line)
+
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+        elif stripped.count('$$') % 2 == 1:
+            in_math = True
+
+    if current:
+        blocks.append(''.join(current))
+    return blocks
+
+
+def _split_oversized(block: str, max_chars: int) -> List[str]:
+    """把没有空行分隔的超长列表按列表项切开，含代码或公式的块保持完整"""
+    if len(block) <= max_chars or '```' in block or '~~~' in block or '$$' in block:
+        return [block]
+
+    pieces: List[str] = []
+    current = ''
+    for line in block.splitlines(keepends=True):
+        if current and LIST_ITEM_RE.match(line):
+            pieces.append(current)
+            current = ''
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def segment_markdown(text: str, max_chars: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """切分为翻译记忆使用的最小片段：Markdown 块，超长紧凑列表再按列表项切开"""
+    return [piece for block in split_blocks(text) for piece in _split_oversized(block, max_chars)]
+
+
+def group_segments(segments: List[str], max_chars: int = DEFAULT_CHUNK_SIZE, offset: int = 0) -> List[List[int]]:
+    """
+    将片段贪心合并为不超过 max_chars 的请求，返回每组片段的下标（加上 offset）
+
+    超过一半容量时优先在标题处切分，使每组尽量保持完整小节；
+    超长的单个片段（如大段代码）单独成组，不会被强行截断。
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+
+    for i, segment in enumerate(segments):
+        if current:
+            too_large = size + len(segment) > max_chars
+            at_heading = HEADING_RE.match(segment) and size >= max_chars // 2
+            if too_large or at_heading:
+                groups.append(current)
+                current = []
+                size = 0
+        current.append(offset + i)
+        size += len(segment)
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+def chunk_markdown(text: str, max_chars: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """
+    将文档切分为不超过 max_chars 的片段，片段按顺序拼接后与原文完全一致
+
+    超长的紧凑列表按列表项切分，超长的代码或公式块保持完整，不会被强行截断。
+    """
+    segments = segment_markdown(text, max_chars)
+    return [''.join(segments[i] for i in group) for group in group_segments(segments, max_chars)]
+
+
+def block_shape(block: str) -> str:
+    """块的结构特征，用于确认原文块与译文块一一对应"""
+    first_line = block.lstrip('\n').split('\n', 1)[0]
+    stripped = first_line.strip()
+    if stripped == '---':
+        return 'front_matter'
+    if HEADING_RE.match(first_line):
+        return 'heading' + str(len(stripped) - len(stripped.lstrip('#')))
+    if FENCE_RE.match(first_line):
+        return 'fence'
+    if stripped.startswith('$$'):
+        return 'math'
+    if LIST_ITEM_RE.match(first_line):
+        return 'list'
+    return 'text'
+
+
+def align_blocks(source_blocks: List[str], translated: str) -> Optional[List[str]]:
+    """把译文按块切开并与原文块一一对应，数量或结构不一致时返回 None"""
+    translated_blocks = split_blocks(translated)
+    if len(translated_blocks) != len(source_blocks):
+        return None
+    if [block_shape(b) for b in source_blocks] != [block_shape(b) for b in translated_blocks]:
+        return None
+    return translated_blocks
+
+
+def split_padding(chunk: str) -> Tuple[str, str, str]:
+    """拆出片段首尾的空白，返回 (前导换行, 正文, 尾随空白)"""
+    lead, body, trail = PADDING_RE.match(chunk).groups()
+    return lead, body, trail
+
+
+def restore_padding(lead: str, translated: str, trail: str) -> str:
+    """用原片段的首尾空白包裹译文，保证片段拼接后段落间距不变"""
+    return lead + translated.lstrip('\n').rstrip() + trail
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+命令行冷启动时间基准测试
+
+在全新的子进程中反复运行不发送请求的命令（--help、--estimate、没有改动的自动翻译等），报告耗时的
+中位数以及扣除 Python 解释器自身启动时间后的额外开销；再用 -X importtime 检查这些路径没有加载
+aiohttp、GitPython、PyGithub。额外开销超出预算或加载了不该加载的依赖时返回非零退出码。
+
+    python translate/startup_benchmark.py
+    python translate/startup_benchmark.py --runs 20 --budget-scale 2 --output startup.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Set
+
+from translation_index import TranslationIndex
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+
+# 只有发送请求、操作 Git 仓库或创建 PR 时才需要的依赖
+HEAVY_MODULES = ('aiohttp', 'git', 'github')
+
+SAMPLE_SOURCE = """---
+title: 示例
+---
+
+# 标题
+
+一段用于测试启动时间的正文，包含 `inline code` 和 [链接](https://example.com)。
+"""
+
+
+class Case(NamedTuple):
+    name: str
+    argv: List[str]  # 相对 translate 目录的脚本及其参数
+    budget_ms: float  # 扣除解释器启动时间后允许的额外开销
+    forbidden: Set[str]  # 不允许加载的模块（含其子模块）
+
+
+CASES = [
+    Case('full_translate --help', ['full_translate.py', '--help'], 80, set(HEAVY_MODULES)),
+    Case('full_translate --estimate', ['full_translate.py', '--estimate'], 120, set(HEAVY_MODULES)),
+    Case('github_translator --help', ['github_translator.py', '--help'], 40, set(HEAVY_MODULES)),
+    Case('github_translator（无改动）', ['github_translator.py'], 60, set(HEAVY_MODULES)),
+    Case('watch_translate --help', ['watch_translate.py', '--help'], 80, set(HEAVY_MODULES)),
+    Case('validation --help', ['validation.py', '--help'], 40, set(HEAVY_MODULES)),
+]
+
+
+def make_fixture(root: Path):
+    """
+    创建一个译文已是最新的小仓库：源目录、译文、翻译索引，以及记录 HEAD 的状态文件
+
+    github_translator 在这里运行时不需要做任何事，--estimate 也只需读取几个小文件。
+    """
+    for rel_path in ('index.md', 'blog/post.md'):
+        for tree in ('trees', 'tree_en'):
+            path = root / tree / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(SAMPLE_SOURCE, encoding='utf-8')
+    index = TranslationIndex(str(root / 'trees'), str(root / 'tree_en'))
+    index.rebuild()
+    index.save()
+
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost', *args],
+            cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    git('init', '-q')
+    git('add', '-A')
+    git('commit', '-q', '-m', 'fixture')
+    with open(root / 'tree_en' / '.translation_state.json', 'w', encoding='utf-8') as f:
+        json.dump({'last_commit': git('rev-parse', 'HEAD'), 'run_id': 'bench'}, f)
+
+
+def script_argv(case: Case) -> List[str]:
+    return [str(SCRIPT_DIR / case.argv[0]), *case.argv[1:]]
+
+
+def run_command(argv: List[str], cwd: Path, env: Dict[str, str]) -> float:
+    """用当前解释器运行一次命令，返回耗时（秒）；命令失败时抛出异常"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *argv], cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} 退出码 {result.returncode}：{result.stderr.strip()[-500:]}")
+    return elapsed
+
+
+def imported_modules(argv: List[str], cwd: Path, env: Dict[str, str]) -> Set[str]:
+    """用 -X importtime 运行一次命令，返回实际加载的模块名"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *argv], cwd=cwd, env=env, capture_output=True, text=True
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            modules.add(line.rsplit('|', 1)[1].strip())
+    return modules
+
+
+def measure(argv: List[str], cwd: Path, env: Dict[str, str], runs: int) -> List[float]:
+    run_command(argv, cwd, env)  # 预热文件系统缓存和字节码缓存
+    return [run_command(argv, cwd, env) for _ in range(runs)]
+
+
+def run_benchmark(runs: int, budget_scale: float) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory(prefix='translate-startup-') as work_dir:
+        root = Path(work_dir)
+        make_fixture(root)
+        env = {key: value for key, value in os.environ.items() if not key.startswith('GITHUB_')}
+        env['API_KEY'] = 'benchmark'
+
+        interpreter = statistics.median(measure(['-c', 'pass'], root, env, runs))
+        results = []
+        for case in CASES:
+            if case.argv[0].startswith('github_translator') and shutil.which('git') is None:
+                logger.warning(f"未找到 git，跳过 {case.name}")
+                continue
+            timings = measure(script_argv(case), root, env, runs)
+            median = statistics.median(timings)
+            loaded = imported_modules(script_argv(case), root, env)
+            heavy = sorted(
+                name for name in case.forbidden
+                if any(module == name or module.startswith(name + '.') for module in loaded)
+            )
+            results.append({
+                'name': case.name,
+                'median_ms': median * 1000,
+                'min_ms': min(timings) * 1000,
+                'overhead_ms': (median - interpreter) * 1000,
+                'budget_ms': case.budget_ms * budget_scale,
+                'heavy_modules': heavy,
+            })
+        for result in results:
+            result['interpreter_ms'] = interpreter * 1000
+        return results
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    header = f"{'命令':<28} {'中位数(ms)':>10} {'最快(ms)':>9} {'额外开销(ms)':>12} {'预算(ms)':>9}  加载的重量级依赖"
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r['name']:<28} {r['median_ms']:>10.1f} {r['min_ms']:>9.1f} {r['overhead_ms']:>12.1f} "
+            f"{r['budget_ms']:>9.0f}  {', '.join(r['heavy_modules']) or '-'}"
+        )
+    if results:
+        lines.append(f"（Python 解释器自身启动：{results[0]['interpreter_ms']:.1f}ms）")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='翻译脚本冷启动时间基准测试')
+    parser.add_argument("--runs", type=int, default=10, help="每条命令运行的次数 (默认：10)")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="把所有时间预算乘以该系数，用于较慢的机器 (默认：1)")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.runs, args.budget_scale)
+    print(format_table(results))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, ensure_ascii=False)
+        logger.info(f"结果已写入 {args.output}")
+
+    failures = []
+    for result in results:
+        if result['heavy_modules']:
+            failures.append(f"{result['name']} 加载了 {', '.join(result['heavy_modules'])}")
+        if result['overhead_ms'] > result['budget_ms']:
+            failures.append(f"{result['name']} 额外开销 {result['overhead_ms']:.1f}ms，预算 {result['budget_ms']:.0f}ms")
+    for failure in failures:
+        logger.error(f"启动时间回退 - {failure}")
+    if failures:
+        sys.exit(1)
+    logger.info("所有命令都在启动时间预算内")
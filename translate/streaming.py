@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from core import lazy_import
+
+aiohttp = lazy_import("aiohttp")
+
+
+async def iter_sse_data(content: aiohttp.StreamReader, stall_timeout: float) -> AsyncIterator[str]:
+    """
+    逐个产出 SSE 事件的 data 字段
+
+    两个事件之间超过 stall_timeout 秒没有新数据时抛出 asyncio.TimeoutError，
+    只有注释行（keep-alive）不算作进展。
+    """
+    data_lines = []
+    last_event = time.monotonic()
+    while True:
+        remaining = last_event + stall_timeout - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"流式响应 {stall_timeout:.0f} 秒内没有新数据")
+        try:
+            raw = await asyncio.wait_for(content.readline(), remaining)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"流式响应 {stall_timeout:.0f} 秒内没有新数据")
+        if not raw:
+            if data_lines:
+                yield '\n'.join(data_lines)
+            return
+
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data_lines:
+                yield '\n'.join(data_lines)
+                data_lines = []
+                last_event = time.monotonic()
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        if field == 'data':
+            data_lines.append(value[1:] if value.startswith(' ') else value)
+
+
+async def read_stream_completion(response: aiohttp.ClientResponse,
+                                 stall_timeout: float,
+                                 on_delta: Optional[Callable[[str], None]] = None
+                                 ) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+    """读取流式补全响应，返回 (完整输出, finish_reason, usage)；usage 通常只出现在最后一个事件中"""
+    parts = []
+    finish_reason = None
+    usage = None
+    async for data in iter_sse_data(response.content, stall_timeout):
+        if data.strip() == '[DONE]':
+            break
+        event = json.loads(data)
+        if 'error' in event:
+            raise aiohttp.ClientPayloadError(str(event['error']))
+        if event.get('usage'):
+            usage = event['usage']
+        for choice in event.get('choices') or []:
+            delta = choice.get('delta') or {}
+            text = delta.get('content')
+            if text:
+                parts.append(text)
+                if on_delta:
+                    on_delta(text)
+            if choice.get('finish_reason'):
+                finish_reason = choice['finish_reason']
+    return ''.join(parts), finish_reason, usage
+
+
+class ProgressiveWriter:
+    """按文档顺序把已完成的片段写入临时文件，全部完成后原子替换目标文件"""
+
+    def __init__(self, output_file: Path):
+        self.output_file = output_file
+        self.temp_path = output_file.with_suffix('.tmp')
+        self.file = open(self.temp_path, 'w', encoding='utf-8', newline='')
+        self.pending: Dict[int, str] = {}
+        self.next_index = 0
+        self.total = 0
+
+    def expect(self, total: int):
+        """设置文档的片段总数"""
+        self.total = total
+
+    def put(self, index: int, text: str):
+        """登记第 index 个片段的译文，并写出所有已连续完成的片段"""
+        self.pending[index] = text
+        while self.next_index in self.pending:
+            self.file.write(self.pending.pop(self.next_index))
+            self.next_index += 1
+        self.file.flush()
+
+    def commit(self):
+        """确认所有片段均已写出，替换目标文件"""
+        if self.next_index != self.total:
+            raise ValueError(f"仍有 {self.total - self.next_index} 个片段未完成")
+        self.file.close()
+        self.temp_path.replace(self.output_file)
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self.file.close()
+        self.temp_path.unlink(missing_ok=True)
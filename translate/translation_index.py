@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".translation_index.json"
+
+
+def content_hash(path: Path) -> str:
+    """文件内容的 sha256"""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class TranslationIndex:
+    """
+    原文哈希到译文哈希的索引，随译文目录一起提交
+
+    记录每个源文件（源目录相对路径）上次翻译时的内容哈希和生成的译文哈希。
+    源文件哈希一致且译文仍存在的文件无需重新翻译，一次遍历即可判断所有文件是否过期。
+    """
+
+    def __init__(self,
+                 source_dir: str,
+                 target_dir: str,
+                 index_path: Optional[str] = None,
+                 source_hash: Callable[[Path], str] = content_hash):
+        self.source_dir = Path(source_dir)
+        self.source_hash = source_hash  # 可传入带缓存的实现，多个目标语言共享源文件哈希
+        self.target_dir = Path(target_dir)
+        self.path = Path(index_path) if index_path else self.target_dir / INDEX_FILENAME
+        self.entries: Dict[str, Dict[str, str]] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"翻译索引读取失败，视为空索引：{str(e)}")
+
+    def is_stale(self, rel_path: str) -> bool:
+        """源文件相对上次翻译有改动、从未翻译过或译文缺失时返回 True"""
+        entry = self.entries.get(rel_path)
+        if entry is None or not (self.target_dir / rel_path).exists():
+            return True
+        return entry.get('source') != self.source_hash(self.source_dir / rel_path)
+
+    def stale_files(self, rel_paths: Optional[Iterable[str]] = None) -> List[str]:
+        """返回需要重新翻译的文件，默认检查源目录下的全部 Markdown 文件"""
+        if rel_paths is None:
+            rel_paths = sorted(p.relative_to(self.source_dir).as_posix() for p in self.source_dir.rglob('*.md'))
+        return [rel_path for rel_path in rel_paths if self.is_stale(rel_path)]
+
+    def update(self, rel_path: str):
+        """记录文件当前的原文与译文哈希"""
+        self.entries[rel_path] = {
+            'source': self.source_hash(self.source_dir / rel_path),
+            'output': content_hash(self.target_dir / rel_path)
+        }
+
+    def remove(self, rel_path: str):
+        self.entries.pop(rel_path, None)
+
+    def save(self):
+        """按路径排序写出，便于在提交中审阅差异"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(self.entries.items())), f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        os.replace(temp_path, self.path)
+
+    def rebuild(self) -> int:
+        """把所有已有译文的源文件登记为已翻译，返回登记的文件数"""
+        self.entries = {}
+        for source_file in self.source_dir.rglob('*.md'):
+            rel_path = source_file.relative_to(self.source_dir).as_posix()
+            if (self.target_dir / rel_path).exists():
+                self.update(rel_path)
+        return len(self.entries)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='原文与译文哈希索引管理')
+    parser.add_argument("--source-dir", default="trees", help="源目录路径 (默认：trees)")
+    parser.add_argument("--target-dir", default="tree_en", help="目标目录路径 (默认：tree_en)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="列出需要重新翻译的文件")
+    subparsers.add_parser("rebuild", help="以当前译文为准重建索引（首次启用时使用）")
+    args = parser.parse_args()
+
+    index = TranslationIndex(args.source_dir, args.target_dir)
+    if args.command == "status":
+        stale = index.stale_files()
+        for rel_path in stale:
+            print(rel_path)
+        logger.info(f"{len(stale)} 个文件需要重新翻译")
+    elif args.command == "rebuild":
+        logger.info(f"已登记 {index.rebuild()} 个文件")
+        index.save()
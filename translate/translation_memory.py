@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from glossary import Glossary
+from languages import DEFAULT_LANGUAGE, LANGUAGES, language_path
+from prompt import MODEL
+from segmenter import align_blocks, group_segments, split_padding, restore_padding
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = ".translation_memory.sqlite3"
+DEFAULT_MAX_ENTRIES = 100_000
+# 记忆键的组成方式发生变化时递增
+KEY_SCHEMA_VERSION = "2"
+
+# SQLite 单条语句的参数上限为 999，批量查询按此分批
+_SQL_BATCH = 900
+_TRAILING_SPACE_RE = re.compile(r'[ \t]+$', re.M)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 模糊匹配：字符 3-gram 的 bottom-k 草图，共享至少 FUZZY_MIN_SHARED 个草图值的条目才逐一比较
+DEFAULT_FUZZY_THRESHOLD = 0.85
+FUZZY_MIN_LENGTH = 20
+FUZZY_SKETCH_SIZE = 16
+FUZZY_MIN_SHARED = 4
+_FUZZY_CANDIDATES = 8
+
+
+def normalize_segment(text: str) -> str:
+    """规范化片段文本：统一换行、去掉行尾空白和首尾空行"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return _TRAILING_SPACE_RE.sub('', text).strip('\n')
+
+
+def compute_key(model: str, prompt_version: str, glossary_hash: str, normalized: str) -> str:
+    """由模型、提示词模板哈希、相关术语哈希和规范化原文计算内容寻址的记忆键"""
+    material = "\0".join((KEY_SCHEMA_VERSION, model, prompt_version, glossary_hash, normalized))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def sketch(text: str) -> List[int]:
+    """文本字符 3-gram 哈希值中最小的 FUZZY_SKETCH_SIZE 个（bottom-k MinHash），相似文本的草图高度重合"""
+    compact = _WHITESPACE_RE.sub(' ', text)
+    shingles = {zlib.crc32(compact[i:i + 3].encode('utf-8')) for i in range(max(len(compact) - 2, 1))}
+    return sorted(shingles)[:FUZZY_SKETCH_SIZE]
+
+
+class TranslationMemory:
+    """
+    基于 SQLite 的片段级翻译记忆
+
+    以 (规范化原文, 模型, 提示词模板哈希, 片段中出现的术语条目哈希) 为键存储译文，
+    术语表改动只会使包含相应术语的片段失效。支持整篇文档一次批量查询、
+    近似原文的模糊匹配、按条数或时间淘汰、选择性失效以及 JSONL 导入导出。
+    """
+
+    def __init__(self,
+                 model: str,
+                 prompt_version: str,
+                 glossary: Optional[Glossary] = None,
+                 db_path: str = DEFAULT_DB_PATH,
+                 max_entries: Optional[int] = DEFAULT_MAX_ENTRIES):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.glossary = glossary or Glossary({})
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                glossary_hash TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(segments)")}
+        if 'glossary_hash' not in columns:
+            self.conn.execute("ALTER TABLE segments ADD COLUMN glossary_hash TEXT NOT NULL DEFAULT ''")
+        if 'sketched' not in columns:
+            self.conn.execute("ALTER TABLE segments ADD COLUMN sketched INTEGER NOT NULL DEFAULT 0")
+        # 模糊匹配的倒排索引：草图值 → 记忆键
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sketch_terms (term INTEGER NOT NULL, key TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sketch_terms_term ON sketch_terms(term)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_unsketched ON segments(key) WHERE sketched = 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_last_used ON segments(last_used_at)")
+        # 各文件最近一次翻译的耗时，用于调度时估算任务长度
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+        # 补建旧版本写入的条目的草图；之后的条目在写入时建立
+        self._index_sketches()
+
+    def glossary_hash(self, normalized: str) -> str:
+        """片段中出现的术语条目的哈希"""
+        return self.glossary.fingerprint(normalized)
+
+    def make_key(self, text: str) -> str:
+        """计算片段在当前模型、提示词和术语表下的记忆键"""
+        normalized = normalize_segment(text)
+        return compute_key(self.model, self.prompt_version, self.glossary_hash(normalized), normalized)
+
+    def get(self, text: str) -> Optional[str]:
+        """查询单个片段"""
+        return self.get_many([text]).get(normalize_segment(text))
+
+    def get_many(self, texts: Iterable[str], touch: bool = True) -> Dict[str, str]:
+        """批量查询，返回 {规范化原文: 译文}，只包含命中的片段；touch 为 False 时不更新命中统计"""
+        keys: Dict[str, str] = {}
+        for text in texts:
+            normalized = normalize_segment(text)
+            if normalized:
+                keys[self.make_key(normalized)] = normalized
+        if not keys:
+            return {}
+
+        found: Dict[str, str] = {}
+        key_list = list(keys)
+        now = time.time()
+        for start in range(0, len(key_list), _SQL_BATCH):
+            batch = key_list[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, translation FROM segments WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, translation in rows:
+                found[keys[key]] = translation
+            if rows and touch:
+                hit_keys = [key for key, _ in rows]
+                self.conn.execute(
+                    f"UPDATE segments SET last_used_at = ?, hits = hits + 1 "
+                    f"WHERE key IN ({','.join('?' * len(hit_keys))})",
+                    [now, *hit_keys]
+                )
+        self.conn.commit()
+        return found
+
+    def put(self, text: str, translation: str):
+        """写入单个片段"""
+        self.put_many([(text, translation)])
+
+    def put_many(self, pairs: Iterable[Tuple[str, str]]):
+        """批量写入 (原文, 译文)"""
+        now = time.time()
+        rows = []
+        for text, translation in pairs:
+            normalized = normalize_segment(text)
+            if normalized and translation.strip():
+                glossary_hash = self.glossary_hash(normalized)
+                key = compute_key(self.model, self.prompt_version, glossary_hash, normalized)
+                rows.append((key, normalized, translation.strip('\n'),
+                             self.model, self.prompt_version, glossary_hash, now, now))
+        if not rows:
+            return
+        try:
+            self.conn.executemany(
+                """
+                INSERT INTO segments
+                    (key, source, translation, model, prompt_version, glossary_hash, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET translation = excluded.translation,
+                                               last_used_at = excluded.last_used_at
+                """,
+                rows
+            )
+            self.conn.commit()
+            self._index_sketches()
+        except sqlite3.Error as e:
+            logger.warning(f"Translation memory write failed: {str(e)}")
+
+    def plan_document(self,
+                      segments: List[str],
+                      max_chars: int,
+                      touch: bool = True) -> Tuple[List[Optional[str]], List[List[int]]]:
+        """
+        用一次批量查询确定文档中哪些片段需要翻译
+
+        返回 (pieces, groups)：pieces 与 segments 一一对应，命中记忆或无需翻译的片段
+        已填入带原始首尾空白的译文，其余为 None；groups 是待翻译片段下标的分组，
+        同组的相邻片段合并为一次请求，每组不超过 max_chars。只做估算时 touch 传 False。
+        """
+        bodies = [split_padding(segment)[1] for segment in segments]
+        cached = self.get_many((body for body in bodies if body.strip()), touch)
+
+        pieces: List[Optional[str]] = []
+        for segment, body in zip(segments, bodies):
+            if not body.strip():
+                pieces.append(segment)
+                continue
+            hit = cached.get(normalize_segment(body))
+            if hit is None:
+                pieces.append(None)
+            else:
+                lead, _, trail = split_padding(segment)
+                pieces.append(restore_padding(lead, hit, trail))
+
+        pending = [i for i, piece in enumerate(pieces) if piece is None]
+        groups: List[List[int]] = []
+        for run in _contiguous_runs(pending):
+            groups.extend(group_segments([segments[i] for i in run], max_chars, offset=run[0]))
+        if not groups:
+            return pieces, groups
+
+        # 译文无法按段落拆分时记忆按整组写入，分组方式确定，再按整组查询一次
+        chunks = [''.join(segments[i] for i in group) for group in groups]
+        cached_chunks = self.get_many((split_padding(chunk)[1] for chunk in chunks), touch)
+        unresolved: List[List[int]] = []
+        for group, chunk in zip(groups, chunks):
+            lead, body, trail = split_padding(chunk)
+            hit = cached_chunks.get(normalize_segment(body))
+            if hit is None:
+                unresolved.append(group)
+                continue
+            pieces[group[0]] = restore_padding(lead, hit, trail)
+            for i in group[1:]:
+                pieces[i] = ''
+        return pieces, unresolved
+
+    def _index_sketches(self):
+        """为尚未建立草图的条目补建模糊匹配索引"""
+        rows = self.conn.execute("SELECT key, source FROM segments WHERE sketched = 0").fetchall()
+        if not rows:
+            return
+        self.conn.executemany(
+            "INSERT INTO sketch_terms (term, key) VALUES (?, ?)",
+            ((term, key) for key, source in rows if len(source) >= FUZZY_MIN_LENGTH for term in sketch(source))
+        )
+        self.conn.executemany("UPDATE segments SET sketched = 1 WHERE key = ?", ((key,) for key, _ in rows))
+        self.conn.commit()
+
+    def _drop_orphan_sketches(self):
+        self.conn.execute("DELETE FROM sketch_terms WHERE key NOT IN (SELECT key FROM segments)")
+        self.conn.commit()
+
+    def find_similar(self, text: str, threshold: float = DEFAULT_FUZZY_THRESHOLD) -> Optional[Tuple[str, str]]:
+        """
+        查找当前模型和提示词下与 text 相似度不低于 threshold 的已翻译片段
+
+        返回 (旧原文, 旧译文)。先用草图倒排索引取少量候选，再用 difflib 计算相似度。
+        """
+        normalized = normalize_segment(text)
+        if len(normalized) < FUZZY_MIN_LENGTH:
+            return None
+
+        # 先按模型和提示词过滤再取共享草图值最多的候选，避免旧模型的条目占满候选名额
+        terms = sketch(normalized)
+        candidates = self.conn.execute(
+            f"""
+            SELECT s.source, s.translation, COUNT(*) AS shared
+            FROM sketch_terms t JOIN segments s ON s.key = t.key
+            WHERE t.term IN ({','.join('?' * len(terms))}) AND s.model = ? AND s.prompt_version = ?
+            GROUP BY t.key HAVING shared >= ? ORDER BY shared DESC LIMIT ?
+            """,
+            [*terms, self.model, self.prompt_version, min(FUZZY_MIN_SHARED, len(terms)), _FUZZY_CANDIDATES]
+        ).fetchall()
+
+        best = None
+        best_ratio = threshold
+        for source, translation, _ in candidates:
+            matcher = difflib.SequenceMatcher(None, normalized, source, autojunk=False)
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = (source, translation), ratio
+        return best
+
+    def plan_fuzzy(self,
+                   segments: List[str],
+                   groups: List[List[int]],
+                   max_chars: int,
+                   threshold: float = DEFAULT_FUZZY_THRESHOLD) -> Tuple[List[List[int]], Dict[int, Tuple[str, str]]]:
+        """
+        从待翻译分组中取出有近似旧译文的片段
+
+        返回 (剩余片段重新分组, {片段下标: (旧原文, 旧译文)})，取出的片段改为请求模型修改旧译文。
+        """
+        matches: Dict[int, Tuple[str, str]] = {}
+        for group in groups:
+            for i in group:
+                found = self.find_similar(split_padding(segments[i])[1], threshold)
+                if found:
+                    matches[i] = found
+        if not matches:
+            return groups, matches
+
+        pending = [i for group in groups for i in group if i not in matches]
+        regrouped: List[List[int]] = []
+        for run in _contiguous_runs(pending):
+            regrouped.extend(group_segments([segments[i] for i in run], max_chars, offset=run[0]))
+        return regrouped, matches
+
+    def record_chunk(self, segments: List[str], translated: str):
+        """按段落结构把一次请求的译文拆回各片段写入记忆，无法对齐时按整块写入"""
+        translated_blocks = align_blocks(segments, translated)
+        if translated_blocks is None:
+            self.put(''.join(segments), translated)
+            return
+        self.put_many(
+            (split_padding(source)[1], split_padding(target)[1])
+            for source, target in zip(segments, translated_blocks)
+        )
+
+    def evict(self, max_entries: Optional[int] = None, max_age_days: Optional[float] = None) -> int:
+        """按最近使用时间淘汰旧条目，返回删除的条数"""
+        removed = 0
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 86400
+            removed += self.conn.execute("DELETE FROM segments WHERE last_used_at < ?", (cutoff,)).rowcount
+        if max_entries is not None:
+            removed += self.conn.execute(
+                """
+                DELETE FROM segments WHERE key IN (
+                    SELECT key FROM segments ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (max_entries,)
+            ).rowcount
+        self.conn.commit()
+        if removed:
+            self._drop_orphan_sketches()
+        return removed
+
+    def invalidate(self,
+                   model: Optional[str] = None,
+                   prompt_version: Optional[str] = None,
+                   terms: Optional[Iterable[str]] = None) -> int:
+        """删除指定模型、提示词版本或原文包含指定术语的条目，返回删除的条数"""
+        removed = 0
+        if model is not None:
+            removed += self.conn.execute("DELETE FROM segments WHERE model = ?", (model,)).rowcount
+        if prompt_version is not None:
+            removed += self.conn.execute(
+                "DELETE FROM segments WHERE prompt_version = ?", (prompt_version,)
+            ).rowcount
+        for term in terms or []:
+            if term:
+                removed += self.conn.execute(
+                    "DELETE FROM segments WHERE instr(source, ?) > 0", (term,)
+                ).rowcount
+        self.conn.commit()
+        if removed:
+            self._drop_orphan_sketches()
+        return removed
+
+    def prune_stale(self) -> int:
+        """删除在当前模型、提示词和术语表下不可能再命中的条目，返回删除的条数"""
+        stale = []
+        for key, source in self.conn.execute("SELECT key, source FROM segments"):
+            if key != self.make_key(source):
+                stale.append(key)
+        for start in range(0, len(stale), _SQL_BATCH):
+            batch = stale[start:start + _SQL_BATCH]
+            self.conn.execute(f"DELETE FROM segments WHERE key IN ({','.join('?' * len(batch))})", batch)
+        self.conn.commit()
+        if stale:
+            self._drop_orphan_sketches()
+        return len(stale)
+
+    def export_jsonl(self, path: str) -> int:
+        """导出全部条目为 JSONL，返回导出的条数"""
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in self.conn.execute(
+                "SELECT source, translation, model, prompt_version, glossary_hash, created_at, last_used_at, hits "
+                "FROM segments"
+            ):
+                record = dict(zip(
+                    ("source", "translation", "model", "prompt_version", "glossary_hash",
+                     "created_at", "last_used_at", "hits"),
+                    row
+                ))
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, path: str) -> int:
+        """从 JSONL 导入条目，保留其中记录的模型、提示词版本和术语哈希，返回导入的条数"""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                model = record.get("model", self.model)
+                prompt_version = record.get("prompt_version", self.prompt_version)
+                source = normalize_segment(record["source"])
+                glossary_hash = record.get("glossary_hash", self.glossary_hash(source))
+                key = compute_key(model, prompt_version, glossary_hash, source)
+                now = time.time()
+                # 键由原文决定，已有条目只更新译文和统计，保留其模糊匹配索引
+                self.conn.execute(
+                    """
+                    INSERT INTO segments
+                        (key, source, translation, model, prompt_version, glossary_hash,
+                         created_at, last_used_at, hits)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET translation = excluded.translation,
+                                                   created_at = excluded.created_at,
+                                                   last_used_at = excluded.last_used_at,
+                                                   hits = excluded.hits
+                    """,
+                    (key, source, record["translation"], model, prompt_version, glossary_hash,
+                     record.get("created_at", now), record.get("last_used_at", now), record.get("hits", 0))
+                )
+                count += 1
+        self.conn.commit()
+        self._index_sketches()
+        return count
+
+    def record_job(self, path: str, size: int, seconds: float):
+        """记录文件的翻译耗时"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO jobs (path, size, seconds, updated_at) VALUES (?, ?, ?, ?)",
+            (path, size, seconds, time.time())
+        )
+        self.conn.commit()
+
+    def job_history(self) -> Dict[str, Tuple[int, float]]:
+        """返回 {路径: (字节数, 耗时秒数)}"""
+        return {
+            path: (size, seconds)
+            for path, size, seconds in self.conn.execute("SELECT path, size, seconds FROM jobs")
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """条目数与累计命中数"""
+        entries, hits = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM segments").fetchone()
+        return {'entries': entries, 'hits': hits}
+
+    def close(self):
+        """按 max_entries 淘汰后关闭数据库"""
+        try:
+            if self.max_entries is not None:
+                self.evict(max_entries=self.max_entries)
+        finally:
+            self.conn.close()
+
+
+def _contiguous_runs(indices: List[int]) -> List[List[int]]:
+    """把有序下标切分为连续区间"""
+    runs: List[List[int]] = []
+    for index in indices:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='翻译记忆维护工具')
+    parser.add_argument("--language", default=DEFAULT_LANGUAGE, choices=list(LANGUAGES),
+                        help="翻译记忆所属的目标语言，决定提示词哈希和术语表 (默认：en)")
+    parser.add_argument("--db", default=None,
+                        help=f"翻译记忆数据库路径 (默认：{DEFAULT_DB_PATH}，其他语言如 .translation_memory.ja.sqlite3)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="显示条目统计")
+    evict_parser = subparsers.add_parser("evict", help="淘汰旧条目")
+    evict_parser.add_argument("--max-entries", type=int, help="最多保留的条目数")
+    evict_parser.add_argument("--max-age-days", type=float, help="删除超过该天数未使用的条目")
+    export_parser = subparsers.add_parser("export", help="导出为 JSONL")
+    export_parser.add_argument("path")
+    import_parser = subparsers.add_parser("import", help="从 JSONL 导入")
+    import_parser.add_argument("path")
+    invalidate_parser = subparsers.add_parser("invalidate", help="选择性地使条目失效")
+    invalidate_parser.add_argument("--model", help="删除该模型产生的条目")
+    invalidate_parser.add_argument("--prompt-version", help="删除该提示词模板哈希下的条目")
+    invalidate_parser.add_argument("--term", action="append", default=[], help="删除原文包含该术语的条目，可重复")
+    invalidate_parser.add_argument("--glossary-diff", metavar="OLD_GLOSSARY",
+                                   help="与旧术语表对比，删除原文包含新增、删除或修改过的术语的条目")
+    subparsers.add_parser("prune", help="删除当前模型、提示词和术语表下不会再命中的条目")
+    args = parser.parse_args()
+
+    from core import open_memory
+
+    glossary, memory = open_memory(MODEL, args.language, args.db or language_path(DEFAULT_DB_PATH, args.language))
+    memory.max_entries = None  # 维护命令只做指定的操作，关闭时不按条数淘汰
+    try:
+        if args.command == "stats":
+            stats = memory.stats()
+            logger.info(f"条目数：{stats['entries']}，累计命中：{stats['hits']}")
+        elif args.command == "evict":
+            removed = memory.evict(max_entries=args.max_entries, max_age_days=args.max_age_days)
+            logger.info(f"已淘汰 {removed} 个条目")
+        elif args.command == "export":
+            logger.info(f"已导出 {memory.export_jsonl(args.path)} 个条目到 {args.path}")
+        elif args.command == "import":
+            logger.info(f"已导入 {memory.import_jsonl(args.path)} 个条目")
+        elif args.command == "invalidate":
+            terms = list(args.term)
+            if args.glossary_diff:
+                with open(args.glossary_diff, 'r', encoding='utf-8') as f:
+                    old_glossary = json.load(f)
+                changed = [
+                    term for term in set(old_glossary) | set(glossary.entries)
+                    if old_glossary.get(term) != glossary.entries.get(term)
+                ]
+                logger.info(f"相对 {args.glossary_diff} 有 {len(changed)} 个术语发生变化")
+                terms.extend(changed)
+            removed = memory.invalidate(model=args.model, prompt_version=args.prompt_version, terms=terms)
+            logger.info(f"已使 {removed} 个条目失效")
+        elif args.command == "prune":
+            logger.info(f"已删除 {memory.prune_stale()} 个过期条目")
+    finally:
+        memory.close()
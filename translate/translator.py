@@ -1,10 +1,13 @@
-import json
 import requests
 from pathlib import Path
 from typing import Dict, List, Optional
 import logging
 from tenacity import retry, stop_after_attempt, wait_exponential
-import hashlib
+from core import open_memory, source_relative_path
+from masking import protect, restore, has_prose
+from prompt import BASE_URL, MODEL, build_messages
+from segmenter import DEFAULT_CHUNK_SIZE, segment_markdown, split_padding, restore_padding
+from translation_memory import DEFAULT_DB_PATH
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,17 +20,22 @@ class TranslationError(Exception):
     pass
 
 class MarkdownTranslator:
-    def __init__(self, api_key: str):
+    def __init__(self,
+                 api_key: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 memory_path: str = DEFAULT_DB_PATH,
+                 model: str = MODEL,
+                 base_url: str = BASE_URL):
         self.api_key = api_key
-        self.base_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.chunk_size = chunk_size
+        self.base_url = base_url
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         })
-        self.glossary = self.load_glossary()
-        self.cache_dir = Path(".translation_cache")
-        self.cache_dir.mkdir(exist_ok=True)
+        self.model = model
+        self.glossary, self.memory = open_memory(self.model, memory_path=memory_path)
 
     @retry(
         stop=stop_after_attempt(5), 
@@ -35,46 +43,15 @@ class MarkdownTranslator:
         reraise=True
     )
     def translate_text(self, text: str, file_path: str) -> str:
-        """使用技术内容保留进行翻译"""
-        # 检查缓存
-        cache_key = hashlib.md5(text.encode('utf-8')).hexdigest()
-        cache_file = self.cache_dir / f"{cache_key}.cache"
-        
-        if cache_file.exists():
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except Exception as e:
-                logger.warning(f"Cache read failed: {str(e)}")
+        """使用技术内容保留进行翻译（不查询翻译记忆，由文档级流程统一处理）"""
+        # 用占位符保护代码、公式、链接等内容，只把需要翻译的正文发送给模型
+        masked_text, spans = protect(text)
+        if not has_prose(masked_text):
+            return text
         
         payload = {
-            "model": "Pro/deepseek-ai/DeepSeek-R1",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "你是一位专业的计算机科学和技术文档翻译专家，专门负责将中文技术文档翻译成英文。\n\n"
-                        "翻译任务：将以下中文 Markdown 文档翻译成英文，保持技术准确性和可读性。\n\n"
-                        "核心要求：\n"
-                        "1. 目标语言：英语（美式英语）\n"
-                        "2. 完全保留所有 Markdown 格式、语法和结构\n"
-                        "3. 绝不修改任何代码块（```...```）或行内代码（`...`）\n"
-                        "4. 保留所有 URL、链接和 YAML front matter 完全不变\n"
-                        "5. 保持技术术语的一致性和准确性\n"
-                        "6. 使用专业、清晰、自然的英文表达\n"
-                        "7. 保持原文的逻辑结构和段落组织\n"
-                        "8. 对于数学公式、算法描述等保持精确性\n"
-                        "9. 请检查翻译内容的头尾是否符合原文件的格式\n\n"
-                        f"技术术语表（必须遵循）：\n{self.format_glossary()}\n\n"
-                        f"当前翻译文件：{file_path}\n\n"
-                        "请直接输出翻译后的英文内容，不要添加任何解释或注释。"
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": f"请将以下中文技术文档翻译成英文：\n\n{text}"
-                }
-            ],
+            "model": self.model,
+            "messages": build_messages(masked_text, self.glossary.render(masked_text), file_path),
             "temperature": 0.2,
             "max_tokens": 4000,
             "top_p": 0.9
@@ -88,15 +65,8 @@ class MarkdownTranslator:
             )
             response.raise_for_status()
             result = response.json()['choices'][0]['message']['content']
-            
-            # 保存缓存
-            try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    f.write(result)
-            except Exception as e:
-                logger.warning(f"Cache write failed: {str(e)}")
-                
-            return result
+            # 还原占位符，缺失或重复时抛出异常，不会写入翻译记忆
+            return restore(result, spans)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"API 请求失败：{str(e)}")
@@ -105,35 +75,26 @@ class MarkdownTranslator:
             logger.error(f"意外错误：{str(e)}")
             raise TranslationError("处理翻译失败")
 
-    def load_glossary(self) -> Dict[str, str]:
-        """加载技术术语表"""
-        glossary_paths = [
-            Path("translate/glossary.json"),
-            Path("./glossary.json")
-        ]
+    def translate_document(self, content: str, file_path: str) -> str:
+        """按 Markdown 结构切分文档，先批量查询翻译记忆，未命中的片段逐个请求后按原顺序拼接"""
+        segments = segment_markdown(content, self.chunk_size)
+        pieces, groups = self.memory.plan_document(segments, self.chunk_size)
         
-        for glossary_path in glossary_paths:
-            if glossary_path.exists():
-                try:
-                    with open(glossary_path, 'r', encoding='utf-8') as f:
-                        logger.info(f"Loaded glossary from {glossary_path}")
-                        return json.load(f)
-                except Exception as e:
-                    logger.warning(f"术语表加载失败 ({glossary_path}): {str(e)}")
+        for n, group in enumerate(groups):
+            chunk = ''.join(segments[i] for i in group)
+            lead, body, trail = split_padding(chunk)
+            label = file_path if len(groups) == 1 else f"{file_path}（片段 {n + 1}/{len(groups)}）"
+            translated = restore_padding(lead, self.translate_text(body, label), trail)
+            self.memory.record_chunk([segments[i] for i in group], translated)
+            pieces[group[0]] = translated
+            for i in group[1:]:
+                pieces[i] = ''
         
-        logger.warning("No glossary found, using empty glossary")
-        return {}
+        return ''.join(pieces)
 
-    def format_glossary(self) -> str:
-        """为 API 提示格式化术语表"""
-        if not self.glossary:
-            return "（无特定术语表，请使用标准计算机科学术语）"
-        
-        formatted_terms = []
-        for chinese, english in self.glossary.items():
-            formatted_terms.append(f"  • {chinese} → {english}")
-        
-        return "术语对照表：\n" + "\n".join(formatted_terms)
+    def close(self):
+        """关闭翻译记忆"""
+        self.memory.close()
 
     def translate_file(self, input_path: str, output_path: str) -> bool:
         """处理单个文件，使用原子写入"""
@@ -142,18 +103,7 @@ class MarkdownTranslator:
         
         try:
             input_file = Path(input_path)
-            # 使用更健壮的路径处理方法
-            try:
-                # 尝试获取相对于源目录的路径
-                source_path = Path.cwd() / "trees"
-                rel_path = input_file.relative_to(source_path)
-            except ValueError:
-                # 如果失败，尝试获取相对于当前工作目录的路径
-                try:
-                    rel_path = input_file.relative_to(Path.cwd())
-                except ValueError:
-                    # 如果都失败，使用绝对路径
-                    rel_path = input_file.absolute()
+            rel_path = source_relative_path(input_file)
             
             # 读取文件，明确处理编码
             with open(input_path, 'r', encoding='utf-8', newline='') as f:
@@ -172,7 +122,7 @@ class MarkdownTranslator:
             
             # 原子写入模式
             temp_path = output_file.with_suffix('.tmp')
-            translated = self.translate_text(content, str(rel_path))
+            translated = self.translate_document(content, str(rel_path))
             
             with open(temp_path, 'w', encoding='utf-8', newline='') as f:
                 f.write(translated)
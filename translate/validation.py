@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+译文的结构校验
+
+只做本地的廉价检查：front matter 的键、标题数、代码块数量和内容、链接与 URL 集合、
+数学公式以及长度比例。校验失败的片段由调用方单独重新请求，不必重译整个文件。
+
+    python translate/validation.py                    # 校验 trees 与 tree_en 中的全部文件
+    python translate/validation.py blog/lti/cg.md
+"""
+import argparse
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from masking import (BARE_URL_RE, DISPLAY_MATH_RE, FENCED_CODE_RE, FRONT_MATTER_RE, INLINE_CODE_RE,
+                     INLINE_MATH_RE, LINK_DEFINITION_RE, LINK_TARGET_RE)
+
+HEADING_RE = re.compile(r'^ {0,3}#{1,6}(?=[ \t]|$)', re.M)
+CJK_RE = re.compile('[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+# 按字计算长度的文字：汉字、假名和谚文
+WIDE_RE = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+# 一个汉字（或假名、谚文）大致对应的英文字符数，原文和译文都按此折算后比较长度
+EN_CHARS_PER_CJK = 2.5
+# 译文长度与估算长度之比的合理范围；原文正文太短时比例波动大，不做检查
+MIN_LENGTH_RATIO = 0.35
+MAX_LENGTH_RATIO = 2.5
+MIN_CHECKED_LENGTH = 200
+
+
+def _front_matter_keys(text: str) -> Optional[List[str]]:
+    match = FRONT_MATTER_RE.match(text)
+    if not match:
+        return None
+    return [line.split(':', 1)[0].strip() for line in match.group(2).splitlines()
+            if ':' in line and not line[:1].isspace()]
+
+
+def _changed(source_items: List[str], translated_items: List[str]) -> List[str]:
+    """
+    返回在译文中找不到的原文代码块或公式
+
+    忽略空白差异，不要求顺序（行内公式在译文中的先后可能改变）；含汉字的项（注释、\\text{}
+    中的说明）可能被合理地翻译，不比较内容。
+    """
+    def normalize(item: str) -> str:
+        return re.sub(r'\s+', '', item)
+
+    remaining = Counter(normalize(item) for item in translated_items)
+    changed = []
+    for item in source_items:
+        if CJK_RE.search(item):
+            continue
+        if remaining[normalize(item)] > 0:
+            remaining[normalize(item)] -= 1
+        else:
+            changed.append(item)
+    return changed
+
+
+def _links(text: str) -> Counter:
+    links = Counter(match.group(2).split()[0] for match in LINK_TARGET_RE.finditer(text))
+    # 脚注定义 [^1]: 后面是正文而不是地址
+    links.update(match.group(2) for match in LINK_DEFINITION_RE.finditer(text) if '[^' not in match.group(1))
+    # 已作为链接地址统计的 URL 不重复计入
+    bare = Counter(BARE_URL_RE.findall(LINK_TARGET_RE.sub('', LINK_DEFINITION_RE.sub('', text))))
+    return links + bare
+
+
+def _prose_length(text: str) -> float:
+    """去掉代码、公式和 URL 后的正文长度，汉字等按字折算为英文字符数"""
+    for pattern in (FENCED_CODE_RE, DISPLAY_MATH_RE, INLINE_CODE_RE, INLINE_MATH_RE, BARE_URL_RE):
+        text = pattern.sub('', text)
+    text = LINK_TARGET_RE.sub('', text).strip()
+    wide = len(WIDE_RE.findall(text))
+    return wide * EN_CHARS_PER_CJK + (len(text) - wide)
+
+
+def validate_translation(source: str, translated: str) -> List[str]:
+    """比较原文与译文的结构，返回发现的问题描述，列表为空表示通过"""
+    problems: List[str] = []
+
+    source_keys, translated_keys = _front_matter_keys(source), _front_matter_keys(translated)
+    if source_keys != translated_keys:
+        problems.append(f"front matter 的键不一致：{source_keys} → {translated_keys}")
+
+    source_fences = [match.group(0) for match in FENCED_CODE_RE.finditer(source)]
+    translated_fences = [match.group(0) for match in FENCED_CODE_RE.finditer(translated)]
+    if len(source_fences) != len(translated_fences):
+        problems.append(f"代码块数量不一致：{len(source_fences)} → {len(translated_fences)}")
+    elif _changed(source_fences, translated_fences):
+        problems.append(f"代码块内容被修改：{len(_changed(source_fences, translated_fences))} 处")
+
+    # 标题、公式和链接只在代码块之外统计
+    source_text = FENCED_CODE_RE.sub('', source)
+    translated_text = FENCED_CODE_RE.sub('', translated)
+
+    source_headings = len(HEADING_RE.findall(source_text))
+    translated_headings = len(HEADING_RE.findall(translated_text))
+    if source_headings != translated_headings:
+        problems.append(f"标题数量不一致：{source_headings} → {translated_headings}")
+
+    source_math = DISPLAY_MATH_RE.findall(source_text) + INLINE_MATH_RE.findall(DISPLAY_MATH_RE.sub('', source_text))
+    translated_math = (DISPLAY_MATH_RE.findall(translated_text)
+                       + INLINE_MATH_RE.findall(DISPLAY_MATH_RE.sub('', translated_text)))
+    if len(source_math) != len(translated_math):
+        problems.append(f"数学公式数量不一致：{len(source_math)} → {len(translated_math)}")
+    elif _changed(source_math, translated_math):
+        problems.append(f"数学公式被修改：{_changed(source_math, translated_math)[:3]}")
+
+    source_links, translated_links = _links(source_text), _links(translated_text)
+    if set(source_links) != set(translated_links):
+        missing = sorted(set(source_links) - set(translated_links))
+        added = sorted(set(translated_links) - set(source_links))
+        problems.append(f"链接不一致：缺失 {missing[:3]}，多出 {added[:3]}")
+
+    expected = _prose_length(source)
+    if expected >= MIN_CHECKED_LENGTH:
+        ratio = _prose_length(translated) / expected
+        if not MIN_LENGTH_RATIO <= ratio <= MAX_LENGTH_RATIO:
+            problems.append(f"译文长度异常：约为预期的 {ratio:.2f} 倍")
+    return problems
+
+
+def validate_tree(source_dir: str, target_dir: str, files: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """校验目录中已有的译文，返回 {相对路径: 问题列表}，只包含未通过的文件"""
+    source_root, target_root = Path(source_dir), Path(target_dir)
+    paths = [source_root / name for name in files] if files else sorted(source_root.rglob('*.md'))
+    results: Dict[str, List[str]] = {}
+    for path in paths:
+        rel_path = path.relative_to(source_root).as_posix()
+        target = target_root / rel_path
+        if not target.exists():
+            continue
+        problems = validate_translation(path.read_text(encoding='utf-8'), target.read_text(encoding='utf-8'))
+        if problems:
+            results[rel_path] = problems
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验已有译文的结构")
+    parser.add_argument("files", nargs="*", help="要校验的文件（相对源目录的路径），默认全部")
+    parser.add_argument("--source-dir", default="trees", help="源目录路径 (默认：trees)")
+    parser.add_argument("--target-dir", default="tree_en", help="目标目录路径 (默认：tree_en)")
+    args = parser.parse_args()
+
+    results = validate_tree(args.source_dir, args.target_dir, args.files)
+    for rel_path, problems in results.items():
+        print(rel_path)
+        for problem in problems:
+            print(f"  - {problem}")
+    print(f"{len(results)} 个文件未通过校验")
+    sys.exit(1 if results else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+常驻的增量翻译进程
+
+监视源目录，一批连续的保存结束后（静默 --debounce 秒，最长等待 --max-delay 秒）只翻译改动的文件，
+已有译文的文件只重译改动段落。HTTP 会话、术语表、翻译记忆和源文件缓存在进程内一直保持，
+省去每次冷启动的开销。安装了 watchdog 时由文件系统事件唤醒，否则定时轮询文件的大小和修改时间。
+
+    python translate/watch_translate.py --api-key YOUR_API_KEY
+    python translate/watch_translate.py --api-key YOUR_API_KEY --languages en ja --sync
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from budget import TokenBudget, prices_for
+from circuit_breaker import CircuitBreaker
+from corpus import SourceCorpus
+from core import resolve_target_dir
+from full_translate import AsyncMarkdownTranslator, create_session
+from languages import DEFAULT_LANGUAGE, LANGUAGES
+from metrics import RunMetrics
+from prompt import BASE_URL, MODEL
+from rate_limiter import AdaptiveLimiter
+from segmenter import DEFAULT_CHUNK_SIZE
+from translation_index import TranslationIndex
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # 可选依赖，未安装时轮询源目录
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+Snapshot = Dict[str, Tuple[int, int]]  # {源目录相对路径: (大小, 修改时间)}
+
+
+def take_snapshot(source_dir: Path) -> Snapshot:
+    """源目录中所有 Markdown 文件的大小和修改时间"""
+    snapshot: Snapshot = {}
+    for path in source_dir.rglob('*.md'):
+        try:
+            stat = path.stat()
+        except OSError:  # 遍历过程中被删除
+            continue
+        snapshot[path.relative_to(source_dir).as_posix()] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Tuple[Set[str], Set[str]]:
+    """返回 (新增或改动的文件, 删除的文件)"""
+    changed = {rel_path for rel_path, signature in new.items() if old.get(rel_path) != signature}
+    return changed, set(old) - set(new)
+
+
+class TranslationDaemon:
+    """
+    监视源目录并持续翻译改动的文件
+
+    每个目标语言一个翻译器，共享限流器、熔断器和源文件缓存，所有请求共用一个 HTTP 会话。
+    记录每个文件上次成功翻译时的原文，文件再次改动时据此只重译改动段落。
+    运行指标按轮记录，每轮换一个新的 RunMetrics，常驻进程的内存不随请求数增长。
+    """
+
+    def __init__(self,
+                 source_dir: str,
+                 translators: Dict[str, AsyncMarkdownTranslator],
+                 targets: Dict[str, str],
+                 debounce: float = 1.0,
+                 max_delay: float = 10.0,
+                 poll_interval: float = 0.5,
+                 retry_interval: float = 60.0,
+                 max_retries: int = 3,
+                 metrics_json: Optional[str] = None):
+        self.source_dir = Path(source_dir)
+        self.translators = translators
+        self.targets = targets
+        self.debounce = debounce  # 最后一次改动后静默多久开始翻译
+        self.max_delay = max_delay  # 持续有改动时，从第一次改动起最多等待多久
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval  # 失败的文件没有再次改动时，隔多久重新尝试
+        self.max_retries = max_retries
+        self.metrics_json = metrics_json  # 每轮结束后把该轮指标写入此文件
+        self.corpus = next(iter(translators.values())).corpus
+        self.sources: Dict[str, Dict[str, str]] = {code: {} for code in translators}  # {语言: {路径: 已翻译的原文}}
+        self.failed: Set[str] = set()
+        self.cycles = 0
+        self._snapshot: Snapshot = {}
+        self._wake = asyncio.Event()
+
+    def prime(self) -> Set[str]:
+        """
+        读取源目录并登记译文仍然有效的文件，返回译文过期或缺失的文件
+
+        译文有效以输出目录的翻译索引为准，这些文件改动时可以只重译改动段落。
+        """
+        self._snapshot = take_snapshot(self.source_dir)
+        stale: Set[str] = set()
+        for code, target in self.targets.items():
+            index = TranslationIndex(str(self.source_dir), target, source_hash=self.corpus.hash)
+            outdated = set(index.stale_files(sorted(self._snapshot)))
+            stale |= outdated
+            for rel_path in self._snapshot:
+                if rel_path not in outdated:
+                    self.sources[code][rel_path] = self.corpus.read(self.source_dir / rel_path)
+        return stale
+
+    async def run(self, session, initial: Optional[Set[str]] = None):
+        """一直运行直到被取消或预算用尽；initial 为启动时需要先翻译的文件"""
+        observer = self._start_observer()
+        try:
+            if initial:
+                await self.translate(session, set(initial), set())
+            while True:
+                changed, deleted = await self.wait_for_changes()
+                if not await self.translate(session, changed, deleted):
+                    break
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def _start_observer(self):
+        if Observer is None:
+            logger.info(f"每 {self.poll_interval} 秒轮询 {self.source_dir}（安装 watchdog 后改为监听文件系统事件）")
+            return None
+        loop = asyncio.get_running_loop()
+        wake = self._wake
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                loop.call_soon_threadsafe(wake.set)
+
+        observer = Observer()
+        observer.schedule(Handler(), str(self.source_dir), recursive=True)
+        observer.start()
+        logger.info(f"监听 {self.source_dir} 的文件系统事件")
+        return observer
+
+    async def _sleep(self, seconds: float):
+        """等待下一次检查；有文件系统事件时提前醒来"""
+        if Observer is None:
+            await asyncio.sleep(seconds)
+            return
+        try:
+            await asyncio.wait_for(self._wake.wait(), max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def _poll(self) -> Tuple[Set[str], Set[str]]:
+        snapshot = take_snapshot(self.source_dir)
+        changed, deleted = diff_snapshots(self._snapshot, snapshot)
+        self._snapshot = snapshot
+        return changed, deleted
+
+    async def wait_for_changes(self) -> Tuple[Set[str], Set[str]]:
+        """
+        等待一批改动结束，返回 (改动的文件, 删除的文件)
+
+        第一次发现改动后继续收集，直到静默 debounce 秒或距第一次改动已过 max_delay 秒。
+        有翻译失败的文件时，retry_interval 秒内没有新改动也会返回以便重试。
+        """
+        changed: Set[str] = set()
+        deleted: Set[str] = set()
+        # 有事件监听时轮询只作为兜底，间隔可以长一些
+        idle_interval = self.poll_interval if Observer is None else max(self.poll_interval, 5.0)
+        idle_since = time.monotonic()
+        while True:
+            new_changed, new_deleted = self._poll()
+            if new_changed or new_deleted:
+                break
+            if self.failed and time.monotonic() - idle_since >= self.retry_interval:
+                return set(), set()
+            await self._sleep(idle_interval)
+
+        first = last = time.monotonic()
+        while True:
+            changed = (changed | new_changed) - new_deleted
+            deleted = (deleted | new_deleted) - new_changed
+            if new_changed or new_deleted:
+                last = time.monotonic()
+            now = time.monotonic()
+            ready_at = min(last + self.debounce, first + self.max_delay)
+            if now >= ready_at:
+                return changed, deleted
+            await self._sleep(min(ready_at - now, self.poll_interval))
+            new_changed, new_deleted = self._poll()
+
+    def remove_translations(self, deleted: Set[str]):
+        """删除已删除源文件的译文，并清理变空的目录"""
+        for code, target in self.targets.items():
+            target_path = Path(target)
+            index = TranslationIndex(str(self.source_dir), target, source_hash=self.corpus.hash)
+            for rel_path in sorted(deleted):
+                self.sources[code].pop(rel_path, None)
+                index.remove(rel_path)
+                output_file = target_path / rel_path
+                if output_file.exists():
+                    output_file.unlink()
+                    logger.info(f"源文件已删除，删除译文：{output_file}")
+                parent = output_file.parent
+                while parent != target_path and parent.exists() and not any(parent.iterdir()):
+                    parent.rmdir()
+                    parent = parent.parent
+            index.save()
+
+    async def translate(self, session, changed: Set[str], deleted: Set[str]) -> bool:
+        """翻译一批改动，返回是否继续监视（预算用尽时返回 False）"""
+        self.cycles += 1
+        if deleted:
+            self.remove_translations(deleted)
+            self.failed -= deleted
+        files = sorted((changed | self.failed) - deleted)
+        files = [rel_path for rel_path in files if (self.source_dir / rel_path).exists()]
+        if not files:
+            return True
+        logger.info(f"第 {self.cycles} 轮：{len(files)} 个文件有改动：{', '.join(files[:5])}"
+                    + (" 等" if len(files) > 5 else ""))
+        started = time.monotonic()
+
+        metrics = RunMetrics()
+        metrics.info.update({'languages': list(self.translators), 'cycle': self.cycles})
+        for translator in self.translators.values():
+            translator.metrics = metrics
+
+        # 记下本轮翻译的原文；翻译期间文件又被改动时不登记，下一轮按整篇处理
+        contents = {rel_path: self.corpus.read(self.source_dir / rel_path) for rel_path in files}
+        try:
+            results = await asyncio.gather(*[
+                translator.batch_translate_async(
+                    input_dir=str(self.source_dir),
+                    output_dir=self.targets[code],
+                    specific_files=files,
+                    max_retries=self.max_retries,
+                    previous_sources={
+                        rel_path: self.sources[code][rel_path] for rel_path in files
+                        if rel_path in self.sources[code] and self.sources[code][rel_path] != contents[rel_path]
+                    },
+                    session=session
+                )
+                for code, translator in self.translators.items()
+            ])
+        finally:
+            if self.metrics_json:
+                metrics.write_json(self.metrics_json)
+
+        failed: Set[str] = set()
+        for code, stats in zip(self.translators, results):
+            for rel_path in stats['succeeded_files']:
+                rel_path = Path(rel_path).as_posix()
+                if self.corpus.read(self.source_dir / rel_path) == contents[rel_path]:
+                    self.sources[code][rel_path] = contents[rel_path]
+                else:
+                    self.sources[code].pop(rel_path, None)
+            failed.update(Path(rel_path).as_posix() for rel_path in stats['failed_files'])
+        self.failed = failed
+        logger.info(f"第 {self.cycles} 轮完成，用时 {time.monotonic() - started:.1f} 秒"
+                    + (f"，{len(failed)} 个文件失败，{self.retry_interval:.0f} 秒后重试" if failed else ""))
+
+        translator = next(iter(self.translators.values()))
+        if translator.budget is not None and translator.budget.exhausted:
+            logger.warning("预算已用尽，停止监视")
+            return False
+        if translator.breaker.gave_up:
+            # 常驻进程不因一次服务中断退出，换一个新的熔断器，等下一批改动或重试时再请求
+            breaker = CircuitBreaker(
+                translator.breaker.failure_threshold, give_up_after=translator.breaker.give_up_after
+            )
+            for each in self.translators.values():
+                each.breaker = breaker
+        return True
+
+
+async def watch_translate(source_dir: str, target_dir: Optional[str], api_key: str,
+                          languages: Optional[List[str]] = None, max_concurrent: int = 20,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE, base_url: str = BASE_URL,
+                          debounce: float = 1.0, max_delay: float = 10.0, poll_interval: float = 0.5,
+                          max_retries: int = 3, sync: bool = False,
+                          breaker: Optional[CircuitBreaker] = None, budget: Optional[TokenBudget] = None,
+                          metrics_json: Optional[str] = None):
+    """启动常驻翻译，sync 为 True 时先翻译译文已过期或缺失的文件"""
+    languages = languages or [DEFAULT_LANGUAGE]
+    targets = {code: resolve_target_dir(target_dir, code, len(languages) > 1) for code in languages}
+    if not Path(source_dir).exists():
+        logger.error(f"源目录不存在：{source_dir}")
+        return
+
+    limiter = AdaptiveLimiter(max_concurrent)
+    corpus = SourceCorpus(chunk_size)
+    breaker = breaker or CircuitBreaker()
+    translators = {
+        code: AsyncMarkdownTranslator(
+            api_key, max_concurrent, chunk_size,
+            base_url=base_url,
+            budget=budget,
+            breaker=breaker,
+            language=code,
+            limiter=limiter,
+            corpus=corpus
+        )
+        for code in languages
+    }
+    daemon = TranslationDaemon(source_dir, translators, targets, debounce, max_delay, poll_interval,
+                               max_retries=max_retries, metrics_json=metrics_json)
+    try:
+        stale = daemon.prime()
+        if stale and not sync:
+            logger.warning(f"{len(stale)} 个文件的译文已过期或缺失，本次只翻译之后的改动（加 --sync 先补齐）")
+        logger.info(f"开始监视 {source_dir} → {', '.join(targets.values())}，按 Ctrl+C 退出")
+        async with create_session() as session:
+            await daemon.run(session, stale if sync else None)
+    finally:
+        for translator in translators.values():
+            translator.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="监视源目录，持续增量翻译改动的文件")
+    parser.add_argument("--source-dir", default="trees", help="源目录路径 (默认：trees)")
+    parser.add_argument("--target-dir", default=None,
+                        help="目标目录路径，可包含 {lang} 占位符 (默认：tree_<语言代码>，即 tree_en)")
+    parser.add_argument("--languages", nargs="+", default=[DEFAULT_LANGUAGE], choices=list(LANGUAGES),
+                        help="目标语言，可指定多个 (默认：en)")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="翻译 API 密钥 (默认：环境变量 API_KEY)")
+    parser.add_argument("--base-url", default=os.getenv("API_BASE_URL") or BASE_URL,
+                        help=f"OpenAI 兼容的补全接口地址 (默认：环境变量 API_BASE_URL 或 {BASE_URL})")
+    parser.add_argument("--max-concurrent", type=int, default=20, help="最大并发请求数 (默认：20)")
+    parser.add_argument("--max-retries", type=int, default=3, help="每轮中单个文件的最大重试次数 (默认：3)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"大文件分片的字符数上限 (默认：{DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--debounce", type=float, default=1.0, help="最后一次改动后静默多少秒开始翻译 (默认：1)")
+    parser.add_argument("--max-delay", type=float, default=10.0,
+                        help="持续有改动时，从第一次改动起最多等待多少秒 (默认：10)")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="轮询源目录的间隔秒数 (默认：0.5)")
+    parser.add_argument("--sync", action="store_true", help="启动时先翻译译文已过期或缺失的文件")
+    parser.add_argument("--max-cost", type=float, default=None, help="常驻期间的费用上限（元），用尽后退出 (默认：不限)")
+    parser.add_argument("--breaker-threshold", type=float, default=0.5,
+                        help="近期请求失败比例达到该值时暂停请求，0 表示关闭 (默认：0.5)")
+    parser.add_argument("--metrics-json", default=None, help="每轮翻译结束后把该轮的运行指标写入 JSON 文件（覆盖上一轮）")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("需要 --api-key 或环境变量 API_KEY")
+    try:
+        for code in args.languages:
+            resolve_target_dir(args.target_dir, code, len(args.languages) > 1)
+    except ValueError as e:
+        parser.error(str(e))
+    budget = None
+    if args.max_cost is not None:
+        prices = prices_for(MODEL, None, None)
+        if prices is None:
+            parser.error(f"模型 {MODEL} 没有内置价格，无法使用 --max-cost")
+        budget = TokenBudget(prices, None, args.max_cost)
+
+    try:
+        asyncio.run(watch_translate(
+            source_dir=args.source_dir,
+            target_dir=args.target_dir,
+            api_key=args.api_key,
+            languages=args.languages,
+            max_concurrent=args.max_concurrent,
+            chunk_size=args.chunk_size,
+            base_url=args.base_url,
+            debounce=args.debounce,
+            max_delay=args.max_delay,
+            poll_interval=args.poll_interval,
+            max_retries=args.max_retries,
+            sync=args.sync,
+            breaker=CircuitBreaker(args.breaker_threshold),
+            budget=budget,
+            metrics_json=args.metrics_json
+        ))
+    except KeyboardInterrupt:
+        logger.info("已停止监视")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class WorkQueue(Generic[T]):
+    """
+    固定数量工作协程消费的有界任务队列
+
+    失败的任务按自身的指数退避延迟后重新入队，不阻塞其他任务；所有任务共享
+    一个重试预算，单个任务另有最多 max_attempts 次尝试的上限。stop_when 返回 True 后
+    不再开始新任务也不再重试，剩余任务直接记为失败（同时记入 stopped），进行中的任务照常完成。
+    """
+
+    def __init__(self,
+                 handler: Callable[[T], Awaitable[bool]],
+                 workers: int,
+                 max_attempts: int = 6,
+                 retry_budget: Optional[int] = None,
+                 base_delay: float = 2.0,
+                 max_delay: float = 60.0,
+                 describe: Callable[[T], str] = str,
+                 stop_when: Optional[Callable[[], bool]] = None):
+        self.handler = handler  # 返回 True 表示成功，返回 False 或抛出异常表示失败
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget  # None 表示不限总重试次数
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.describe = describe
+        self.stop_when = stop_when
+        self.retries = 0
+        self.succeeded: List[T] = []
+        self.failed: List[T] = []
+        self.stopped: List[T] = []  # 因 stop_when 未开始或未重试的任务
+
+    def _backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待秒数（带随机抖动）"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def run(self, items: Iterable[T]) -> Tuple[List[T], List[T]]:
+        """处理全部任务直到队列清空，返回 (成功列表, 最终失败列表)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        requeues = set()
+
+        async def requeue(item: T, attempt: int, delay: float):
+            try:
+                await asyncio.sleep(delay)
+                await queue.put((item, attempt))
+            except asyncio.CancelledError:
+                if not stopping():
+                    raise
+                self.failed.append(item)
+                self.stopped.append(item)
+            finally:
+                queue.task_done()
+
+        def stopping() -> bool:
+            return self.stop_when is not None and self.stop_when()
+
+        async def worker():
+            while True:
+                item, attempt = await queue.get()
+                if stopping():
+                    self.failed.append(item)
+                    self.stopped.append(item)
+                    queue.task_done()
+                    continue
+                try:
+                    ok = await self.handler(item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"任务异常 {self.describe(item)}：{str(e)}", exc_info=True)
+                    ok = False
+
+                if ok:
+                    self.succeeded.append(item)
+                elif stopping():
+                    self.failed.append(item)
+                    self.stopped.append(item)
+                    # 正在退避等待的任务不必等到重新入队
+                    for task in list(requeues):
+                        task.cancel()
+                elif attempt < self.max_attempts and (self.retry_budget is None or self.retries < self.retry_budget):
+                    self.retries += 1
+                    delay = self._backoff(attempt)
+                    logger.warning(f"{self.describe(item)} 第 {attempt} 次尝试失败，{delay:.1f} 秒后重新入队")
+                    # 重新入队完成前不调用 task_done，保证 join 不会提前返回
+                    task = asyncio.create_task(requeue(item, attempt + 1, delay))
+                    requeues.add(task)
+                    task.add_done_callback(requeues.discard)
+                    continue
+                else:
+                    self.failed.append(item)
+                queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            for item in items:
+                await queue.put((item, 1))
+            await queue.join()
+        finally:
+            for task in workers + list(requeues):
+                task.cancel()
+            await asyncio.gather(*workers, *requeues, return_exceptions=True)
+        return self.succeeded, self.failed